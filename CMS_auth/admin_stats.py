@@ -0,0 +1,143 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from cache import cache
+from models import User, Course, Enrollment, EnrollmentDailyRollup
+
+EnrollmentStats = namedtuple('EnrollmentStats', 'total by_status unique_students')
+CourseStats = namedtuple('CourseStats', 'total active total_enrollments enrollment_counts')
+
+
+def filter_enrollments(query, student_query='', course_query='', status=''):
+    """Apply the admin enrollment page filters to a query over enrollments."""
+    if student_query:
+        query = query.join(User, User.id == Enrollment.student_id).filter(
+            (User.first_name.ilike(f'%{student_query}%')) |
+            (User.last_name.ilike(f'%{student_query}%')) |
+            (User.username.ilike(f'%{student_query}%'))
+        )
+
+    if course_query:
+        query = query.join(Course, Course.id == Enrollment.course_id).filter(
+            (Course.title.ilike(f'%{course_query}%')) |
+            (Course.code.ilike(f'%{course_query}%'))
+        )
+
+    if status:
+        query = query.filter(Enrollment.status == status)
+    return query
+
+
+def _cached(key, loader):
+    # Namespaced so every worker's copy can be dropped at once
+    return cache.get_or_set(f"{cache.namespace('admin_stats')}:{key}", loader,
+                            ttl=current_app.config.get('ADMIN_STATS_CACHE_TTL', 30))
+
+
+def enrollment_stats(student_query='', course_query='', status=''):
+    """Counts per status and unique students for the filtered enrollments."""
+    def load():
+        rows = filter_enrollments(
+            db.session.query(Enrollment.status, func.count(Enrollment.id)),
+            student_query, course_query, status
+        ).group_by(Enrollment.status).all()
+        by_status = {row_status: count for row_status, count in rows}
+        unique_students = filter_enrollments(
+            db.session.query(func.count(func.distinct(Enrollment.student_id))),
+            student_query, course_query, status
+        ).scalar()
+        return EnrollmentStats(sum(by_status.values()), by_status, unique_students or 0)
+
+    return _cached(f"enrollments:{student_query}:{course_query}:{status}", load)
+
+
+def course_stats():
+    """Course totals and per-course enrollment counts for the admin course page."""
+    def load():
+        active_counts = dict(db.session.query(Course.is_active, func.count(Course.id))
+                             .group_by(Course.is_active).all())
+        enrollment_counts = dict(db.session.query(Enrollment.course_id, func.count(Enrollment.id))
+                                 .group_by(Enrollment.course_id).all())
+        return CourseStats(
+            total=sum(active_counts.values()),
+            active=active_counts.get(True, 0),
+            total_enrollments=sum(enrollment_counts.values()),
+            enrollment_counts=enrollment_counts,
+        )
+
+    return _cached('courses', load)
+
+
+def _drop_rate(by_status):
+    total = sum(by_status.values())
+    return round(by_status.get('dropped', 0) / total, 4) if total else 0.0
+
+
+def enrollment_analytics(start, end):
+    """Enrollments per day, per course with drop rates, and instructor load.
+
+    Reads only enrollment_daily_rollup (joined to courses and users for
+    names), so the cost depends on days x courses, not on enrollment history.
+    Days are enrollment days; instructor load counts all active enrollments.
+    """
+    rollup = EnrollmentDailyRollup
+    in_range = (rollup.day >= start, rollup.day <= end)
+    total = func.sum(rollup.enrollment_count)
+
+    def load():
+        days = {start + timedelta(days=i): {} for i in range((end - start).days + 1)}
+        for day, status, count in db.session.query(rollup.day, rollup.status, total).filter(
+            *in_range
+        ).group_by(rollup.day, rollup.status):
+            days.setdefault(day, {})[status] = int(count)
+
+        courses = {}
+        for course_id, title, code, status, count in db.session.query(
+            rollup.course_id, Course.title, Course.code, rollup.status, total
+        ).join(Course, Course.id == rollup.course_id).filter(*in_range).group_by(
+            rollup.course_id, Course.title, Course.code, rollup.status
+        ):
+            course = courses.setdefault(course_id, {'course_id': course_id, 'title': title,
+                                                    'code': code, 'by_status': {}})
+            course['by_status'][status] = int(count)
+        for course in courses.values():
+            course['total'] = sum(course['by_status'].values())
+            course['drop_rate'] = _drop_rate(course['by_status'])
+
+        instructors = [
+            {'instructor_id': user_id, 'name': f"{first} {last}" if first and last else username,
+             'courses': course_count, 'active_enrollments': int(active or 0)}
+            for user_id, username, first, last, course_count, active in db.session.query(
+                User.id, User.username, User.first_name, User.last_name,
+                func.count(func.distinct(rollup.course_id)), total
+            ).join(Course, Course.id == rollup.course_id).join(
+                User, User.id == Course.instructor_id
+            ).filter(rollup.status == 'active').group_by(
+                User.id, User.username, User.first_name, User.last_name
+            ).order_by(total.desc())
+        ]
+
+        by_status = {}
+        for counts in days.values():
+            for status, count in counts.items():
+                by_status[status] = by_status.get(status, 0) + count
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'totals': {'total': sum(by_status.values()), 'by_status': by_status,
+                       'drop_rate': _drop_rate(by_status)},
+            'days': [{'day': day.isoformat(), 'total': sum(counts.values()), 'by_status': counts}
+                     for day, counts in sorted(days.items())],
+            'courses': sorted(courses.values(), key=lambda course: course['total'], reverse=True),
+            'instructors': instructors,
+        }
+
+    return _cached(f"analytics:{start}:{end}", load)
+
+
+def invalidate_admin_stats():
+    cache.invalidate_namespace('admin_stats')
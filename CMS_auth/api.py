@@ -0,0 +1,287 @@
+"""Versioned JSON API (/api/v1) for the mobile client.
+
+Every list endpoint takes ``fields=`` (comma separated) and only selects
+those columns, never whole ORM objects; ``limit=`` and an opaque ``cursor=``
+page through results by key instead of by offset. Responses are serialized
+with orjson when it is installed and gzip-compressed when the client
+accepts it.
+"""
+import base64
+import gzip
+import json
+from datetime import date, datetime
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import Blueprint, Response, abort, request
+from flask_login import current_user
+
+from app import db
+from course_bundle import get_course_page, COURSE_FIELDS
+from db_routing import read_replica
+from models import Course, Enrollment, CourseVideo
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is slower but equivalent
+    orjson = None
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# Smaller bodies are not worth the CPU to compress
+GZIP_MIN_BYTES = 1024
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), default=_default).encode()
+
+
+def json_response(payload, status=200):
+    """Serialize payload, gzip it if the client accepts that, and wrap it in a Response."""
+    body = dumps(payload)
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def error(status, message):
+    return json_response({'error': message}, status)
+
+
+def api_login_required(f):
+    """Like login_required, but answers 401 JSON instead of redirecting to the login page."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error(401, 'authentication required')
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@api_v1.errorhandler(404)
+def not_found(e):
+    return error(404, 'not found')
+
+
+class Resource:
+    """Columns a list endpoint exposes and the key its cursor pages on."""
+
+    def __init__(self, columns, default_fields, order_by):
+        self.columns = columns
+        self.default_fields = default_fields
+        # (column name, descending) pairs; must end with a unique column
+        self.order_by = order_by
+
+    def requested_fields(self):
+        """Parse ?fields=, rejecting unknown names."""
+        raw = request.args.get('fields')
+        if not raw:
+            return list(self.default_fields)
+        fields = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in self.columns]
+        if unknown:
+            abort(error(400, f"unknown fields: {', '.join(unknown)}; "
+                             f"available: {', '.join(self.columns)}"))
+        return fields
+
+    def page(self, *criteria):
+        """Run a column-only query for the requested fields and one page after the cursor."""
+        fields = self.requested_fields()
+        try:
+            limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            return error(400, 'limit must be an integer')
+
+        # The cursor needs the order key columns even when they were not asked for
+        key_names = [name for name, _ in self.order_by]
+        selected = fields + [name for name in key_names if name not in fields]
+        statement = sa.select(*(self.columns[name].label(name) for name in selected)).where(*criteria)
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            except ValueError:
+                after = None
+            after = self._cursor_values(after)
+            if after is None:
+                return error(400, 'invalid cursor')
+            statement = statement.where(self._after(after))
+        statement = statement.order_by(*(
+            self.columns[name].desc() if descending else self.columns[name].asc()
+            for name, descending in self.order_by
+        )).limit(limit + 1)
+
+        rows = db.session.execute(statement).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]._mapping
+            next_cursor = base64.urlsafe_b64encode(
+                dumps([last[name] for name in key_names])
+            ).decode()
+        return json_response({
+            'data': [{name: row._mapping[name] for name in fields} for row in rows],
+            'next_cursor': next_cursor,
+        })
+
+    def _cursor_values(self, values):
+        """Decoded cursor values typed like their key columns, or None if they do not fit."""
+        if not isinstance(values, list) or len(values) != len(self.order_by):
+            return None
+        typed = []
+        for (name, _), value in zip(self.order_by, values):
+            python_type = self.columns[name].type.python_type
+            try:
+                if python_type in (datetime, date) and isinstance(value, str):
+                    value = python_type.fromisoformat(value)
+            except ValueError:
+                return None
+            # bool is an int to Python, but never a valid key
+            if not isinstance(value, python_type) or isinstance(value, bool) and python_type is not bool:
+                return None
+            typed.append(value)
+        return typed
+
+    def _after(self, values):
+        # Rows strictly after the cursor in (key1, key2, ...) order
+        condition = None
+        for i in reversed(range(len(self.order_by))):
+            name, descending = self.order_by[i]
+            column = self.columns[name]
+            step = column < values[i] if descending else column > values[i]
+            if condition is not None:
+                step = sa.or_(step, sa.and_(column == values[i], condition))
+            condition = step
+        return condition
+
+
+enrollment_count = sa.select(sa.func.count(Enrollment.id)).where(
+    Enrollment.course_id == Course.id
+).correlate(Course).scalar_subquery()
+
+courses = Resource(
+    columns={
+        'id': Course.id, 'title': Course.title, 'description': Course.description,
+        'code': Course.code, 'instructor_id': Course.instructor_id,
+        'start_date': Course.start_date, 'end_date': Course.end_date,
+        'is_active': Course.is_active, 'max_students': Course.max_students,
+        'thumbnail_url': Course.thumbnail_url, 'created_at': Course.created_at,
+        'enrollment_count': enrollment_count,
+    },
+    default_fields=['id', 'title', 'code', 'instructor_id', 'is_active', 'thumbnail_url'],
+    order_by=[('id', True)],
+)
+
+videos = Resource(
+    columns={
+        'id': CourseVideo.id, 'course_id': CourseVideo.course_id, 'title': CourseVideo.title,
+        'video_type': CourseVideo.video_type, 'video_url': CourseVideo.video_url,
+        'description': CourseVideo.description, 'order': CourseVideo.order,
+    },
+    default_fields=['id', 'title', 'video_type', 'video_url', 'order'],
+    order_by=[('order', False), ('id', False)],
+)
+
+enrollments = Resource(
+    columns={
+        'id': Enrollment.id, 'course_id': Enrollment.course_id,
+        'student_id': Enrollment.student_id, 'status': Enrollment.status,
+        'enrolled_at': Enrollment.enrolled_at,
+    },
+    default_fields=['id', 'course_id', 'status', 'enrolled_at'],
+    order_by=[('id', True)],
+)
+
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'role',
+               'profile_image_url', 'created_at')
+
+
+@api_v1.route('/me')
+@api_login_required
+def me():
+    fields = request.args.get('fields')
+    names = [name.strip() for name in fields.split(',')] if fields else USER_FIELDS
+    unknown = [name for name in names if name not in USER_FIELDS]
+    if unknown:
+        return error(400, f"unknown fields: {', '.join(unknown)}")
+    # current_user is already loaded for this request; no query needed
+    return json_response({'data': {name: getattr(current_user, name) for name in names}})
+
+
+@api_v1.route('/courses')
+@api_login_required
+@read_replica
+def list_courses():
+    """Same filters as the course list page: search, instructor, status."""
+    criteria = []
+    search = request.args.get('search', '')
+    if search:
+        criteria.append(Course.title.ilike(f'%{search}%') | Course.code.ilike(f'%{search}%')
+                        | Course.description.ilike(f'%{search}%'))
+    instructor_id = request.args.get('instructor', '')
+    if instructor_id.isdigit():
+        criteria.append(Course.instructor_id == int(instructor_id))
+    status = request.args.get('status', 'active')
+    if status == 'active':
+        criteria.append(Course.is_active == True)
+    elif status == 'inactive':
+        criteria.append(Course.is_active == False)
+    return courses.page(*criteria)
+
+
+@api_v1.route('/courses/<int:course_id>')
+@api_login_required
+def get_course(course_id):
+    """Served from the cached course page, so usually without a query."""
+    fields = request.args.get('fields')
+    available = COURSE_FIELDS + ('enrollment_count',)
+    names = [name.strip() for name in fields.split(',')] if fields else available
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        return error(400, f"unknown fields: {', '.join(unknown)}")
+    course = get_course_page(course_id).course
+    return json_response({'data': {name: getattr(course, name) for name in names}})
+
+
+@api_v1.route('/courses/<int:course_id>/videos')
+@api_login_required
+@read_replica
+def list_course_videos(course_id):
+    get_course_page(course_id)  # 404 for unknown courses
+    return videos.page(CourseVideo.course_id == course_id)
+
+
+@api_v1.route('/enrollments')
+@api_login_required
+@read_replica
+def list_enrollments():
+    """Students see their own enrollments, instructors those in their courses, admins all."""
+    criteria = []
+    if current_user.is_student():
+        criteria.append(Enrollment.student_id == current_user.id)
+    elif current_user.is_instructor():
+        criteria.append(Enrollment.course_id.in_(
+            sa.select(Course.id).where(Course.instructor_id == current_user.id)
+        ))
+    course_id = request.args.get('course_id', '')
+    if course_id.isdigit():
+        criteria.append(Enrollment.course_id == int(course_id))
+    status = request.args.get('status')
+    if status:
+        criteria.append(Enrollment.status == status)
+    return enrollments.page(*criteria)
@@ -17,28 +17,44 @@ logging.basicConfig(
 )
 
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
+from db_routing import RoutingSession
 
 # Create a base class for declarative models
 class Base(DeclarativeBase):
     pass
 
-# Initialize SQLAlchemy with base class
-db = SQLAlchemy(model_class=Base)
+# Initialize SQLAlchemy with base class; reads can be routed to replicas
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 # Create the app
 app = Flask(__name__)
 app.config.from_object(Config)
+# Share compiled templates between workers and restarts (see warmup.py)
+os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_options = {**app.jinja_options,
+                     'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])}
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
 
 # Initialize database
 db.init_app(app)
 
+# SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked to
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if type(dbapi_connection).__module__ == 'sqlite3':
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 # Initialize Flask-Migrate
 migrate = Migrate(app, db)
 
@@ -63,3 +79,7 @@ with app.app_context():
 
 # Import routes
 from routes import *
+
+# JSON API for the mobile client
+from api import api_v1
+app.register_blueprint(api_v1)
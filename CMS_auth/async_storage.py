@@ -0,0 +1,177 @@
+import asyncio
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, has_request_context
+
+from storage import acquire, content_key, create_backend
+
+
+class AsyncStorage:
+    """Run storage calls on a dedicated I/O event loop instead of request threads.
+
+    Each operation is scheduled on a background asyncio loop and limited by a
+    semaphore, and the blocking backend call itself runs on a small private
+    thread pool, bounded by the backend client's own timeouts. Callers get a
+    concurrent.futures.Future back and can either wait on it or let it finish
+    in the background; every in-flight operation is tracked so shutdown can
+    drain them.
+    """
+
+    def __init__(self, backend_factory=None, on_upload_failure=None):
+        self.backend_factory = backend_factory
+        self.on_upload_failure = on_upload_failure
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._executor = None
+        self._semaphore = None
+        self._backend = None
+        self._pending = set()
+        self.failed = 0
+
+    def _start(self, app):
+        # Started lazily so each forked gunicorn worker gets its own loop thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.app = app
+            self.max_concurrency = app.config.get('STORAGE_MAX_CONCURRENCY', 8)
+            self.timeout = app.config.get('STORAGE_TIMEOUT', 15)
+            self.inject_delay = app.config.get('STORAGE_INJECT_DELAY', 0)
+            self._loop = asyncio.new_event_loop()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix='storage-io')
+            self._backend = None
+            self._pending = set()
+            thread = threading.Thread(target=self._loop.run_forever, name='storage-loop', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    @property
+    def backend(self):
+        # One backend (and client) per process
+        with self._lock:
+            if self._backend is None:
+                if self.backend_factory:
+                    self._backend = self.backend_factory()
+                else:
+                    self._backend = create_backend(current_app.config)
+            return self._backend
+
+    def _call(self, method, *args):
+        """Run a backend method on the I/O pool with an app context."""
+        with self.app.app_context():
+            if self.inject_delay:
+                # Simulated slow storage, for latency testing
+                time.sleep(self.inject_delay)
+            return getattr(self.backend, method)(*args)
+
+    async def _run(self, method, *args):
+        async with self._semaphore:
+            # No asyncio timeout: it would report a failure while the thread
+            # kept uploading; S3Storage's client times out the call itself
+            return await self._loop.run_in_executor(self._executor, self._call, method, *args)
+
+    def submit(self, method, *args):
+        """Schedule a backend method and return a Future for its result."""
+        self._start(current_app._get_current_object())
+        future = asyncio.run_coroutine_threadsafe(self._run(method, *args), self._loop)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return future
+
+    def _track(self, future, description, on_failure=None, succeeded=bool):
+        def done(future):
+            try:
+                ok = succeeded(future.result())
+            except Exception as e:
+                self.app.logger.error(f"Background storage {description} failed: {e!r}")
+                ok = False
+            if not ok:
+                self.failed += 1
+                if on_failure:
+                    # Keep database work off the event loop thread
+                    self._executor.submit(self._in_app_context, on_failure)
+        future.add_done_callback(done)
+        return future
+
+    def _in_app_context(self, fn):
+        with self.app.app_context():
+            try:
+                fn()
+            except Exception as e:
+                self.app.logger.error(f"Storage failure hook failed: {e!r}")
+
+    def upload(self, file, folder=''):
+        """Store a file under its content hash and return (url, future).
+
+        The reference is counted in the caller's transaction. Bytes that are
+        already stored are not uploaded again and the future is None;
+        otherwise the upload runs in the background. The file is read into
+        memory here because the request's upload stream is closed once the
+        response is sent.
+        """
+        if not file:
+            return None, None
+        data = file.read()
+        key = content_key(data, file.filename, folder)
+        url = self.backend.url_for(key)
+        if not acquire(key, len(data), file.content_type):
+            return url, None
+        future = self.submit('put', key, data, file.content_type)
+        if has_request_context():
+            # The request has not committed the URL yet; finish_request()
+            # watches the upload once it has
+            g.setdefault('_storage_uploads', []).append((future, url))
+        else:
+            self._watch_upload(future, url)
+        return url, future
+
+    def _watch_upload(self, future, url):
+        on_failure = None
+        if self.on_upload_failure:
+            on_failure = lambda: self.on_upload_failure(url)
+        self._track(future, f"upload of {url}", on_failure)
+
+    def finish_request(self, exc=None):
+        """Watch this request's uploads now that its transaction is over.
+
+        Registered with app.teardown_request, so a failed upload's cleanup
+        never runs before the request has committed the URL.
+        """
+        for future, url in g.pop('_storage_uploads', []):
+            self._watch_upload(future, url)
+
+    def delete(self, url):
+        """Start deleting a file and return the future without waiting."""
+        key = self.backend.key_for(url)
+        future = self.submit('delete_keys', [key] if key else [])
+        # delete_keys returns the keys that could not be deleted
+        return self._track(future, f"delete of {url}", succeeded=lambda failed: not failed)
+
+    def pending(self):
+        return len(self._pending)
+
+    def drain(self, timeout=None):
+        """Wait for in-flight operations, e.g. before the worker exits."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in list(self._pending):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                future.result(timeout=remaining)
+            except Exception:
+                pass
+
+
+storage = AsyncStorage()
+
+
+@atexit.register
+def _drain_on_exit():
+    if storage._pid == os.getpid():
+        storage.drain(timeout=storage.timeout)
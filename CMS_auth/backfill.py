@@ -0,0 +1,206 @@
+"""Online, batched data backfills for Alembic migrations.
+
+``flask db upgrade`` (run by build.sh on every deploy) executes a migration in
+one transaction, so an UPDATE over all of users or enrollments would lock
+those rows until the deploy finishes. These helpers run the data change
+outside that transaction in small committed batches, throttled and resumable,
+and split adding a required column into phases that never block writers:
+
+    from backfill import add_column, backfill, enforce_not_null
+
+    def upgrade():
+        # Phase 1: add the column nullable so old and new code both work
+        add_column('enrollments', sa.Column('progress', sa.Integer(), nullable=True))
+        # Phase 2: fill existing rows; a crashed deploy resumes where it stopped
+        backfill('enrollments', {'progress': 0}, where='progress IS NULL')
+
+    # Phase 3, in a later migration once the deployed code writes the column:
+    def upgrade():
+        backfill('enrollments', {'progress': 0}, where='progress IS NULL')
+        enforce_not_null('enrollments', 'progress', sa.Integer())
+"""
+import logging
+import time
+
+import sqlalchemy as sa
+from alembic import op
+from flask import current_app, has_app_context
+
+from db_routing import replica_lag
+
+logger = logging.getLogger('alembic.backfill')
+
+# Checkpoints of interrupted backfills; rows are removed when a backfill completes
+PROGRESS_TABLE = 'backfill_progress'
+
+_progress_metadata = sa.MetaData()
+progress_table = sa.Table(
+    PROGRESS_TABLE, _progress_metadata,
+    sa.Column('name', sa.String(200), primary_key=True),
+    sa.Column('last_key', sa.BigInteger, nullable=False),
+    sa.Column('rows_done', sa.BigInteger, nullable=False),
+    sa.Column('updated_at', sa.DateTime, nullable=False),
+)
+
+
+def add_column(table, column):
+    """Phase 1: add a nullable column, skipping it if it already exists."""
+    if not column.nullable:
+        raise ValueError(f"Add {table}.{column.name} as nullable and call enforce_not_null() "
+                         "after backfilling it")
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
+
+
+def backfill(table, values, where=None, key='id', batch_size=1000, pause=0.1,
+             max_batch_seconds=1.0, max_replica_lag=None, name=None):
+    """Phase 2: run ``UPDATE table SET values`` in committed batches of keys.
+
+    ``values`` maps column names to Python values or SQL expressions, e.g.
+    ``{'status': 'active'}`` or ``{'full_name': sa.text("first_name || ' ' || last_name")}``.
+    ``where`` (SQL text or a clause) should match only rows that still need the
+    change, so re-runs only touch what is left.
+
+    Batches walk the integer primary key in order. Each one commits on its
+    own, then sleeps ``pause`` seconds and waits for replicas to catch up.
+    The batch size halves when a batch takes longer than
+    ``max_batch_seconds`` and grows again when batches are fast. The last key
+    done is checkpointed in backfill_progress, so a retried deploy resumes
+    instead of starting over. Returns the number of rows updated.
+    """
+    name = name or f"{table}:{','.join(sorted(values))}"
+    target = sa.table(table, sa.column(key), *(sa.column(column) for column in values))
+    key_column = target.c[key]
+    condition = sa.text(where) if isinstance(where, str) else where
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        _progress_metadata.create_all(conn, checkfirst=True)
+        first_key = conn.execute(sa.select(sa.func.min(key_column))).scalar()
+        if first_key is None:
+            logger.info(f"Backfill {name}: {table} is empty")
+            return 0
+
+        checkpoint = conn.execute(
+            sa.select(progress_table.c.last_key, progress_table.c.rows_done)
+            .where(progress_table.c.name == name)
+        ).first()
+        last_key, rows_done = checkpoint if checkpoint else (first_key - 1, 0)
+        if checkpoint:
+            logger.info(f"Backfill {name}: resuming after {key} {last_key} ({rows_done} rows done)")
+
+        started = time.monotonic()
+        last_report = 0
+        while True:
+            # Rows inserted by the running app while we work are picked up too
+            max_key = conn.execute(sa.select(sa.func.max(key_column))).scalar()
+            if last_key >= max_key:
+                break
+            batch_end = conn.execute(
+                sa.select(key_column).where(key_column > last_key)
+                .order_by(key_column).offset(batch_size - 1).limit(1)
+            ).scalar()
+            if batch_end is None:
+                batch_end = max_key
+
+            statement = sa.update(target).where(key_column > last_key, key_column <= batch_end)
+            if condition is not None:
+                statement = statement.where(condition)
+            statement = statement.values(**values)
+
+            batch_started = time.monotonic()
+            rows_done += _execute_with_retry(conn, statement)
+            last_key = batch_end
+            _save_checkpoint(conn, name, last_key, rows_done)
+            elapsed = time.monotonic() - batch_started
+
+            if elapsed > max_batch_seconds and batch_size > 100:
+                batch_size //= 2
+            elif elapsed < max_batch_seconds / 4 and batch_size < 50000:
+                batch_size *= 2
+
+            now = time.monotonic()
+            if now - last_report >= 5:
+                last_report = now
+                done = (last_key - first_key + 1) / (max_key - first_key + 1)
+                rate = rows_done / max(now - started, 1e-9)
+                eta = (now - started) * (1 - done) / done if done else float('inf')
+                logger.info(f"Backfill {name}: {done:.0%} of key range, {rows_done} rows "
+                            f"({rate:,.0f} rows/s, ETA {eta:.0f}s, batch {batch_size})")
+
+            time.sleep(pause)
+            _wait_for_replicas(max_replica_lag)
+
+        conn.execute(sa.delete(progress_table).where(progress_table.c.name == name))
+        logger.info(f"Backfill {name}: done, {rows_done} rows in {time.monotonic() - started:.1f}s")
+        return rows_done
+
+
+def enforce_not_null(table, column, existing_type):
+    """Phase 3: make a backfilled column NOT NULL without a long table lock."""
+    bind = op.get_bind()
+    info = {c['name']: c for c in sa.inspect(bind).get_columns(table)}[column]
+    if not info['nullable']:
+        return
+    remaining = bind.execute(
+        sa.text(f"SELECT 1 FROM {table} WHERE {column} IS NULL LIMIT 1")
+    ).first()
+    if remaining:
+        raise RuntimeError(f"{table}.{column} still has NULLs; run backfill() first")
+
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        # A validated CHECK lets SET NOT NULL skip its full-table scan, and
+        # VALIDATE only takes a lock that allows reads and writes
+        constraint = f"{table}_{column}_not_null"
+        with op.get_context().autocommit_block():
+            op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} "
+                       f"CHECK ({column} IS NOT NULL) NOT VALID")
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}")
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+            op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {constraint}")
+    elif dialect == 'mysql':
+        column_type = existing_type.compile(dialect=bind.dialect)
+        op.execute(f"ALTER TABLE {table} MODIFY {column} {column_type} NOT NULL, "
+                   "ALGORITHM=INPLACE, LOCK=NONE")
+    else:
+        # SQLite rebuilds the table; it is only used for local development
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, existing_type=existing_type, nullable=False)
+
+
+def _execute_with_retry(conn, statement, attempts=3):
+    for attempt in range(1, attempts + 1):
+        try:
+            return conn.execute(statement).rowcount
+        except sa.exc.OperationalError as e:
+            # Deadlocks and lock timeouts are worth another try after a pause
+            if attempt == attempts:
+                raise
+            logger.warning(f"Backfill batch failed ({str(e).splitlines()[0]}), retrying")
+            time.sleep(attempt)
+
+
+def _save_checkpoint(conn, name, last_key, rows_done):
+    values = {'last_key': last_key, 'rows_done': rows_done, 'updated_at': sa.func.now()}
+    updated = conn.execute(
+        sa.update(progress_table).where(progress_table.c.name == name).values(**values)
+    ).rowcount
+    if not updated:
+        conn.execute(sa.insert(progress_table).values(name=name, **values))
+
+
+def _wait_for_replicas(max_lag=None):
+    """Pause while any read replica lags, so the backfill never outruns replication."""
+    if not has_app_context():
+        return
+    max_lag = max_lag if max_lag is not None else current_app.config.get('REPLICA_MAX_LAG_SECONDS', 2)
+    db = current_app.extensions['migrate'].db
+    replicas = [key for key in current_app.config.get('SQLALCHEMY_BINDS') or {}
+                if key.startswith('replica_')]
+    for key in replicas:
+        waited = 0
+        while replica_lag(db, key) > max_lag and waited < 300:
+            time.sleep(1)
+            waited += 1
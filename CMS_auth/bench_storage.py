@@ -0,0 +1,112 @@
+"""Request tail latency with synchronous vs background storage I/O.
+
+Simulates a gunicorn gthread worker (2 request threads) receiving uploads at
+a fixed rate while every storage call is delayed, and reports latency
+percentiles measured from each request's arrival to its response.
+
+    python bench_storage.py --delay 0.5 --rate 20 --requests 200
+"""
+import argparse
+import io
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--delay', type=float, default=0.5, help='Injected storage delay in seconds')
+parser.add_argument('--rate', type=float, default=20, help='Requests per second')
+parser.add_argument('--requests', type=int, default=200)
+parser.add_argument('--threads', type=int, default=2, help='Request threads per worker')
+parser.add_argument('--database-url', default='sqlite:///bench_storage.db',
+                    help='Scratch database for the stored object bookkeeping')
+args = parser.parse_args()
+
+# Must be set before the app (and its config) is imported
+os.environ['DATABASE_URL'] = args.database_url
+
+from werkzeug.datastructures import FileStorage
+
+from app import app, db
+from models import StoredObject
+from async_storage import AsyncStorage
+from storage import MemoryStorage, acquire, content_key
+
+
+class SlowStorage(MemoryStorage):
+    """In-memory backend whose calls take a fixed time, standing in for slow S3."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def put(self, key, data, content_type=None):
+        time.sleep(self.delay)
+        return super().put(key, data, content_type)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)] * 1000
+    return f"p50 {pick(0.50):7.1f} ms   p95 {pick(0.95):7.1f} ms   p99 {pick(0.99):7.1f} ms"
+
+
+def run(handle, args):
+    latencies = []
+    start = time.monotonic()
+
+    def request(arrival):
+        try:
+            with app.app_context():
+                handle()
+        except Exception as e:
+            print(f"request failed: {e!r}")
+        latencies.append(time.monotonic() - arrival)
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for i in range(args.requests):
+            arrival = start + i / args.rate
+            time.sleep(max(arrival - time.monotonic(), 0))
+            pool.submit(request, arrival)
+    return latencies
+
+
+def main():
+    counter = itertools.count()
+
+    def upload_file():
+        # Distinct bytes per request so deduplication does not skip the upload
+        data = b'x' * 1024 + str(next(counter)).encode()
+        return FileStorage(stream=io.BytesIO(data), filename='avatar.png', content_type='image/png')
+
+    backend = SlowStorage(args.delay)
+    storage = AsyncStorage(backend_factory=lambda: backend)
+
+    def synchronous():
+        file = upload_file()
+        data = file.read()
+        key = content_key(data, file.filename, 'profiles')
+        # Upload inside the request, before touching the database
+        backend.put(key, data, file.content_type)
+        acquire(key, len(data), file.content_type)
+        db.session.commit()
+
+    def background():
+        storage.upload(upload_file(), 'profiles')
+        db.session.commit()
+
+    with app.app_context():
+        StoredObject.query.delete()
+        db.session.commit()
+
+    sync = run(synchronous, args)
+    background = run(background, args)
+    storage.drain()
+
+    print(f"storage delay {args.delay * 1000:.0f} ms, {args.rate:g} req/s, {args.threads} threads")
+    print(f"synchronous: {percentiles(sync)}")
+    print(f"background:  {percentiles(background)}  ({storage.failed} failed, {len(backend.objects)} stored)")
+
+
+if __name__ == '__main__':
+    main()
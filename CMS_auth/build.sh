@@ -11,5 +11,8 @@ pip install -r requirements.txt
 # Run DB migrations if there are any
 flask db upgrade
 
+# Compile templates once so new workers load them from disk
+python warmup.py
+
 # Create upload directories
 mkdir -p static/uploads/profiles 
\ No newline at end of file
@@ -0,0 +1,334 @@
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Let one thread per key run a loader while the others wait for it."""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            lock, waiters = self._locks.get(key, (threading.Lock(), 0))
+            self._locks[key] = (lock, waiters + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, waiters = self._locks[key]
+                if waiters == 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, waiters - 1)
+
+
+class LocalCache:
+    """Thread-safe in-process cache with per-key expiry."""
+
+    def __init__(self, default_ttl=300, max_entries=10000):
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def get(self, key):
+        """Return the cached value, or None if it is missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            with self._lock:
+                self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                self._evict()
+            self._data[key] = (expires_at, value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value, calling loader() to fill it on a miss.
+
+        Concurrent misses for the same key wait for a single loader call.
+        """
+        value = self.get(key)
+        if value is None:
+            with self._flights.hold(key):
+                value = self.get(key)
+                if value is None:
+                    value = loader()
+                    if value is not None:
+                        self.set(key, value, ttl)
+        return value
+
+    def namespace(self, name):
+        """Return a key prefix that invalidate_namespace(name) retires."""
+        return f"{name}:{self._generations.get(name, 0)}"
+
+    def invalidate_namespace(self, name):
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        # Drop expired entries first, then the ones closest to expiring
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at < now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_entries:
+            for key, _ in sorted(self._data.items(), key=lambda item: item[1][0])[:len(self._data) // 10 + 1]:
+                del self._data[key]
+
+
+class CacheServerError(Exception):
+    pass
+
+
+def parse_cache_url(url):
+    """Split a cache URL into (scheme, address, db).
+
+    unix:///tmp/cms-cache.sock -> ('unix', '/tmp/cms-cache.sock', 0)
+    redis://127.0.0.1:6379/2   -> ('redis', ('127.0.0.1', 6379), 2)
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'unix':
+        return 'unix', parsed.path, 0
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.lstrip('/') or 0)
+        return 'redis', (parsed.hostname or '127.0.0.1', parsed.port or 6379), db
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+class RespConnection:
+    """One blocking connection speaking the Redis protocol."""
+
+    def __init__(self, url, timeout):
+        scheme, address, db = parse_cache_url(url)
+        family = socket.AF_UNIX if scheme == 'unix' else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile('rb')
+        if db:
+            self.execute('SELECT', db)
+
+    def execute(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('cache server closed the connection')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise CacheServerError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            return self.file.read(length + 2)[:-2]
+        if kind == b'*':
+            return [self._read_reply() for _ in range(int(rest))]
+        raise CacheServerError(f"Unexpected reply: {line!r}")
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class SharedCache:
+    """Cache shared by every worker on a host through a Redis-compatible server.
+
+    CACHE_URL can point at cache_server.py (started by gunicorn.conf.py) or at a
+    real Redis. Values are pickled, so only cache data the app produced itself.
+    A delete or namespace invalidation in one worker is seen by all of them.
+    When the server is unreachable the cache is skipped rather than failing
+    the request.
+    """
+
+    def __init__(self, url, default_ttl=300, key_prefix='cms:', lock_ttl=10, timeout=0.5):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.key_prefix = key_prefix
+        self.lock_ttl = lock_ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        self._flights = SingleFlight()
+
+    def _connection(self):
+        # Connections are per thread and must not survive a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = RespConnection(self.url, self.timeout)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _execute(self, *args):
+        """Run a command, reconnecting once if the connection went stale."""
+        for attempt in (1, 2):
+            try:
+                return self._connection().execute(*args)
+            except (OSError, ConnectionError):
+                conn = getattr(self._local, 'conn', None)
+                if conn is not None:
+                    conn.close()
+                self._local.conn = None
+                if attempt == 2:
+                    raise
+
+    def _key(self, key):
+        return f"{self.key_prefix}{key}"
+
+    def get(self, key):
+        """Return the cached value, or None if it is missing, expired or unreachable."""
+        try:
+            data = self._execute('GET', self._key(key))
+        except (OSError, CacheServerError) as e:
+            logger.warning(f"Cache get {key} failed: {e!r}")
+            return None
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            self._execute('SET', self._key(key), data, 'PX', int(ttl * 1000))
+        except (OSError, CacheServerError) as e:
+            logger.warning(f"Cache set {key} failed: {e!r}")
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self._execute('DEL', *(self._key(key) for key in keys))
+        except (OSError, CacheServerError) as e:
+            # The entries stay stale until their TTL runs out
+            logger.error(f"Cache delete {keys} failed: {e!r}")
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value, calling loader() to fill it on a miss.
+
+        Only one thread per worker and one worker per host runs the loader for
+        a missing key; the rest wait for its result instead of stampeding the
+        database.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._flights.hold(key):
+            value = self.get(key)
+            if value is not None:
+                return value
+            with self._fill_lock(key) as filled:
+                if filled is not None:
+                    return filled
+                value = loader()
+                if value is not None:
+                    self.set(key, value, ttl)
+            return value
+
+    @contextmanager
+    def _fill_lock(self, key):
+        """Hold the host-wide fill lock for key.
+
+        Yields the value if another worker filled the key while we waited,
+        otherwise None with the lock held. Gives up waiting after lock_ttl and
+        loads anyway, e.g. if the lock holder died.
+        """
+        lock_key = self._key(f"lock:{key}")
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ttl
+        delay = 0.005
+        try:
+            while not self._execute('SET', lock_key, token, 'NX', 'PX', int(self.lock_ttl * 1000)):
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+                value = self.get(key)
+                if value is not None:
+                    yield value
+                    return
+                if time.monotonic() > deadline:
+                    break
+        except (OSError, CacheServerError) as e:
+            logger.warning(f"Cache fill lock {key} failed: {e!r}")
+            yield None
+            return
+        try:
+            yield None
+        finally:
+            try:
+                # Not atomic, but the lock expires on its own if this races
+                if self._execute('GET', lock_key) == token.encode():
+                    self._execute('DEL', lock_key)
+            except (OSError, CacheServerError):
+                pass
+
+    def namespace(self, name):
+        """Return a key prefix that invalidate_namespace(name) retires on every worker."""
+        try:
+            generation = self._execute('GET', self._key(f"generation:{name}"))
+        except (OSError, CacheServerError) as e:
+            logger.warning(f"Cache namespace {name} failed: {e!r}")
+            # A fresh prefix nobody else uses, so nothing stale can be read
+            return f"{name}:nocache-{uuid.uuid4().hex}"
+        return f"{name}:{int(generation or 0)}"
+
+    def invalidate_namespace(self, name):
+        try:
+            self._execute('INCR', self._key(f"generation:{name}"))
+        except (OSError, CacheServerError) as e:
+            logger.error(f"Cache invalidate {name} failed: {e!r}")
+
+
+def create_cache(url, default_ttl=300):
+    """Build the cache named by CACHE_URL: 'local' or a unix:// / redis:// server."""
+    if not url or url == 'local':
+        return LocalCache(default_ttl)
+    parse_cache_url(url)
+    return SharedCache(url, default_ttl)
+
+
+# Shared by every thread in this worker, and by every worker when CACHE_URL is set
+cache = create_cache(Config.CACHE_URL, Config.CACHE_DEFAULT_TTL)
@@ -0,0 +1,242 @@
+"""Small Redis-compatible cache server shared by the gunicorn workers on a host.
+
+Speaks the subset of RESP that cache.SharedCache uses (GET, SET with EX/PX/NX,
+DEL, INCR, EXISTS, PING, DBSIZE, FLUSHDB), so CACHE_URL can later point at a
+real Redis without changing the app. gunicorn.conf.py starts it automatically;
+to run it by hand:
+
+    python cache_server.py --url unix:///tmp/cms-cache.sock
+"""
+import argparse
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+from cache import parse_cache_url
+
+
+class Store:
+    """Keys with optional expiry, evicting the soonest-expiring keys when full."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return entry[1] if entry else None
+
+    def set(self, key, value, ttl=None, nx=False):
+        with self._lock:
+            now = time.monotonic()
+            if nx and self._live(key, now):
+                return False
+            if len(self._data) >= self.max_entries and key not in self._data:
+                self._evict(now)
+            self._data[key] = (now + ttl if ttl else None, value)
+            return True
+
+    def delete(self, keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def exists(self, keys):
+        with self._lock:
+            now = time.monotonic()
+            return sum(1 for key in keys if self._live(key, now))
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            expires_at, value = entry if entry else (None, b'0')
+            value = str(int(value) + 1).encode()
+            self._data[key] = (expires_at, value)
+            return int(value)
+
+    def size(self):
+        with self._lock:
+            return len(self._data)
+
+    def flush(self):
+        with self._lock:
+            self._data.clear()
+
+    def purge_expired(self):
+        with self._lock:
+            now = time.monotonic()
+            expired = [key for key, (expires_at, _) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def _evict(self, now):
+        expired = [key for key, (expires_at, _) in self._data.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_entries:
+            # Keys without a TTL sort last
+            by_expiry = sorted(self._data.items(), key=lambda item: item[1][0] or float('inf'))
+            for key, _ in by_expiry[:len(self._data) // 10 + 1]:
+                del self._data[key]
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    """Serve one client connection until it disconnects."""
+
+    def handle(self):
+        while True:
+            try:
+                command = self.read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            try:
+                reply = self.execute(command)
+            except (ValueError, IndexError) as e:
+                reply = RespError(f"ERR {e}")
+            self.wfile.write(encode(reply))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command, e.g. from `nc` or redis-cli in inline mode
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline()
+            if not header.startswith(b'$'):
+                raise ValueError('expected bulk string')
+            length = int(header[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def execute(self, args):
+        store = self.server.store
+        name = args[0].upper()
+        if name == b'GET':
+            return store.get(args[1])
+        if name == b'SET':
+            ttl, nx = None, False
+            options = [arg.upper() for arg in args[3:]]
+            for i, option in enumerate(options):
+                if option == b'EX':
+                    ttl = int(options[i + 1])
+                elif option == b'PX':
+                    ttl = int(options[i + 1]) / 1000
+                elif option == b'NX':
+                    nx = True
+            return RespOk() if store.set(args[1], args[2], ttl, nx) else None
+        if name == b'DEL':
+            return store.delete(args[1:])
+        if name == b'EXISTS':
+            return store.exists(args[1:])
+        if name == b'INCR':
+            return store.incr(args[1])
+        if name == b'PING':
+            return RespOk('PONG')
+        if name == b'DBSIZE':
+            return store.size()
+        if name == b'FLUSHDB':
+            store.flush()
+            return RespOk()
+        if name == b'SELECT':
+            return RespOk() if args[1] == b'0' else RespError('ERR only database 0 is supported')
+        return RespError(f"ERR unknown command '{name.decode(errors='replace')}'")
+
+
+class RespOk(str):
+    def __new__(cls, text='OK'):
+        return super().__new__(cls, text)
+
+
+class RespError(str):
+    pass
+
+
+def encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, RespError):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, RespOk):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def create_server(url, max_entries=100000):
+    """Bind a server for a unix:// or redis://host:port URL."""
+    scheme, address, _ = parse_cache_url(url)
+    if scheme == 'unix':
+        if os.path.exists(address):
+            os.remove(address)
+        server = ThreadingUnixServer(address, RespHandler)
+        os.chmod(address, 0o600)
+    else:
+        server = ThreadingTCPServer(address, RespHandler)
+    server.store = Store(max_entries)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the shared cache server')
+    parser.add_argument('--url', default=os.environ.get('CACHE_URL', 'unix:///tmp/cms-cache.sock'),
+                        help='unix:///path/to.sock or redis://127.0.0.1:6390')
+    parser.add_argument('--max-entries', type=int, default=100000)
+    parser.add_argument('--purge-interval', type=float, default=30,
+                        help='Seconds between sweeps for expired keys')
+    args = parser.parse_args()
+
+    server = create_server(args.url, args.max_entries)
+
+    def purge():
+        while True:
+            time.sleep(args.purge_interval)
+            server.store.purge_expired()
+
+    threading.Thread(target=purge, name='cache-purge', daemon=True).start()
+    # gunicorn stops the server with SIGTERM; exit cleanly so the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Cache server listening on {args.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(server, ThreadingUnixServer):
+            os.remove(server.server_address)
+
+
+if __name__ == '__main__':
+    main()
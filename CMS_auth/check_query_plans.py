@@ -0,0 +1,152 @@
+"""Query-plan regression check for the hot route queries.
+
+Seeds a throwaway database with large tables, runs EXPLAIN on the queries
+issued by the routes in routes.py and exits non-zero if any of them falls
+back to a sequential scan over a seeded table.
+
+    python check_query_plans.py --database-url sqlite:///query_plan_check.db
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description='Check route queries for sequential scans')
+parser.add_argument('--database-url', default='sqlite:///query_plan_check.db',
+                    help='Scratch database; its tables are dropped and re-seeded')
+parser.add_argument('--scale', type=int, default=1, help='Multiplier for the seeded row counts')
+args = parser.parse_args()
+
+# Must be set before the app (and its config) is imported
+os.environ['DATABASE_URL'] = args.database_url
+
+from sqlalchemy import select, func, insert, text
+
+from app import app, db
+from models import User, Course, Enrollment, CourseVideo, Role
+
+N_USERS = 20000 * args.scale
+N_COURSES = 4000 * args.scale
+N_ENROLLMENTS_PER_STUDENT = 5
+N_VIDEOS_PER_COURSE = 5
+
+
+def seed():
+    db.drop_all()
+    db.create_all()
+
+    now = datetime.utcnow()
+    roles = [Role.STUDENT] * 18 + [Role.INSTRUCTOR, Role.ADMIN]
+    db.session.execute(insert(User), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+         'password_hash': 'x', 'role': roles[i % len(roles)],
+         'created_at': now - timedelta(minutes=i)}
+        for i in range(1, N_USERS + 1)
+    ])
+    instructors = [i for i in range(1, N_USERS + 1) if roles[i % len(roles)] == Role.INSTRUCTOR]
+    db.session.execute(insert(Course), [
+        {'id': i, 'title': f'Course {i}', 'code': f'C{i}',
+         'instructor_id': instructors[i % len(instructors)],
+         'is_active': i % 10 == 0, 'created_at': now - timedelta(hours=i)}
+        for i in range(1, N_COURSES + 1)
+    ])
+    statuses = ['active', 'active', 'completed', 'dropped']
+    db.session.execute(insert(Enrollment), [
+        {'student_id': student, 'course_id': (student * 7 + k * 13) % N_COURSES + 1,
+         'status': statuses[(student + k) % len(statuses)]}
+        for student in range(1, N_USERS + 1) if roles[student % len(roles)] == Role.STUDENT
+        for k in range(N_ENROLLMENTS_PER_STUDENT)
+    ])
+    db.session.execute(insert(CourseVideo), [
+        {'course_id': course, 'title': f'Video {k}', 'video_type': 'youtube',
+         'video_url': f'https://youtu.be/{course}-{k}', 'order': k}
+        for course in range(1, N_COURSES + 1)
+        for k in range(N_VIDEOS_PER_COURSE)
+    ])
+    db.session.commit()
+
+    # Refresh planner statistics for the freshly seeded tables. SQLite is
+    # skipped: sqlite_stat1 only keeps the average rows per key, which makes
+    # skewed low-cardinality columns such as users.role look unselective.
+    if db.engine.dialect.name == 'mysql':
+        db.session.execute(text('ANALYZE TABLE users, courses, enrollments, course_videos'))
+    elif db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def route_queries():
+    """The filtered/sorted queries issued by routes.py, keyed by route."""
+    student_id, instructor_id, course_id = 1, 19, 42
+    return {
+        'index: active course count': select(func.count()).select_from(Course).where(Course.is_active == True),
+        'dashboard: recent users': select(User).order_by(User.created_at.desc()).limit(5),
+        'dashboard: instructor courses': select(Course).where(Course.instructor_id == instructor_id),
+        'dashboard: student enrollments': select(Enrollment).where(Enrollment.student_id == student_id),
+        'dashboard: student active enrollments': select(Enrollment).where(
+            Enrollment.student_id == student_id, Enrollment.status == 'active'),
+        'dashboard: available courses': select(Course).where(
+            Course.is_active == True, ~Course.id.in_([1, 2, 3])),
+        'courses_index: instructors': select(User).where(User.role.in_([Role.INSTRUCTOR, Role.ADMIN])),
+        'courses_index: by instructor': select(Course).where(
+            Course.instructor_id == instructor_id, Course.is_active == True),
+        'view_course: enrollment count': select(func.count()).select_from(Enrollment).where(
+            Enrollment.course_id == course_id),
+        'view_course: videos': select(CourseVideo).where(
+            CourseVideo.course_id == course_id).order_by(CourseVideo.order),
+        'delete_course: enrollments': select(Enrollment.id).where(Enrollment.course_id == course_id),
+    }
+
+
+def explain(statement):
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        return [row[-1] for row in rows]
+    if dialect == 'postgresql':
+        return [row[0] for row in db.session.execute(text(f'EXPLAIN {sql}')).all()]
+    if dialect == 'mysql':
+        rows = db.session.execute(text(f'EXPLAIN {sql}')).mappings().all()
+        return [f"{row['table']} type={row['type']} key={row['key']}" for row in rows]
+    raise SystemExit(f"EXPLAIN is not supported for {dialect}")
+
+
+def sequential_scans(plan, tables):
+    """Return plan lines that read a whole seeded table without an index."""
+    scans = []
+    for line in plan:
+        if db.engine.dialect.name == 'sqlite':
+            # "SCAN users" is a table scan; "SCAN users USING INDEX ..." is not
+            if line.startswith('SCAN ') and 'USING' not in line and line.split()[1] in tables:
+                scans.append(line)
+        elif db.engine.dialect.name == 'postgresql':
+            if 'Seq Scan on' in line and line.split('Seq Scan on')[1].split()[0] in tables:
+                scans.append(line.strip())
+        elif 'type=ALL' in line and line.split()[0] in tables:
+            scans.append(line)
+    return scans
+
+
+def main():
+    tables = {'users', 'courses', 'enrollments', 'course_videos'}
+    with app.app_context():
+        print(f"Seeding {db.engine.url.render_as_string()} ...")
+        seed()
+
+        failures = 0
+        for name, statement in route_queries().items():
+            plan = explain(statement)
+            scans = sequential_scans(plan, tables)
+            status = 'FAIL' if scans else 'ok'
+            print(f"[{status}] {name}")
+            for line in plan:
+                print(f"       {line}")
+            failures += bool(scans)
+
+        print(f"\n{failures} of {len(route_queries())} queries use a sequential scan")
+        return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
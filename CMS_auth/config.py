@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from db_routing import replica_binds
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,6 +19,14 @@ class Config:
         "pool_pre_ping": True,
     }
     
+    # Read replicas (comma separated URLs) used by read-only routes
+    SQLALCHEMY_BINDS = replica_binds(
+        [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    )
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))  # read own writes from the primary
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 2))
+    REPLICA_LAG_CHECK_INTERVAL = int(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+    
     # Flask-WTF
     WTF_CSRF_ENABLED = True
     WTF_CSRF_SECRET_KEY = os.environ.get('WTF_CSRF_SECRET_KEY', 'csrf_development_key')
@@ -28,11 +37,38 @@ class Config:
     AWS_BUCKET_NAME = os.environ.get('AWS_BUCKET_NAME')
     AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
     
+    # Where uploaded images are stored: 's3', 'local' (UPLOAD_FOLDER) or 'memory'
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3')
+    
+    # Background storage I/O (see async_storage.py)
+    STORAGE_MAX_CONCURRENCY = int(os.environ.get('STORAGE_MAX_CONCURRENCY', 8))
+    STORAGE_TIMEOUT = float(os.environ.get('STORAGE_TIMEOUT', 15))  # seconds per S3 call
+    STORAGE_INJECT_DELAY = float(os.environ.get('STORAGE_INJECT_DELAY', 0))  # testing only
+    
     # Upload settings
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
     
+    # Compiled Jinja templates, filled by `python warmup.py` at build time
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or os.path.join(
+        os.path.abspath(os.path.dirname(__file__)), '.jinja_cache')
+    
+    # Seconds a cached course page bundle stays fresh without an invalidation
+    COURSE_CACHE_TTL = int(os.environ.get('COURSE_CACHE_TTL', 300))
+    
+    # Seconds the admin statistics panels may lag behind the data
+    ADMIN_STATS_CACHE_TTL = int(os.environ.get('ADMIN_STATS_CACHE_TTL', 30))
+    
+    # Video progress heartbeats are buffered and written in batches (see video_progress.py)
+    VIDEO_PROGRESS_FLUSH_INTERVAL = float(os.environ.get('VIDEO_PROGRESS_FLUSH_INTERVAL', 10))
+    VIDEO_PROGRESS_MAX_BUFFER = int(os.environ.get('VIDEO_PROGRESS_MAX_BUFFER', 20000))
+    
+    # Cache shared by the gunicorn workers (see cache.py): 'local' keeps a
+    # separate cache per process, unix:///path or redis://host:port/db share one
+    CACHE_URL = os.environ.get('CACHE_URL', 'local')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
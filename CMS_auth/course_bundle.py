@@ -0,0 +1,105 @@
+from collections import namedtuple
+
+from flask import abort, current_app
+from sqlalchemy import select, func
+
+from app import db
+from cache import cache
+from db_routing import use_primary
+from models import User, Course, Enrollment, CourseVideo
+
+COURSE_FIELDS = ('id', 'title', 'description', 'instructor_id', 'code', 'created_at', 'updated_at',
+                 'start_date', 'end_date', 'is_active', 'max_students', 'thumbnail_url')
+INSTRUCTOR_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'profile_image_url')
+VIDEO_FIELDS = ('id', 'title', 'video_type', 'video_url', 'description', 'order')
+
+
+class CourseSnapshot(namedtuple('CourseSnapshot', COURSE_FIELDS + ('enrollment_count',))):
+    """Read-only copy of a Course row for rendering."""
+    __slots__ = ()
+
+    def get_enrollment_count(self):
+        return self.enrollment_count
+
+    def is_full(self):
+        return self.enrollment_count >= self.max_students
+
+
+class InstructorSnapshot(namedtuple('InstructorSnapshot', INSTRUCTOR_FIELDS)):
+    """Read-only copy of the course instructor's public profile."""
+    __slots__ = ()
+
+    def get_full_name(self):
+        if self.first_name and self.last_name:
+            return f"{self.first_name} {self.last_name}"
+        return self.username
+
+
+VideoSnapshot = namedtuple('VideoSnapshot', VIDEO_FIELDS)
+
+# Everything on the course page that is the same for every viewer
+CoursePage = namedtuple('CoursePage', 'course instructor videos enrollment_count')
+
+
+def _cache_key(course_id):
+    return f'course_page:{course_id}'
+
+
+def load_course_page(course_id):
+    """Load the course, instructor, ordered videos and enrollment count in one query."""
+    enrollment_count = select(func.count(Enrollment.id)).where(
+        Enrollment.course_id == Course.id
+    ).scalar_subquery()
+
+    columns = (
+        [getattr(Course, name).label(f'course_{name}') for name in COURSE_FIELDS]
+        + [getattr(User, name).label(f'instructor_{name}') for name in INSTRUCTOR_FIELDS]
+        + [getattr(CourseVideo, name).label(f'video_{name}') for name in VIDEO_FIELDS]
+        + [enrollment_count.label('enrollment_count')]
+    )
+    statement = select(*columns).join(
+        User, User.id == Course.instructor_id
+    ).outerjoin(
+        CourseVideo, CourseVideo.course_id == Course.id
+    ).where(
+        Course.id == course_id
+    ).order_by(
+        CourseVideo.order, CourseVideo.id
+    )
+
+    # Cached for every viewer, so never fill it from a lagging replica
+    with use_primary():
+        rows = db.session.execute(statement).mappings().all()
+    if not rows:
+        return None
+
+    first = rows[0]
+    count = first['enrollment_count']
+    return CoursePage(
+        course=CourseSnapshot(*(first[f'course_{name}'] for name in COURSE_FIELDS), count),
+        instructor=InstructorSnapshot(*(first[f'instructor_{name}'] for name in INSTRUCTOR_FIELDS)),
+        videos=tuple(
+            VideoSnapshot(*(row[f'video_{name}'] for name in VIDEO_FIELDS))
+            for row in rows if row['video_id'] is not None
+        ),
+        enrollment_count=count,
+    )
+
+
+def get_course_page(course_id):
+    """Return the cached CoursePage for a course, or abort with 404."""
+    page = cache.get_or_set(_cache_key(course_id), lambda: load_course_page(course_id),
+                            ttl=current_app.config.get('COURSE_CACHE_TTL', 300))
+    if page is None:
+        abort(404)
+    return page
+
+
+def invalidate_course_page(*course_ids):
+    cache.delete(*(_cache_key(course_id) for course_id in course_ids))
+
+
+def invalidate_instructor_courses(user_id):
+    """Drop cached pages showing this user as instructor, e.g. after a profile edit."""
+    course_ids = [row[0] for row in db.session.query(Course.id).filter(Course.instructor_id == user_id)]
+    invalidate_course_page(*course_ids)
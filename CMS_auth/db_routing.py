@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+# Flask session key holding the time until which reads must use the primary
+STICKY_KEY = '_primary_until'
+
+# Cached replication lag per replica bind: {bind_key: (checked_at, lag_seconds)}
+_replica_lag = {}
+_replica_lag_lock = threading.Lock()
+
+
+def replica_binds(urls):
+    """Build SQLALCHEMY_BINDS entries for a list of replica URLs."""
+    binds = {}
+    for i, url in enumerate(urls):
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        binds[f'replica_{i}'] = url
+    return binds
+
+
+def _replica_keys():
+    return [key for key in current_app.config.get('SQLALCHEMY_BINDS') or {}
+            if key.startswith('replica_')]
+
+
+def _measure_lag(engine):
+    """Return the replica's replication lag in seconds."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            lag = conn.execute(sa.text(
+                "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+            )).scalar()
+            return float(lag or 0)
+        if engine.dialect.name == 'mysql':
+            row = conn.execute(sa.text("SHOW REPLICA STATUS")).mappings().first()
+            if row is None or row.get('Seconds_Behind_Source') is None:
+                return float('inf')
+            return float(row['Seconds_Behind_Source'])
+        # Other backends have no replication to measure
+        conn.execute(sa.text("SELECT 1"))
+        return 0.0
+
+
+def replica_lag(db, key):
+    """Return the cached lag for a replica, re-checking it when stale."""
+    interval = current_app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    cached = _replica_lag.get(key)
+    if cached and now - cached[0] < interval:
+        return cached[1]
+
+    with _replica_lag_lock:
+        cached = _replica_lag.get(key)
+        if cached and now - cached[0] < interval:
+            return cached[1]
+        try:
+            lag = _measure_lag(db.engines[key])
+        except Exception as e:
+            current_app.logger.warning(f"Replica {key} lag check failed: {str(e)}")
+            lag = float('inf')
+        _replica_lag[key] = (now, lag)
+        return lag
+
+
+def choose_replica(db, pinned=None):
+    """Pick a healthy replica bind key, keeping pinned while it stays healthy.
+
+    Returns None to fall back to the primary.
+    """
+    max_lag = current_app.config.get('REPLICA_MAX_LAG_SECONDS', 2)
+    if pinned is not None and replica_lag(db, pinned) <= max_lag:
+        return pinned
+    healthy = [key for key in _replica_keys() if replica_lag(db, key) <= max_lag]
+    if not healthy:
+        return None
+    return random.choice(healthy)
+
+
+def _sticky_to_primary():
+    return has_request_context() and session.get(STICKY_KEY, 0) > time.time()
+
+
+def _is_write(clause):
+    if clause is None:
+        return False
+    return getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica when the current route allows it.
+
+    Writes, flushes, ``SELECT ... FOR UPDATE`` and any read after this session
+    (or the user's recent requests) wrote something always use the primary.
+    The replica is picked once per session (i.e. per request) and reused, so
+    one page's reads see a single replica's state.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and has_app_context()
+            and g.get('db_route') == 'replica'
+            and not self._flushing
+            and not self.info.get('wrote')
+            and not _is_write(clause)
+            and not _sticky_to_primary()
+        ):
+            key = choose_replica(self._db, self.info.get('replica'))
+            if key is not None:
+                self.info['replica'] = key
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@sa.event.listens_for(RoutingSession, 'after_commit')
+def _stick_after_write(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        window = current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+        session[STICKY_KEY] = time.time() + window
+
+
+@sa.event.listens_for(RoutingSession, 'after_rollback')
+def _clear_written(db_session):
+    db_session.info.pop('wrote', None)
+
+
+@contextmanager
+def use_route(route):
+    """Route reads inside the block to 'replica' or 'primary'."""
+    previous = g.get('db_route')
+    g.db_route = route
+    try:
+        yield
+    finally:
+        g.db_route = previous
+
+
+def use_replica():
+    return use_route('replica')
+
+
+def use_primary():
+    return use_route('primary')
+
+
+def read_replica(f):
+    """Decorator that lets a read-only route query a read replica."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with use_replica():
+            return f(*args, **kwargs)
+    return decorated_function
@@ -1,4 +1,13 @@
 import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
 
 # Gunicorn configuration for Render deployment
 bind = "0.0.0.0:10000"  # Render will set PORT env var, this is a fallback
@@ -10,4 +19,47 @@ timeout = 30
 keepalive = 2
 accesslog = "-"  # Log to stdout for Render logging
 errorlog = "-"   # Log to stderr for Render logging
-loglevel = "info" 
\ No newline at end of file
+loglevel = "info"
+
+
+def on_starting(server):
+    """Start the shared cache server (cache_server.py) unless CACHE_URL is set.
+
+    Workers are forked from this process, so they inherit CACHE_URL.
+    """
+    if os.environ.get('CACHE_URL'):
+        return
+    socket_path = os.path.join(tempfile.gettempdir(), f"cms-cache-{os.getpid()}.sock")
+    url = f"unix://{socket_path}"
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_server.py')
+    server.cache_server = subprocess.Popen([sys.executable, script, '--url', url])
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        if server.cache_server.poll() is not None or time.monotonic() > deadline:
+            server.log.error("Cache server did not start; workers use per-process caches")
+            return
+        time.sleep(0.05)
+    os.environ['CACHE_URL'] = url
+    server.log.info(f"Shared cache server listening on {url}")
+
+
+def on_exit(server):
+    process = getattr(server, 'cache_server', None)
+    if process is not None:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            server.log.warning("Cache server did not stop; killing it")
+            process.kill()
+            process.wait()
+
+
+def post_worker_init(worker):
+    """Compile and render key templates and connect to the database before
+    the worker accepts requests (post_fork runs before the app is imported)."""
+    try:
+        from warmup import warm_up
+        warm_up()
+    except Exception as e:
+        worker.log.warning(f"Worker warm-up failed: {e!r}")
@@ -1,63 +1,308 @@
+import argparse
+import json
+import mimetypes
 import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from sqlalchemy import update
+from werkzeug.datastructures import FileStorage
+
 from app import app, db
 from models import User, Course
 from s3_utils import S3Handler
-from flask import current_app
 
-def migrate_profile_images():
-    """Migrate user profile images to S3"""
-    with app.app_context():
-        s3 = S3Handler()
-        users = User.query.filter(User.profile_image_url.isnot(None)).all()
-        
-        for user in users:
-            if user.profile_image_url and not user.profile_image_url.startswith('https://'):
-                try:
-                    # Get local file path
-                    local_path = os.path.join(app.config['UPLOAD_FOLDER'], 'profiles', 
-                                            os.path.basename(user.profile_image_url))
-                    
-                    if os.path.exists(local_path):
-                        # Upload to S3
-                        with open(local_path, 'rb') as file:
-                            s3_url = s3.upload_file(file, folder='profiles')
-                            if s3_url:
-                                user.profile_image_url = s3_url
-                                db.session.commit()
-                                print(f"Migrated profile image for user {user.username}")
-                            else:
-                                print(f"Failed to upload profile image for user {user.username}")
-                except Exception as e:
-                    print(f"Error migrating profile image for user {user.username}: {str(e)}")
-
-def migrate_course_thumbnails():
-    """Migrate course thumbnails to S3"""
+# upload folder: (model, url column) for every kind of file we migrate
+MIGRATION_TARGETS = {
+    'profiles': (User, 'profile_image_url'),
+    'thumbnails': (Course, 'thumbnail_url'),
+}
+
+
+class LocalFolderSource:
+    """Resolve rows with a local image URL to files in the upload folder."""
+
+    def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
+
+    def path_for(self, folder, url):
+        return os.path.join(self.upload_folder, folder, os.path.basename(url))
+
+    def open(self, folder, url):
+        path = self.path_for(folder, url)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        return FileStorage(stream=open(path, 'rb'), filename=os.path.basename(path),
+                           content_type=content_type)
+
+
+class S3Destination:
+    """Upload files to the configured S3 bucket with a single shared client."""
+
+    def __init__(self):
+        # boto3 clients are thread-safe, so one handler (and one head_bucket)
+        # is shared by every upload thread
+        self.s3 = S3Handler()
+
+    def put(self, file, folder):
+        return self.s3.upload_file(file, folder=folder)
+
+
+class LocalDestination:
+    """Copy files into a local directory; a stand-in for S3 when benchmarking."""
+
+    def __init__(self, root, base_url=None, delay=0.0):
+        self.root = root
+        self.base_url = base_url or f"file://{os.path.abspath(root)}"
+        self.delay = delay
+
+    def put(self, file, folder):
+        target_dir = os.path.join(self.root, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        if self.delay:
+            # Simulate network latency to S3
+            time.sleep(self.delay)
+        with open(os.path.join(target_dir, file.filename), 'wb') as out:
+            shutil.copyfileobj(file.stream, out)
+        return f"{self.base_url}/{folder}/{file.filename}"
+
+
+class Checkpoint:
+    """Append-only record of finished uploads so an interrupted run can resume.
+
+    Each line stores the uploaded URL, so rows that were uploaded but not yet
+    committed before a crash are written on the next run without re-uploading.
+    Entries are keyed by the local URL they replaced as well as the row, so a
+    row that got a new local image since is uploaded again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Ignore a partially written last line
+                        continue
+                    if 'source' in entry:
+                        self.done[(entry['folder'], entry['id'], entry['source'])] = entry['url']
+
+    def get(self, folder, row_id, source):
+        return self.done.get((folder, row_id, source))
+
+    def record(self, folder, row_id, source, url):
+        with self._lock:
+            self.done[(folder, row_id, source)] = url
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps({'folder': folder, 'id': row_id, 'source': source, 'url': url}) + '\n')
+
+    def clear(self):
+        """Forget every entry once a run has committed them all."""
+        with self._lock:
+            self.done.clear()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class Progress:
+    """Track files and bytes migrated and print throughput and ETA."""
+
+    def __init__(self, total_files, total_bytes, interval=5.0):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def add(self, size):
+        self.files += 1
+        self.bytes += size
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.bytes / elapsed
+        remaining = self.total_bytes - self.bytes
+        eta = remaining / rate if rate else float('inf')
+        print(f"{self.files}/{self.total_files} files, "
+              f"{self.bytes / 1e6:.1f}/{self.total_bytes / 1e6:.1f} MB, "
+              f"{self.files / elapsed:.1f} files/s, {rate / 1e6:.2f} MB/s, "
+              f"ETA {eta:.0f}s, {self.failed} failed")
+
+
+class MigrationEngine:
+    """Upload local images with a bounded thread pool and commit in batches.
+
+    With commit=False the URL updates are still executed, batch by batch, but
+    rolled back at the end, so a benchmark run leaves the database untouched.
+    """
+
+    def __init__(self, source, destination, checkpoint, workers=8, batch_size=100, commit=True):
+        self.source = source
+        self.destination = destination
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.batch_size = batch_size
+        self.commit = commit
+
+    def pending_rows(self, folder):
+        """Return (id, url) for rows still pointing at a local file."""
+        model, column = MIGRATION_TARGETS[folder]
+        url_column = getattr(model, column)
+        return db.session.query(model.id, url_column).filter(
+            url_column.isnot(None),
+            ~url_column.startswith('https://')
+        ).all()
+
+    def plan(self, folders):
+        """Collect the work to do, skipping rows whose file is missing."""
+        tasks = []
+        missing = 0
+        for folder in folders:
+            for row_id, url in self.pending_rows(folder):
+                path = self.source.path_for(folder, url)
+                if not os.path.exists(path):
+                    missing += 1
+                    continue
+                tasks.append((folder, row_id, url, os.path.getsize(path)))
+        return tasks, missing
+
+    def _upload(self, folder, row_id, url):
+        with app.app_context():
+            file = self.source.open(folder, url)
+            try:
+                new_url = self.destination.put(file, folder)
+            finally:
+                file.close()
+        if new_url:
+            self.checkpoint.record(folder, row_id, url, new_url)
+        return new_url
+
+    def _flush(self, updates):
+        for folder, rows in updates.items():
+            if rows:
+                model, column = MIGRATION_TARGETS[folder]
+                db.session.execute(update(model), [{'id': row_id, column: url} for row_id, url in rows])
+                rows.clear()
+        if self.commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+
+    def run(self, tasks):
+        progress = Progress(len(tasks), sum(task[3] for task in tasks))
+        updates = {folder: [] for folder in MIGRATION_TARGETS}
+        buffered = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = {}
+            queue = iter(tasks)
+            exhausted = False
+
+            while in_flight or not exhausted:
+                # Keep a bounded number of uploads in flight
+                while not exhausted and len(in_flight) < self.workers * 2:
+                    task = next(queue, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    folder, row_id, url, size = task
+                    resumed = self.checkpoint.get(folder, row_id, url)
+                    if resumed:
+                        updates[folder].append((row_id, resumed))
+                        buffered += 1
+                        progress.add(size)
+                        continue
+                    in_flight[pool.submit(self._upload, folder, row_id, url)] = task
+
+                if not in_flight:
+                    continue
+
+                finished, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    folder, row_id, url, size = in_flight.pop(future)
+                    try:
+                        new_url = future.result()
+                    except Exception as e:
+                        new_url = None
+                        print(f"Error migrating {folder} file for row {row_id}: {str(e)}")
+                    if new_url:
+                        updates[folder].append((row_id, new_url))
+                        buffered += 1
+                        progress.add(size)
+                    else:
+                        progress.failed += 1
+
+                if buffered >= self.batch_size:
+                    self._flush(updates)
+                    buffered = 0
+                progress.report()
+
+        self._flush(updates)
+        if not self.commit:
+            db.session.rollback()
+        progress.report(force=True)
+        return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate local uploads to S3')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent uploads')
+    parser.add_argument('--batch-size', type=int, default=100, help='Rows per database commit')
+    parser.add_argument('--checkpoint', default='migrate_to_s3.checkpoint',
+                        help='File used to resume an interrupted run; removed once a run has no failures')
+    parser.add_argument('--only', choices=sorted(MIGRATION_TARGETS), action='append',
+                        help='Only migrate this folder (may be repeated)')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be migrated')
+    parser.add_argument('--dest', choices=['s3', 'local'], default='s3',
+                        help='local is a benchmark: files go to --dest-dir and no URL change is committed')
+    parser.add_argument('--dest-dir', default='s3_standin', help='Target directory for --dest local')
+    parser.add_argument('--dest-delay', type=float, default=0.0,
+                        help='Simulated per-upload latency in seconds for --dest local')
+    args = parser.parse_args()
+
+    folders = args.only or sorted(MIGRATION_TARGETS)
+
     with app.app_context():
-        s3 = S3Handler()
-        courses = Course.query.filter(Course.thumbnail_url.isnot(None)).all()
-        
-        for course in courses:
-            if course.thumbnail_url and not course.thumbnail_url.startswith('https://'):
-                try:
-                    # Get local file path
-                    local_path = os.path.join(app.config['UPLOAD_FOLDER'], 'thumbnails', 
-                                            os.path.basename(course.thumbnail_url))
-                    
-                    if os.path.exists(local_path):
-                        # Upload to S3
-                        with open(local_path, 'rb') as file:
-                            s3_url = s3.upload_file(file, folder='thumbnails')
-                            if s3_url:
-                                course.thumbnail_url = s3_url
-                                db.session.commit()
-                                print(f"Migrated thumbnail for course {course.title}")
-                            else:
-                                print(f"Failed to upload thumbnail for course {course.title}")
-                except Exception as e:
-                    print(f"Error migrating thumbnail for course {course.title}: {str(e)}")
+        source = LocalFolderSource(app.config['UPLOAD_FOLDER'])
+        benchmark = args.dest == 'local'
+        # A benchmark must not leave stand-in URLs for a real run to resume from
+        checkpoint = Checkpoint(None if benchmark else args.checkpoint)
+        engine = MigrationEngine(source, None, checkpoint, workers=args.workers,
+                                 batch_size=args.batch_size, commit=not benchmark)
+        tasks, missing = engine.plan(folders)
+        total_bytes = sum(task[3] for task in tasks)
+        print(f"{len(tasks)} files to migrate ({total_bytes / 1e6:.1f} MB), "
+              f"{missing} missing locally, {len(checkpoint.done)} already in checkpoint")
+
+        if args.dry_run:
+            return
+
+        if benchmark:
+            engine.destination = LocalDestination(args.dest_dir, delay=args.dest_delay)
+            print(f"Benchmark: copying to {args.dest_dir}; database changes will be rolled back")
+        else:
+            engine.destination = S3Destination()
+
+        print("Starting migration to S3...")
+        progress = engine.run(tasks)
+        print(f"Migration completed! {progress.files} migrated, {progress.failed} failed")
+        if not progress.failed:
+            # Every URL is committed; keep the file only to resume failed uploads
+            checkpoint.clear()
+
 
 if __name__ == '__main__':
-    print("Starting migration to S3...")
-    migrate_profile_images()
-    migrate_course_thumbnails()
-    print("Migration completed!") 
\ No newline at end of file
+    main()
@@ -90,9 +90,15 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # backfill.py keeps its checkpoints in a table the models don't declare
+    def include_name(name, type_, parent_names):
+        return not (type_ == 'table' and name == 'backfill_progress')
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_name") is None:
+        conf_args["include_name"] = include_name
 
     connectable = get_engine()
 
@@ -0,0 +1,41 @@
+"""Add video_progress table
+
+Revision ID: 3b5e0c9a7d21
+Revises: e8c733c4b8a3
+Create Date: 2026-10-19 13:20:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b5e0c9a7d21'
+down_revision = 'e8c733c4b8a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'video_progress' in sa.inspect(op.get_bind()).get_table_names():
+        # Already created by db.create_all()
+        return
+    op.create_table('video_progress',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('video_id', sa.Integer(), nullable=False),
+        sa.Column('position_seconds', sa.Float(), nullable=False),
+        sa.Column('duration_seconds', sa.Float(), nullable=True),
+        sa.Column('completed', sa.Boolean(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['video_id'], ['course_videos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('student_id', 'video_id', name='uq_student_video')
+    )
+    op.create_index('ix_video_progress_video_id', 'video_progress', ['video_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_video_progress_video_id', table_name='video_progress')
+    op.drop_table('video_progress')
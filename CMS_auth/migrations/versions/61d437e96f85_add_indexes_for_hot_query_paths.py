@@ -0,0 +1,59 @@
+"""Add indexes for hot query paths
+
+Revision ID: 61d437e96f85
+Revises: 17f574335e40
+Create Date: 2026-10-19 10:12:05.417318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '61d437e96f85'
+down_revision = '17f574335e40'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) for the columns routes.py filters and sorts on
+INDEXES = [
+    ('ix_enrollments_course_id', 'enrollments', ['course_id']),
+    ('ix_enrollments_student_id_status', 'enrollments', ['student_id', 'status']),
+    ('ix_courses_instructor_id', 'courses', ['instructor_id']),
+    ('ix_courses_is_active_created_at', 'courses', ['is_active', 'created_at']),
+    ('ix_users_created_at', 'users', ['created_at']),
+    ('ix_users_role', 'users', ['role']),
+    ('ix_course_videos_course_id_order', 'course_videos', ['course_id', 'order']),
+]
+
+
+def existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # db.create_all() already creates these on fresh databases
+    missing = [index for index in INDEXES if index[0] not in existing_indexes(index[1])]
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # Build without locking writes; CONCURRENTLY cannot run in a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns in missing:
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+    else:
+        # MySQL/InnoDB builds secondary indexes online by default
+        for name, table, columns in missing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    present = [index for index in INDEXES if index[0] in existing_indexes(index[1])]
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, table, columns in reversed(present):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    else:
+        for name, table, columns in reversed(present):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,44 @@
+"""Add enrollment_daily_rollup table
+
+Revision ID: 9c41d2f07a6e
+Revises: 3b5e0c9a7d21
+Create Date: 2026-10-19 15:02:17.584310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c41d2f07a6e'
+down_revision = '3b5e0c9a7d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # May already exist (empty) from db.create_all()
+    if 'enrollment_daily_rollup' not in sa.inspect(bind).get_table_names():
+        op.create_table('enrollment_daily_rollup',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('course_id', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('enrollment_count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['course_id'], ['courses.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('day', 'course_id', 'status')
+        )
+        op.create_index('ix_enrollment_daily_rollup_course_id', 'enrollment_daily_rollup',
+                        ['course_id'], unique=False)
+
+    if bind.execute(sa.text('SELECT COUNT(*) FROM enrollment_daily_rollup')).scalar() == 0:
+        op.execute(
+            "INSERT INTO enrollment_daily_rollup (day, course_id, status, enrollment_count) "
+            "SELECT DATE(enrolled_at), course_id, COALESCE(status, 'active'), COUNT(*) "
+            "FROM enrollments GROUP BY DATE(enrolled_at), course_id, COALESCE(status, 'active')"
+        )
+
+
+def downgrade():
+    op.drop_index('ix_enrollment_daily_rollup_course_id', table_name='enrollment_daily_rollup')
+    op.drop_table('enrollment_daily_rollup')
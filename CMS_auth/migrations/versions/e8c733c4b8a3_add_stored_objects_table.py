@@ -0,0 +1,35 @@
+"""Add stored_objects table
+
+Revision ID: e8c733c4b8a3
+Revises: ec13137bc43e
+Create Date: 2026-10-19 11:48:20.662091
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c733c4b8a3'
+down_revision = 'ec13137bc43e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'stored_objects' in sa.inspect(op.get_bind()).get_table_names():
+        # Already created by db.create_all()
+        return
+    op.create_table('stored_objects',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('stored_objects')
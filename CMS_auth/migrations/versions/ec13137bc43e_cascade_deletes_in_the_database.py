@@ -0,0 +1,63 @@
+"""Cascade deletes in the database
+
+Revision ID: ec13137bc43e
+Revises: 61d437e96f85
+Create Date: 2026-10-19 11:02:47.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ec13137bc43e'
+down_revision = '61d437e96f85'
+branch_labels = None
+depends_on = None
+
+
+# (table, column, referred table) for every foreign key that should cascade
+FOREIGN_KEYS = [
+    ('courses', 'instructor_id', 'users'),
+    ('enrollments', 'student_id', 'users'),
+    ('enrollments', 'course_id', 'courses'),
+    ('course_videos', 'course_id', 'courses'),
+]
+
+# Lets batch mode on SQLite find the unnamed constraints created by create_all()
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def recreate_foreign_keys(ondelete):
+    if op.get_bind().dialect.name == 'sqlite':
+        # Batch mode rebuilds each table, and SQLite refuses to drop a table
+        # that other rows reference while foreign keys are enforced. The
+        # pragma is ignored inside a transaction, hence the autocommit block.
+        with op.get_context().autocommit_block():
+            op.execute('PRAGMA foreign_keys=OFF')
+            try:
+                _recreate_foreign_keys(ondelete)
+            finally:
+                op.execute('PRAGMA foreign_keys=ON')
+    else:
+        _recreate_foreign_keys(ondelete)
+
+
+def _recreate_foreign_keys(ondelete):
+    inspector = sa.inspect(op.get_bind())
+    for table, column, referred in FOREIGN_KEYS:
+        existing = [fk['name'] for fk in inspector.get_foreign_keys(table)
+                    if fk['constrained_columns'] == [column]]
+        name = (existing and existing[0]) or f'fk_{table}_{column}_{referred}'
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            if existing:
+                batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    recreate_foreign_keys('CASCADE')
+
+
+def downgrade():
+    recreate_foreign_keys(None)
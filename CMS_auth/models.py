@@ -22,16 +22,16 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     first_name = db.Column(db.String(50), nullable=True)
     last_name = db.Column(db.String(50), nullable=True)
-    role = db.Column(db.String(20), nullable=False, default=Role.STUDENT)
+    role = db.Column(db.String(20), nullable=False, default=Role.STUDENT, index=True)
     profile_image_url = db.Column(db.String(255), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationships
+    # Relationships; child rows are removed by ON DELETE CASCADE in the database
     courses_created = db.relationship('Course', backref='instructor', lazy=True, 
-                                     cascade="all, delete-orphan")
+                                     cascade="all, delete-orphan", passive_deletes=True)
     enrollments = db.relationship('Enrollment', backref='student', lazy=True,
-                                 cascade="all, delete-orphan")
+                                 cascade="all, delete-orphan", passive_deletes=True)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -62,7 +62,7 @@ class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     code = db.Column(db.String(20), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -72,11 +72,15 @@ class Course(db.Model):
     max_students = db.Column(db.Integer, default=50)
     thumbnail_url = db.Column(db.String(500), nullable=True)  # New field for course thumbnail
     
-    # Relationships
+    __table_args__ = (
+        db.Index('ix_courses_is_active_created_at', 'is_active', 'created_at'),
+    )
+    
+    # Relationships; child rows are removed by ON DELETE CASCADE in the database
     enrollments = db.relationship('Enrollment', backref='course', lazy=True,
-                                 cascade="all, delete-orphan")
+                                 cascade="all, delete-orphan", passive_deletes=True)
     videos = db.relationship('CourseVideo', backref='course', lazy=True,
-                           cascade="all, delete-orphan")
+                           cascade="all, delete-orphan", passive_deletes=True)
     
     def get_enrollment_count(self):
         return len(self.enrollments)
@@ -91,14 +95,16 @@ class Enrollment(db.Model):
     __tablename__ = 'enrollments'
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False, index=True)
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='active')  # active, completed, dropped
+    # active, completed, dropped; active_history keeps the old value for rollup.py
+    status = db.column_property(db.Column(db.String(20), default='active'), active_history=True)
     
     # Ensure a student can only enroll in a course once
     __table_args__ = (
         db.UniqueConstraint('student_id', 'course_id', name='uq_student_course'),
+        db.Index('ix_enrollments_student_id_status', 'student_id', 'status'),
     )
     
     def __repr__(self):
@@ -108,7 +114,7 @@ class CourseVideo(db.Model):
     __tablename__ = 'course_videos'
     
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     video_type = db.Column(db.String(20), nullable=False)  # 'youtube' or 'upload'
     video_url = db.Column(db.String(500), nullable=False)  # YouTube URL or uploaded file path
@@ -116,5 +122,58 @@ class CourseVideo(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     order = db.Column(db.Integer, default=0)  # For ordering videos in the course
     
+    __table_args__ = (
+        db.Index('ix_course_videos_course_id_order', 'course_id', 'order'),
+    )
+    
     def __repr__(self):
         return f'<CourseVideo {self.title}>'
+
+class StoredObject(db.Model):
+    """A content-addressed file in storage and how many rows reference it."""
+    __tablename__ = 'stored_objects'
+    
+    key = db.Column(db.String(255), primary_key=True)  # e.g. profiles/<sha256>.png
+    size = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(100), nullable=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StoredObject {self.key} x{self.ref_count}>'
+
+class VideoProgress(db.Model):
+    """How far a student has watched a course video, written in batches by video_progress.py."""
+    __tablename__ = 'video_progress'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('course_videos.id', ondelete='CASCADE'), nullable=False, index=True)
+    position_seconds = db.Column(db.Float, nullable=False, default=0)
+    duration_seconds = db.Column(db.Float, nullable=True)
+    completed = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'video_id', name='uq_student_video'),
+    )
+    
+    def __repr__(self):
+        return f'<VideoProgress {self.student_id} at {self.position_seconds}s of {self.video_id}>'
+
+class EnrollmentDailyRollup(db.Model):
+    """Enrollments per enrollment day, course and current status; maintained by rollup.py."""
+    __tablename__ = 'enrollment_daily_rollup'
+    
+    day = db.Column(db.Date, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    enrollment_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_enrollment_daily_rollup_course_id', 'course_id'),
+    )
+    
+    def __repr__(self):
+        return f'<EnrollmentDailyRollup {self.day} {self.course_id} {self.status}={self.enrollment_count}>'
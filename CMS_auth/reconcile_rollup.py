@@ -0,0 +1,33 @@
+"""Repair enrollment_daily_rollup from the enrollments table.
+
+The rollup is updated with every enrollment write (see rollup.py); this job
+fixes whatever drifted, e.g. rows removed by database cascades or a write
+that raced an earlier reconcile. Run it nightly:
+
+    python reconcile_rollup.py --days 3
+    python reconcile_rollup.py --full    # after restoring a backup
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from app import app
+from rollup import reconcile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repair the enrollment daily rollup')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--days', type=int, default=3, help='Recompute this many recent days')
+    group.add_argument('--full', action='store_true', help='Recompute the whole history')
+    args = parser.parse_args()
+
+    # enrolled_at is stored in UTC
+    since = None if args.full else datetime.utcnow().date() - timedelta(days=args.days - 1)
+    with app.app_context():
+        fixed = reconcile(since)
+    scope = 'all days' if since is None else f'days since {since}'
+    print(f"Reconciled enrollment rollup for {scope}: {fixed} cells corrected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Keep enrollment_daily_rollup in step with enrollments.
+
+Every ORM insert, delete or status change of an Enrollment adjusts the
+matching (day, course, status) count in the same transaction. Deletes the
+ORM never sees (ON DELETE CASCADE from users) are applied with
+remove_student_enrollments(); anything else that drifts is repaired by the
+nightly reconcile_rollup.py.
+"""
+from collections import Counter
+from datetime import date, datetime
+
+import sqlalchemy as sa
+from sqlalchemy import event, func
+
+from app import db
+from models import Enrollment, EnrollmentDailyRollup
+
+DEFAULT_STATUS = 'active'
+
+
+def _day(value):
+    # SQLite's date() returns text
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _increment_statement(dialect):
+    """INSERT ... ON CONFLICT/DUPLICATE KEY that adds to an existing count."""
+    table = EnrollmentDailyRollup.__table__
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        return statement.on_duplicate_key_update(
+            enrollment_count=table.c.enrollment_count + statement.inserted.enrollment_count
+        )
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=['day', 'course_id', 'status'],
+        set_={'enrollment_count': table.c.enrollment_count + statement.excluded.enrollment_count},
+    )
+
+
+def apply_deltas(connection, deltas):
+    """Add {(day, course_id, status): delta} to the rollup in one statement."""
+    rows = [{'day': day, 'course_id': course_id, 'status': status, 'enrollment_count': delta}
+            for (day, course_id, status), delta in deltas.items() if delta]
+    if rows:
+        connection.execute(_increment_statement(connection.dialect.name), rows)
+
+
+def _key(enrollment, status=None):
+    return (_day(enrollment.enrolled_at or datetime.utcnow()), enrollment.course_id,
+            status or enrollment.status or DEFAULT_STATUS)
+
+
+@event.listens_for(Enrollment, 'after_insert')
+def _count_insert(mapper, connection, target):
+    apply_deltas(connection, {_key(target): 1})
+
+
+@event.listens_for(Enrollment, 'before_delete')
+def _count_delete(mapper, connection, target):
+    # before_delete so expired attributes can still be loaded from the row
+    apply_deltas(connection, {_key(target): -1})
+
+
+@event.listens_for(Enrollment, 'after_update')
+def _count_status_change(mapper, connection, target):
+    history = sa.inspect(target).attrs.status.history
+    if history.has_changes() and history.deleted:
+        apply_deltas(connection, Counter({
+            _key(target, history.deleted[0]): -1,
+            _key(target): 1,
+        }))
+
+
+def _status_column():
+    # NULL and DEFAULT_STATUS share a rollup cell, so they must share a group
+    return func.coalesce(Enrollment.status, DEFAULT_STATUS)
+
+
+def remove_student_enrollments(student_id):
+    """Subtract a user's enrollments before deleting the user (the cascade bypasses the ORM)."""
+    day, status = func.date(Enrollment.enrolled_at), _status_column()
+    rows = db.session.query(day, Enrollment.course_id, status, func.count(Enrollment.id)).filter(
+        Enrollment.student_id == student_id
+    ).group_by(day, Enrollment.course_id, status)
+    apply_deltas(db.session.connection(), {
+        (_day(row_day), course_id, row_status): -count
+        for row_day, course_id, row_status, count in rows
+    })
+
+
+def reconcile(since=None):
+    """Recompute the rollup from enrollments for days >= since (all days if None).
+
+    Returns the number of (day, course, status) cells that were wrong.
+    """
+    day, status = func.date(Enrollment.enrolled_at), _status_column()
+    live = db.session.query(day, Enrollment.course_id, status, func.count(Enrollment.id))
+    stored = db.session.query(EnrollmentDailyRollup.day, EnrollmentDailyRollup.course_id,
+                              EnrollmentDailyRollup.status, EnrollmentDailyRollup.enrollment_count)
+    if since is not None:
+        live = live.filter(Enrollment.enrolled_at >= datetime.combine(since, datetime.min.time()))
+        stored = stored.filter(EnrollmentDailyRollup.day >= since)
+
+    expected = {
+        (_day(row_day), course_id, row_status): count
+        for row_day, course_id, row_status, count in live.group_by(day, Enrollment.course_id, status)
+    }
+    actual = {(_day(row_day), course_id, status): count for row_day, course_id, status, count in stored}
+
+    deltas = {key: expected.get(key, 0) - actual.get(key, 0) for key in expected.keys() | actual.keys()}
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    apply_deltas(db.session.connection(), deltas)
+    # Cells whose enrollments are all gone
+    EnrollmentDailyRollup.query.filter(EnrollmentDailyRollup.enrollment_count == 0).delete()
+    db.session.commit()
+    return len(deltas)
+
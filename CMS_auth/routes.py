@@ -1,22 +1,35 @@
 import logging
+import math
 import os
-from flask import render_template, redirect, url_for, flash, request, abort, current_app, send_from_directory
+from datetime import date, datetime, timedelta
+from flask import render_template, redirect, url_for, flash, request, abort, current_app, send_from_directory, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import NotFound
 from werkzeug.utils import secure_filename
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 
 from app import app, db
-from models import User, Course, Enrollment, Role, CourseVideo
+from models import User, Course, Enrollment, Role, CourseVideo, StoredObject
 from forms import (
     LoginForm, RegistrationForm, UserUpdateForm, CourseForm, 
     EnrollmentForm, PasswordChangeForm, CourseVideoForm
 )
 from auth import admin_required, instructor_required, instructor_or_admin_required
-from s3_utils import S3Handler
+from async_storage import storage
+from storage import release
+from db_routing import read_replica
+from course_bundle import get_course_page, invalidate_course_page, invalidate_instructor_courses
+from video_progress import progress_buffer, get_progress, is_enrolled, invalidate_enrollment
+from admin_stats import (
+    filter_enrollments, enrollment_stats, course_stats, enrollment_analytics, invalidate_admin_stats
+)
+from rollup import remove_student_enrollments
 
 # Home page
 @app.route('/')
+@read_replica
 def index():
     # Get some stats for the homepage
     course_count = Course.query.filter_by(is_active=True).count()
@@ -124,6 +137,7 @@ def logout():
 # User dashboard
 @app.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
     if current_user.is_admin():
         # Admin dashboard stats
@@ -170,19 +184,34 @@ def dashboard():
                                available_courses=available_courses)
 
 def save_profile_image(image_file):
-    """Save the uploaded profile image and return its URL path."""
+    """Start uploading the profile image and return its URL path."""
     if not image_file:
         return None
     
-    # Use S3 directly
-    s3 = S3Handler()
-    return s3.upload_file(image_file, folder='profiles')
+    # Upload in the background; the URL is known before the upload finishes
+    url, _ = storage.upload(image_file, folder='profiles')
+    return url
+
+def release_image(url):
+    """Drop a row's reference to a stored image it no longer uses."""
+    release(storage.backend.key_for(url))
+
+def forget_image_url(url):
+    """Clear references to an image whose background upload failed."""
+    User.query.filter_by(profile_image_url=url).update({'profile_image_url': None})
+    Course.query.filter_by(thumbnail_url=url).update({'thumbnail_url': None})
+    # No row points at it now; a zero count also makes the next upload of
+    # the same bytes store them again
+    StoredObject.query.filter_by(key=storage.backend.key_for(url)).update({'ref_count': 0})
+    db.session.commit()
 
-def delete_old_s3_image(url):
-    """Delete an old image from S3 if it exists."""
-    if url and 's3.' in url:  # Only delete if it's an S3 URL
-        s3 = S3Handler()
-        s3.delete_file(url)
+storage.on_upload_failure = forget_image_url
+app.teardown_request(storage.finish_request)
+
+def purge_images(urls):
+    """Release the stored images of removed rows; sweep_orphans.py deletes them."""
+    for url in urls:
+        release_image(url)
 
 # User profile
 @app.route('/profile', methods=['GET', 'POST'])
@@ -204,16 +233,13 @@ def profile():
             if current_user.is_admin():
                 current_user.role = form.role.data
             
-            # Handle profile image upload
+            # Handle profile image upload; replaced images are removed by sweep_orphans.py
             if form.profile_image.data:
                 try:
-                    # Delete old S3 image if exists
-                    if current_user.profile_image_url:
-                        delete_old_s3_image(current_user.profile_image_url)
-                    
                     # Upload new image
                     new_image_url = save_profile_image(form.profile_image.data)
                     if new_image_url:
+                        release_image(current_user.profile_image_url)
                         current_user.profile_image_url = new_image_url
                     else:
                         flash('Failed to upload profile image', 'warning')
@@ -221,12 +247,12 @@ def profile():
                     app.logger.error(f"Error handling profile image: {str(e)}")
                     flash('Error processing profile image', 'warning')
             elif form.profile_image_url.data:
-                # Delete old S3 image if exists
-                if current_user.profile_image_url:
-                    delete_old_s3_image(current_user.profile_image_url)
+                if form.profile_image_url.data != current_user.profile_image_url:
+                    release_image(current_user.profile_image_url)
                 current_user.profile_image_url = form.profile_image_url.data
             
             db.session.commit()
+            invalidate_instructor_courses(current_user.id)
             flash('Your profile has been updated!', 'success')
             return redirect(url_for('profile'))
             
@@ -266,6 +292,7 @@ def change_password():
 # Admin routes
 @app.route('/admin/users')
 @admin_required
+@read_replica
 def admin_users():
     users = User.query.all()
     return render_template('admin/users.html', users=users)
@@ -296,16 +323,13 @@ def admin_edit_user(user_id):
             
             user.role = form.role.data
             
-            # Handle profile image upload
+            # Handle profile image upload; replaced images are removed by sweep_orphans.py
             if form.profile_image.data:
                 try:
-                    # Delete old S3 image if exists
-                    if user.profile_image_url:
-                        delete_old_s3_image(user.profile_image_url)
-                    
                     # Upload new image
                     new_image_url = save_profile_image(form.profile_image.data)
                     if new_image_url:
+                        release_image(user.profile_image_url)
                         user.profile_image_url = new_image_url
                     else:
                         flash('Failed to upload profile image', 'warning')
@@ -313,12 +337,12 @@ def admin_edit_user(user_id):
                     app.logger.error(f"Error handling profile image: {str(e)}")
                     flash('Error processing profile image', 'warning')
             elif form.profile_image_url.data:
-                # Delete old S3 image if exists
-                if user.profile_image_url:
-                    delete_old_s3_image(user.profile_image_url)
+                if form.profile_image_url.data != user.profile_image_url:
+                    release_image(user.profile_image_url)
                 user.profile_image_url = form.profile_image_url.data
             
             db.session.commit()
+            invalidate_instructor_courses(user.id)
             flash(f'User {user.username} has been updated!', 'success')
             return redirect(url_for('admin_users'))
             
@@ -347,55 +371,78 @@ def admin_delete_user(user_id):
         flash('You cannot delete your own account!', 'danger')
         return redirect(url_for('admin_users'))
     
+    # Read what needs cleaning up afterwards without loading the child rows
+    courses = db.session.query(Course.id, Course.thumbnail_url).filter(
+        Course.instructor_id == user.id
+    ).all()
+    image_urls = [user.profile_image_url] + [course.thumbnail_url for course in courses]
+    
+    # Courses, enrollments and videos are removed by ON DELETE CASCADE, which
+    # skips the rollup's ORM hooks
+    remove_student_enrollments(user.id)
+    purge_images(image_urls)
     db.session.delete(user)
     db.session.commit()
+    invalidate_course_page(*[course.id for course in courses])
+    invalidate_admin_stats()
     
     flash(f'User {user.username} has been deleted!', 'success')
     return redirect(url_for('admin_users'))
 
 @app.route('/admin/courses')
 @admin_required
+@read_replica
 def admin_courses():
     courses = Course.query.all()
-    return render_template('admin/courses.html', courses=courses)
+    return render_template('admin/courses.html', courses=courses, stats=course_stats())
 
 @app.route('/admin/enrollments')
 @admin_required
+@read_replica
 def admin_enrollments():
     # Get filter parameters
     student_query = request.args.get('student', '')
     course_query = request.args.get('course', '')
     status = request.args.get('status', '')
     
-    # Build query
-    query = Enrollment.query
-    
-    # Apply filters
-    if student_query:
-        query = query.join(User, User.id == Enrollment.student_id).filter(
-            (User.first_name.ilike(f'%{student_query}%')) | 
-            (User.last_name.ilike(f'%{student_query}%')) |
-            (User.username.ilike(f'%{student_query}%'))
-        )
-    
-    if course_query:
-        query = query.join(Course, Course.id == Enrollment.course_id).filter(
-            (Course.title.ilike(f'%{course_query}%')) | 
-            (Course.code.ilike(f'%{course_query}%'))
-        )
-    
-    if status:
-        query = query.filter(Enrollment.status == status)
-    
-    # Execute query
+    query = filter_enrollments(Enrollment.query, student_query, course_query, status)
     enrollments = query.all()
     
     return render_template('admin/enrollments.html', 
                           enrollments=enrollments,
+                          stats=enrollment_stats(student_query, course_query, status),
                           student_query=student_query,
                           course_query=course_query,
                           status=status)
 
+def analytics_range():
+    """Read ?start=&end= (ISO dates), defaulting to the last 30 days and capped at a year."""
+    today = datetime.utcnow().date()
+    try:
+        end = date.fromisoformat(request.args.get('end', ''))
+    except ValueError:
+        end = today
+    try:
+        start = date.fromisoformat(request.args.get('start', ''))
+    except ValueError:
+        start = end - timedelta(days=29)
+    start = max(min(start, end), end - timedelta(days=365))
+    return start, end
+
+@app.route('/admin/analytics')
+@admin_required
+@read_replica
+def admin_analytics():
+    start, end = analytics_range()
+    return render_template('admin/analytics.html', analytics=enrollment_analytics(start, end))
+
+@app.route('/admin/analytics/data')
+@admin_required
+@read_replica
+def admin_analytics_data():
+    start, end = analytics_range()
+    return jsonify(enrollment_analytics(start, end))
+
 @app.route('/admin/enrollments/delete/<int:enrollment_id>', methods=['POST'])
 @admin_required
 def admin_delete_enrollment(enrollment_id):
@@ -403,6 +450,9 @@ def admin_delete_enrollment(enrollment_id):
     
     db.session.delete(enrollment)
     db.session.commit()
+    invalidate_course_page(enrollment.course_id)
+    invalidate_enrollment(enrollment.course_id, enrollment.student_id)
+    invalidate_admin_stats()
     
     flash('Enrollment has been deleted!', 'success')
     return redirect(url_for('admin_enrollments'))
@@ -410,6 +460,7 @@ def admin_delete_enrollment(enrollment_id):
 # Course routes
 @app.route('/courses')
 @login_required
+@read_replica
 def courses_index():
     # Get filter parameters
     search = request.args.get('search', '')
@@ -437,7 +488,7 @@ def courses_index():
     
     # Get instructors for the filter dropdown
     instructors = User.query.filter(
-        (User.role == Role.INSTRUCTOR) | (User.role == Role.ADMIN)
+        User.role.in_([Role.INSTRUCTOR, Role.ADMIN])
     ).all()
     
     # Execute query
@@ -451,13 +502,12 @@ def courses_index():
                           status=status)
 
 def save_thumbnail(thumbnail_file):
-    """Save the uploaded thumbnail and return its URL path."""
+    """Start uploading the thumbnail and return its URL path."""
     if not thumbnail_file:
         return None
     
-    # Use S3 directly
-    s3 = S3Handler()
-    return s3.upload_file(thumbnail_file, folder='thumbnails')
+    url, _ = storage.upload(thumbnail_file, folder='thumbnails')
+    return url
 
 @app.route('/courses/create', methods=['GET', 'POST'])
 @instructor_or_admin_required
@@ -492,27 +542,32 @@ def create_course():
 
 @app.route('/courses/<int:course_id>')
 @login_required
+@read_replica
 def view_course(course_id):
-    course = Course.query.get_or_404(course_id)
+    # Course, instructor, videos and enrollment count are shared by all viewers
+    page = get_course_page(course_id)
     enrollment = None
+    roster = []
     
     if current_user.is_authenticated:
         enrollment = Enrollment.query.filter_by(
-            course_id=course.id, 
+            course_id=course_id, 
             student_id=current_user.id
         ).first()
-    
-    # Get instructor info
-    instructor = User.query.get(course.instructor_id)
-    
-    # Get enrollment count
-    enrollment_count = len(course.enrollments)
+        
+        # Only the instructor and admins see the enrolled students
+        if current_user.is_admin() or current_user.id == page.course.instructor_id:
+            roster = Enrollment.query.filter_by(course_id=course_id).options(
+                joinedload(Enrollment.student)
+            ).all()
     
     return render_template('courses/view.html', 
-                           course=course, 
+                           course=page.course, 
                            enrollment=enrollment,
-                           instructor=instructor,
-                           enrollment_count=enrollment_count)
+                           instructor=page.instructor,
+                           videos=page.videos,
+                           roster=roster,
+                           enrollment_count=page.enrollment_count)
 
 @app.route('/courses/edit/<int:course_id>', methods=['GET', 'POST'])
 @instructor_or_admin_required
@@ -527,13 +582,12 @@ def edit_course(course_id):
     form = CourseForm(original_code=course.code)
     
     if form.validate_on_submit():
-        # Handle thumbnail upload
+        # Handle thumbnail upload; replaced thumbnails are removed by sweep_orphans.py
         thumbnail_url = form.thumbnail_url.data
+        uploaded = False
         if form.thumbnail.data:
-            # Delete old S3 thumbnail if exists
-            delete_old_s3_image(course.thumbnail_url)
-            # Upload new thumbnail to S3
             thumbnail_url = save_thumbnail(form.thumbnail.data)
+            uploaded = thumbnail_url is not None
             
         course.title = form.title.data
         course.description = form.description.data
@@ -542,9 +596,13 @@ def edit_course(course_id):
         course.end_date = form.end_date.data
         course.is_active = form.is_active.data
         course.max_students = form.max_students.data
+        # An upload always took a reference, even when it has the same bytes as the old one
+        if uploaded or thumbnail_url != course.thumbnail_url:
+            release_image(course.thumbnail_url)
         course.thumbnail_url = thumbnail_url
         
         db.session.commit()
+        invalidate_course_page(course.id)
         
         flash(f'Course {course.title} has been updated!', 'success')
         return redirect(url_for('view_course', course_id=course.id))
@@ -571,8 +629,12 @@ def delete_course(course_id):
         flash('You do not have permission to delete this course.', 'danger')
         return redirect(url_for('courses_index'))
     
+    # Enrollments and videos are removed by ON DELETE CASCADE
+    purge_images([course.thumbnail_url])
     db.session.delete(course)
     db.session.commit()
+    invalidate_course_page(course.id)
+    invalidate_admin_stats()
     
     flash(f'Course {course.title} has been deleted!', 'success')
     return redirect(url_for('courses_index'))
@@ -611,6 +673,8 @@ def enroll_course(course_id):
     
     db.session.add(enrollment)
     db.session.commit()
+    invalidate_course_page(course.id)
+    invalidate_enrollment(course.id, current_user.id)
     
     flash(f'You have successfully enrolled in {course.title}!', 'success')
     return redirect(url_for('view_course', course_id=course_id))
@@ -627,6 +691,8 @@ def unenroll_course(course_id):
     
     db.session.delete(enrollment)
     db.session.commit()
+    invalidate_course_page(course_id)
+    invalidate_enrollment(course_id, current_user.id)
     
     flash(f'You have been unenrolled from {course.title}.', 'success')
     return redirect(url_for('dashboard'))
@@ -656,6 +722,7 @@ def add_course_video(course_id):
         
         db.session.add(video)
         db.session.commit()
+        invalidate_course_page(course.id)
         
         flash(f'Video "{video.title}" has been added to the course!', 'success')
         return redirect(url_for('view_course', course_id=course_id))
@@ -675,10 +742,61 @@ def delete_course_video(course_id, video_id):
     
     db.session.delete(video)
     db.session.commit()
+    invalidate_course_page(course.id)
     
     flash(f'Video "{video.title}" has been deleted from the course.', 'success')
     return redirect(url_for('view_course', course_id=course_id))
 
+# Video progress; heartbeats are buffered and written in batches by video_progress.py
+@app.route('/courses/<int:course_id>/videos/<int:video_id>/progress', methods=['POST'])
+@login_required
+def record_video_progress(course_id, video_id):
+    data = request.get_json(silent=True)
+    try:
+        position = float(data['position'])
+        duration = float(data['duration']) if data.get('duration') else None
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify(error='position (seconds) is required'), 400
+    # float() accepts JSON's NaN and Infinity, which cannot be stored or sent back
+    if not math.isfinite(position) or (duration is not None and not math.isfinite(duration)):
+        return jsonify(error='position and duration must be finite numbers'), 400
+    if position < 0 or (duration is not None and duration <= 0):
+        return jsonify(error='position and duration must be positive'), 400
+    if duration is not None:
+        position = min(position, duration)
+
+    try:
+        page = get_course_page(course_id)
+    except NotFound:
+        return jsonify(error='course not found'), 404
+    if not any(video.id == video_id for video in page.videos):
+        return jsonify(error='video not found in this course'), 404
+    if not current_user.is_student() or not is_enrolled(course_id, current_user.id):
+        return jsonify(error='only enrolled students record progress'), 403
+
+    state = progress_buffer.record(current_user.id, video_id, position, duration,
+                                   completed=bool(data.get('completed')))
+    return jsonify(position=state.position, completed=state.completed)
+
+@app.route('/courses/<int:course_id>/progress')
+@login_required
+@read_replica
+def course_progress(course_id):
+    try:
+        page = get_course_page(course_id)
+    except NotFound:
+        return jsonify(error='course not found'), 404
+    progress = get_progress(current_user.id, [video.id for video in page.videos])
+    return jsonify({
+        str(video_id): {
+            'position': state.position,
+            'duration': state.duration,
+            'completed': state.completed,
+            'updated_at': state.updated_at.isoformat(),
+        }
+        for video_id, state in progress.items()
+    })
+
 # Serve uploaded files
 @app.route('/static/uploads/<filename>')
 def uploaded_file(filename):
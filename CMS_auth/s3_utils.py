@@ -4,6 +4,15 @@ from botocore.exceptions import ClientError, NoCredentialsError
 from werkzeug.utils import secure_filename
 from flask import current_app
 
+def object_url(key):
+    """Public URL of an object in the configured bucket."""
+    return f"https://{os.getenv('AWS_BUCKET_NAME')}.s3.{os.getenv('AWS_REGION', 'eu-north-1')}.amazonaws.com/{key}"
+
+def object_key(filename, folder=''):
+    """Bucket key for an uploaded filename."""
+    filename = secure_filename(filename)
+    return f"{folder}/{filename}" if folder else filename
+
 class S3Handler:
     def __init__(self):
         try:
@@ -58,14 +67,8 @@ class S3Handler:
             current_app.logger.info(f"Attempting to upload file: {file.filename}")
             current_app.logger.info(f"Content type: {file.content_type}")
             
-            # Secure the filename
-            filename = secure_filename(file.filename)
-            
-            # Create a unique filename with folder structure
-            if folder:
-                s3_path = f"{folder}/{filename}"
-            else:
-                s3_path = filename
+            # Secure the filename and add the folder structure
+            s3_path = object_key(file.filename, folder)
 
             current_app.logger.info(f"S3 path for upload: {s3_path}")
 
@@ -80,7 +83,7 @@ class S3Handler:
             )
 
             # Generate the URL
-            url = f"https://{self.bucket_name}.s3.{os.getenv('AWS_REGION', 'eu-north-1')}.amazonaws.com/{s3_path}"
+            url = object_url(s3_path)
             current_app.logger.info(f"File successfully uploaded. URL: {url}")
             return url
 
@@ -107,7 +110,7 @@ class S3Handler:
             
             # Extract the key from the URL
             try:
-                key = file_url.split(f"https://{self.bucket_name}.s3.{os.getenv('AWS_REGION', 'eu-north-1')}.amazonaws.com/")[1]
+                key = file_url.split(object_url(''))[1]
                 current_app.logger.info(f"Extracted S3 key: {key}")
             except IndexError:
                 current_app.logger.error(f"Invalid S3 URL format: {file_url}")
@@ -129,4 +132,4 @@ class S3Handler:
             return False
         except Exception as e:
             current_app.logger.error(f"Unexpected error deleting file: {str(e)}")
-            return False 
\ No newline at end of file
+            return False 
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+from urllib.parse import unquote, urlparse
+
+import boto3
+from botocore.config import Config
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+from app import db
+from models import StoredObject
+from s3_utils import object_url
+
+
+def content_key(data, filename, folder=''):
+    """Key an object by the SHA-256 of its bytes so identical files share one copy."""
+    digest = hashlib.sha256(data).hexdigest()
+    extension = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return f"{folder}/{digest}{extension}" if folder else f"{digest}{extension}"
+
+
+class StorageBackend:
+    """Interface implemented by every storage backend."""
+
+    # Prefix of the public URL for a key
+    base_url = ''
+
+    def put(self, key, data, content_type=None):
+        """Store bytes under key; return True on success."""
+        raise NotImplementedError
+
+    def delete_keys(self, keys):
+        """Delete keys and return the ones that could not be deleted."""
+        raise NotImplementedError
+
+    def list_objects(self, prefix):
+        """Yield {'Key', 'LastModified', 'Size'} for every object under prefix."""
+        raise NotImplementedError
+
+    def url_for(self, key):
+        return f"{self.base_url}{key}"
+
+    def key_for(self, url):
+        """Return the key of one of this backend's URLs, or None."""
+        if url and url.startswith(self.base_url):
+            return url[len(self.base_url):]
+        return None
+
+
+class S3Storage(StorageBackend):
+    """Objects in the configured S3 bucket."""
+
+    def __init__(self, bucket_name=None, region=None, timeout=None):
+        self.bucket_name = bucket_name or os.getenv('AWS_BUCKET_NAME')
+        self.s3_client = boto3.client(
+            's3',
+            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+            region_name=region or os.getenv('AWS_REGION', 'eu-north-1'),
+            # Bounds each call in the thread that makes it, so a timed-out
+            # upload really stops
+            config=Config(connect_timeout=timeout, read_timeout=timeout) if timeout else None
+        )
+        self.base_url = object_url('')
+
+    def put(self, key, data, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        # Content-addressed keys never change, so clients may cache them forever
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=data,
+                                  CacheControl='public, max-age=31536000, immutable', **extra)
+        return True
+
+    def key_for(self, url):
+        # Stored URLs may name the bucket's region differently from this process
+        # (or not at all), so read the bucket and key out of the URL itself
+        parsed = urlparse(url or '')
+        host, path = parsed.netloc.lower(), unquote(parsed.path).lstrip('/')
+        if not host.endswith('.amazonaws.com') or not self.bucket_name:
+            return None
+        if host.startswith(f"{self.bucket_name.lower()}.s3"):
+            return path or None
+        if host.startswith('s3') and path.startswith(f"{self.bucket_name}/"):
+            return path[len(self.bucket_name) + 1:] or None
+        return None
+
+    def delete_keys(self, keys):
+        failed = []
+        for start in range(0, len(keys), 1000):
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+            )
+            failed.extend(error['Key'] for error in response.get('Errors', []))
+        return failed
+
+    def list_objects(self, prefix):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix,
+                                       PaginationConfig={'PageSize': 1000}):
+            for obj in page.get('Contents', []):
+                yield {'Key': obj['Key'], 'LastModified': obj['LastModified'], 'Size': obj['Size']}
+
+
+class LocalStorage(StorageBackend):
+    """Objects as files under a directory, e.g. static/uploads for local development."""
+
+    def __init__(self, root, base_url='/static/uploads/'):
+        self.root = root
+        self.base_url = base_url.rstrip('/') + '/'
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Key outside storage root: {key}")
+        return path
+
+    def put(self, key, data, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def delete_keys(self, keys):
+        failed = []
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                failed.append(key)
+        return failed
+
+    def list_objects(self, prefix):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix) and not key.endswith('.tmp'):
+                    stat = os.stat(path)
+                    yield {'Key': key, 'Size': stat.st_size,
+                           'LastModified': datetime.fromtimestamp(stat.st_mtime, timezone.utc)}
+
+
+class MemoryStorage(StorageBackend):
+    """Objects in a dict; for tests and benchmarks without network access."""
+
+    def __init__(self, base_url='memory://'):
+        self.base_url = base_url
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, data, content_type=None):
+        with self._lock:
+            self.objects[key] = (bytes(data), content_type, datetime.now(timezone.utc))
+        return True
+
+    def delete_keys(self, keys):
+        with self._lock:
+            for key in keys:
+                self.objects.pop(key, None)
+        return []
+
+    def list_objects(self, prefix):
+        with self._lock:
+            items = list(self.objects.items())
+        for key, (data, _, modified) in items:
+            if key.startswith(prefix):
+                yield {'Key': key, 'LastModified': modified, 'Size': len(data)}
+
+
+def create_backend(config):
+    """Build the backend named by the STORAGE_BACKEND setting."""
+    name = config.get('STORAGE_BACKEND', 's3')
+    if name == 's3':
+        return S3Storage(config.get('AWS_BUCKET_NAME'), timeout=config.get('STORAGE_TIMEOUT'))
+    if name == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+    if name == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name}")
+
+
+def acquire(key, size, content_type=None):
+    """Count a new reference to a stored object.
+
+    Runs in the caller's transaction. Returns True when the object is new (or
+    unused, so possibly being swept) and its bytes have to be uploaded.
+    """
+    now = datetime.utcnow()
+    updated = StoredObject.query.filter(StoredObject.key == key, StoredObject.ref_count > 0).update(
+        {'ref_count': StoredObject.ref_count + 1, 'last_used_at': now},
+        synchronize_session=False
+    )
+    if updated:
+        return False
+    revived = StoredObject.query.filter_by(key=key).update(
+        {'ref_count': 1, 'size': size, 'content_type': content_type, 'last_used_at': now},
+        synchronize_session=False
+    )
+    if revived:
+        return True
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredObject(key=key, size=size, content_type=content_type,
+                                        ref_count=1, created_at=now, last_used_at=now))
+        return True
+    except IntegrityError:
+        # Another request stored the same bytes first
+        StoredObject.query.filter_by(key=key).update(
+            {'ref_count': StoredObject.ref_count + 1, 'last_used_at': now},
+            synchronize_session=False
+        )
+        return False
+
+
+def release(key):
+    """Drop one reference to a stored object; sweep_orphans.py removes unused ones.
+
+    Every path that stops a row pointing at an object must call this, in the
+    same transaction, or the object is never swept.
+    """
+    if key:
+        StoredObject.query.filter(
+            StoredObject.key == key, StoredObject.ref_count > 0
+        ).update({'ref_count': StoredObject.ref_count - 1}, synchronize_session=False)
@@ -0,0 +1,163 @@
+"""Delete stored images that no user or course references any more.
+
+Replaces the request-time deletes: old profile images and thumbnails are left
+in place when they are replaced, and this job removes them later in bulk.
+An object is only deleted while its stored_objects row is locked with a zero
+ref_count, so a deduplicated upload can never point a row at it mid-delete.
+Run it periodically (e.g. a nightly cron job):
+
+    python sweep_orphans.py --grace-hours 24 --dry-run
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import User, Course, StoredObject
+from storage import create_backend
+
+PREFIXES = ('profiles/', 'thumbnails/')
+BATCH_SIZE = 1000  # S3 DeleteObjects limit
+
+
+def referenced_keys(backend, keys=None):
+    """Return the bucket keys referenced by users and courses.
+
+    With ``keys`` only those keys are checked, which is used to re-verify a
+    batch right before deleting it. URLs are matched on the key suffix, not
+    on backend.url_for(), since stored URLs may use another host form.
+    """
+    columns = [User.profile_image_url, Course.thumbnail_url]
+    referenced = set()
+    for column in columns:
+        query = db.session.query(column).filter(column.isnot(None))
+        if keys is not None:
+            if not keys:
+                continue
+            query = query.filter(or_(*[column.like(f"%/{key}") for key in keys]))
+        for (url,) in query.yield_per(5000):
+            key = backend.key_for(url)
+            if key:
+                referenced.add(key)
+    return referenced
+
+
+def recently_used_keys(cutoff):
+    """Keys a deduplicated upload has pointed a new row at since cutoff."""
+    query = db.session.query(StoredObject.key).filter(
+        StoredObject.last_used_at >= cutoff.replace(tzinfo=None)
+    )
+    return {key for (key,) in query}
+
+
+def image_url_count():
+    """Rows that point at any image URL at all."""
+    return sum(db.session.query(column).filter(column.isnot(None)).count()
+               for column in (User.profile_image_url, Course.thumbnail_url))
+
+
+def find_orphans(backend, referenced, grace):
+    """Yield keys under the swept prefixes that are unreferenced and older than grace."""
+    cutoff = datetime.now(timezone.utc) - grace
+    # Recent objects may belong to uploads whose rows are not committed yet
+    recent = recently_used_keys(cutoff)
+    for prefix in PREFIXES:
+        for obj in backend.list_objects(prefix):
+            key = obj['Key']
+            if key not in referenced and key not in recent and obj['LastModified'] < cutoff:
+                yield key, obj['Size']
+
+
+def claim(backend, keys, cutoff):
+    """Lock the unused stored_objects rows of keys and return the keys safe to delete.
+
+    Runs in the caller's transaction; the locks hold until it commits, so
+    acquire() waits for the delete and then uploads the bytes again.
+    """
+    cutoff = cutoff.replace(tzinfo=None)
+    tracked = {key for (key,) in db.session.query(StoredObject.key).filter(StoredObject.key.in_(keys))}
+    for key in keys:
+        if key not in tracked:
+            # Objects stored before reference counting get a row to lock, too
+            try:
+                with db.session.begin_nested():
+                    db.session.add(StoredObject(key=key, size=0, ref_count=0,
+                                                created_at=cutoff, last_used_at=cutoff))
+            except IntegrityError:
+                pass
+    unused = db.session.query(StoredObject.key).filter(
+        StoredObject.key.in_(keys), StoredObject.ref_count == 0, StoredObject.last_used_at <= cutoff
+    ).with_for_update()
+    claimed = {key for (key,) in unused}
+    # The counter can drift (e.g. URLs typed into forms), so check the rows too
+    return claimed - referenced_keys(backend, claimed)
+
+
+def sweep(backend, grace, batches_per_second=2.0, dry_run=False):
+    referenced = referenced_keys(backend)
+    print(f"{len(referenced)} referenced objects")
+    if not referenced and image_url_count():
+        # Every stored URL failing to parse means a misconfigured backend,
+        # not an empty bucket; deleting now would remove live images
+        print("No stored image URL matches this storage backend; refusing to delete anything")
+        return 1
+
+    found = deleted = failed = freed = 0
+    batch = []
+
+    def flush(batch):
+        nonlocal deleted, failed, freed
+        claimed = claim(backend, [key for key, _ in batch], datetime.now(timezone.utc) - grace)
+        batch = [(key, size) for key, size in batch if key in claimed]
+        if dry_run:
+            for key, _ in batch:
+                print(f"would delete {key}")
+            db.session.rollback()
+            errors = []
+        else:
+            # Drop the rows first, keeping them locked until the bytes are gone;
+            # a key that fails to delete is adopted again by the next sweep
+            StoredObject.query.filter(
+                StoredObject.key.in_([key for key, _ in batch])
+            ).delete(synchronize_session=False)
+            errors = set(backend.delete_keys([key for key, _ in batch]))
+            db.session.commit()
+            time.sleep(1.0 / batches_per_second)
+        deleted += len(batch) - len(errors)
+        failed += len(errors)
+        freed += sum(size for key, size in batch if key not in errors)
+
+    for key, size in find_orphans(backend, referenced, grace):
+        found += 1
+        batch.append((key, size))
+        if len(batch) == BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    action = 'would delete' if dry_run else 'deleted'
+    print(f"{found} orphans found, {action} {deleted} ({freed / 1e6:.1f} MB), {failed} failed")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete unreferenced images from storage')
+    parser.add_argument('--grace-hours', type=float, default=24,
+                        help='Only delete objects older than this')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='Maximum delete batches (of up to 1000 keys) per second')
+    parser.add_argument('--dry-run', action='store_true', help='List orphans without deleting them')
+    args = parser.parse_args()
+
+    with app.app_context():
+        failed = sweep(create_backend(app.config), timedelta(hours=args.grace_hours),
+                       batches_per_second=args.rate, dry_run=args.dry_run)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
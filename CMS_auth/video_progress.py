@@ -0,0 +1,271 @@
+import atexit
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeoutError
+
+from app import db
+from cache import cache
+from models import User, Enrollment, CourseVideo, VideoProgress
+
+# Latest known state of one (student, video) pair
+ProgressState = namedtuple('ProgressState', 'position duration completed updated_at')
+
+# A video counts as watched once this share of it has been played
+COMPLETION_RATIO = 0.9
+
+# Rows per upsert statement
+FLUSH_CHUNK = 1000
+
+# Failures worth retrying on the next flush (lost connections, lock waits,
+# deadlocks, pool exhaustion); anything else is a problem with the rows
+TRANSIENT_ERRORS = (OperationalError, PoolTimeoutError)
+
+
+def _cache_key(student_id, video_id):
+    return f'video_progress:{student_id}:{video_id}'
+
+
+def _enrollment_key(course_id, student_id):
+    return f'enrolled:{course_id}:{student_id}'
+
+
+def is_enrolled(course_id, student_id):
+    """Cached enrollment check, so heartbeats don't query the database."""
+    return cache.get_or_set(
+        _enrollment_key(course_id, student_id),
+        lambda: db.session.query(Enrollment.id).filter_by(
+            course_id=course_id, student_id=student_id
+        ).first() is not None,
+        ttl=300
+    )
+
+
+def invalidate_enrollment(course_id, student_id):
+    cache.delete(_enrollment_key(course_id, student_id))
+
+
+def _upsert_statement(dialect):
+    """INSERT ... ON CONFLICT/DUPLICATE KEY UPDATE for VideoProgress rows."""
+    table = VideoProgress.__table__
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        new = statement.inserted
+        # MySQL has no WHERE on this clause, so each column keeps its value
+        # unless the row is newer; updated_at is assigned last since MySQL
+        # applies the assignments in order
+        newer = sa.or_(table.c.updated_at.is_(None), table.c.updated_at <= new.updated_at)
+        return statement.on_duplicate_key_update([
+            ('position_seconds', sa.func.IF(newer, new.position_seconds, table.c.position_seconds)),
+            ('duration_seconds', sa.func.IF(newer, sa.func.coalesce(new.duration_seconds, table.c.duration_seconds),
+                                            table.c.duration_seconds)),
+            ('completed', sa.or_(table.c.completed, new.completed)),
+            ('updated_at', sa.func.IF(newer, new.updated_at, table.c.updated_at)),
+        ])
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(table)
+    new = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=['student_id', 'video_id'],
+        set_={
+            'position_seconds': new.position_seconds,
+            'duration_seconds': sa.func.coalesce(new.duration_seconds, table.c.duration_seconds),
+            'completed': sa.or_(table.c.completed, new.completed),
+            'updated_at': new.updated_at,
+        },
+        # Never let a flush from a slower worker overwrite a newer position
+        where=table.c.updated_at <= new.updated_at,
+    )
+
+
+class ProgressBuffer:
+    """Write-behind buffer for video progress heartbeats.
+
+    Heartbeats only touch memory: the latest state per (student, video) is
+    kept here and mirrored to the shared cache so every worker can read it.
+    A background thread writes everything buffered as one batched upsert
+    every VIDEO_PROGRESS_FLUSH_INTERVAL seconds (sooner if the buffer
+    reaches VIDEO_PROGRESS_MAX_BUFFER), so the number of database writes
+    depends on the flush interval, not on how many players are open.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pid = None
+        self._wake = threading.Event()
+        self.flushed = 0
+
+    def _start(self, app):
+        # Started lazily so each forked gunicorn worker gets its own flush thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.app = app
+            self.interval = app.config.get('VIDEO_PROGRESS_FLUSH_INTERVAL', 10)
+            self.max_buffer = app.config.get('VIDEO_PROGRESS_MAX_BUFFER', 20000)
+            self._pending = {}
+            self._wake = threading.Event()
+            thread = threading.Thread(target=self._run, name='progress-flush', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def record(self, student_id, video_id, position, duration=None, completed=False):
+        """Buffer a heartbeat; returns the coalesced state."""
+        self._start(current_app._get_current_object())
+        if duration and position >= duration * COMPLETION_RATIO:
+            completed = True
+        key = (student_id, video_id)
+        with self._lock:
+            previous = self._pending.get(key)
+            if previous is not None:
+                duration = duration or previous.duration
+                completed = completed or previous.completed
+            state = ProgressState(position, duration, completed, datetime.utcnow())
+            self._pending[key] = state
+            full = len(self._pending) >= self.max_buffer
+        if full:
+            self._wake.set()
+        # Readable from any worker until the flush lands
+        cache.set(_cache_key(student_id, video_id), state, ttl=max(60, self.interval * 4))
+        return state
+
+    def buffered(self, student_id, video_ids):
+        """Return {video_id: ProgressState} not yet flushed, from any worker."""
+        states = {}
+        for video_id in video_ids:
+            state = cache.get(_cache_key(student_id, video_id))
+            if state is not None:
+                states[video_id] = state
+        with self._lock:
+            for video_id in video_ids:
+                state = self._pending.get((student_id, video_id))
+                if state is not None and (video_id not in states
+                                          or state.updated_at > states[video_id].updated_at):
+                    states[video_id] = state
+        return states
+
+    def pending(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write everything buffered in batched upserts; returns the rows written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        rows = [
+            {'student_id': student_id, 'video_id': video_id, 'position_seconds': state.position,
+             'duration_seconds': state.duration, 'completed': state.completed,
+             'updated_at': state.updated_at}
+            for (student_id, video_id), state in batch.items()
+        ]
+        try:
+            written = self._write(rows)
+        except TRANSIENT_ERRORS as e:
+            db.session.rollback()
+            current_app.logger.error(f"Video progress flush of {len(rows)} rows failed: {e!r}")
+            self._requeue(batch)
+            return 0
+        except Exception as e:
+            # Retrying the same batch would fail forever; find the bad rows
+            db.session.rollback()
+            current_app.logger.error(f"Video progress flush of {len(rows)} rows failed, "
+                                     f"writing them one by one: {e!r}")
+            written = self._write_each(rows, batch)
+        self.flushed += written
+        return written
+
+    def _write_each(self, rows, batch):
+        """Write rows separately, dropping (and logging) those the database rejects."""
+        written = 0
+        failed = {}
+        for row in rows:
+            key = (row['student_id'], row['video_id'])
+            try:
+                written += self._write([row])
+            except TRANSIENT_ERRORS:
+                db.session.rollback()
+                failed[key] = batch[key]
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Dropping video progress {row}: {e!r}")
+        self._requeue(failed)
+        return written
+
+    def _write(self, rows):
+        statement = _upsert_statement(db.engine.dialect.name)
+        try:
+            for start in range(0, len(rows), FLUSH_CHUNK):
+                db.session.execute(statement, rows[start:start + FLUSH_CHUNK])
+            db.session.commit()
+            return len(rows)
+        except IntegrityError:
+            # A video or student was deleted since the heartbeat; drop its rows
+            db.session.rollback()
+            rows = self._existing_only(rows)
+            for start in range(0, len(rows), FLUSH_CHUNK):
+                db.session.execute(statement, rows[start:start + FLUSH_CHUNK])
+            db.session.commit()
+            return len(rows)
+
+    def _existing_only(self, rows):
+        video_ids = {row['video_id'] for row in rows}
+        student_ids = {row['student_id'] for row in rows}
+        videos = {id for (id,) in db.session.query(CourseVideo.id).filter(CourseVideo.id.in_(video_ids))}
+        students = {id for (id,) in db.session.query(User.id).filter(User.id.in_(student_ids))}
+        return [row for row in rows if row['video_id'] in videos and row['student_id'] in students]
+
+    def _requeue(self, batch):
+        # Keep failed rows for the next flush unless a newer heartbeat replaced them
+        with self._lock:
+            for key, state in batch.items():
+                if key not in self._pending:
+                    self._pending[key] = state
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self.app.app_context():
+                self.flush()
+
+
+progress_buffer = ProgressBuffer()
+
+
+def get_progress(student_id, video_ids):
+    """Return {video_id: ProgressState}, merging saved rows with buffered heartbeats."""
+    video_ids = list(video_ids)
+    if not video_ids:
+        return {}
+    rows = db.session.query(
+        VideoProgress.video_id, VideoProgress.position_seconds, VideoProgress.duration_seconds,
+        VideoProgress.completed, VideoProgress.updated_at
+    ).filter(
+        VideoProgress.student_id == student_id, VideoProgress.video_id.in_(video_ids)
+    )
+    progress = {row[0]: ProgressState(*row[1:]) for row in rows}
+    for video_id, state in progress_buffer.buffered(student_id, video_ids).items():
+        saved = progress.get(video_id)
+        if saved is None or state.updated_at >= saved.updated_at:
+            progress[video_id] = state._replace(
+                duration=state.duration or (saved and saved.duration),
+                completed=state.completed or bool(saved and saved.completed),
+            )
+    return progress
+
+
+@atexit.register
+def _flush_on_exit():
+    if progress_buffer._pid == os.getpid():
+        with progress_buffer.app.app_context():
+            progress_buffer.flush()
@@ -0,0 +1,124 @@
+"""Template precompilation and per-worker warm-up.
+
+Jinja compiles each template to Python the first time a worker renders it.
+Compiled templates are kept on disk (TEMPLATE_CACHE_DIR, see app.py), so the
+compile happens once per deploy instead of once per worker:
+
+    python warmup.py             # precompile every template (run by build.sh)
+    python warmup.py --measure   # time a cold worker's first renders
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import time
+
+from flask import g
+from sqlalchemy import text
+
+from app import app, db
+from admin_stats import CourseStats, EnrollmentStats
+from models import User, Role
+
+# Templates rendered on every worker start, with the context they need
+KEY_TEMPLATES = [
+    ('index.html', dict(course_count=0, user_count=0, enrollment_count=0, featured_courses=[])),
+    ('courses/index.html', dict(courses=[], instructors=[], search='', instructor_id=None)),
+    ('dashboard.html', dict(user_count=0, course_count=0, enrollment_count=0, recent_users=[],
+                            recent_courses=[], courses=[], course_enrollment_data=[],
+                            enrolled_courses=[], available_courses=[])),
+    ('admin/users.html', dict(users=[])),
+    ('admin/courses.html', dict(courses=[], stats=CourseStats(0, 0, 0, {}))),
+    ('admin/enrollments.html', dict(enrollments=[], student_query='', course_query='', status='',
+                                    stats=EnrollmentStats(0, {}, 0))),
+]
+
+
+def precompile_templates():
+    """Compile every template into the bytecode cache; returns how many."""
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def render_key_templates():
+    """Render the busiest templates once per role, filling the worker's template cache."""
+    rendered = 0
+    for role in Role.all_roles():
+        # A throwaway user so role-dependent branches of base.html get rendered
+        with app.test_request_context('/'):
+            g._login_user = User(id=0, username='warmup', email='warmup@localhost', role=role)
+            for name, context in KEY_TEMPLATES:
+                try:
+                    app.jinja_env.get_template(name).render(**app_template_context(), **context)
+                    rendered += 1
+                except Exception as e:
+                    app.logger.warning(f"Warm-up render of {name} as {role} failed: {e!r}")
+    return rendered
+
+
+def app_template_context():
+    context = {}
+    app.update_template_context(context)
+    return context
+
+
+def open_db_connections():
+    """Connect to the primary and every replica so the first request skips the handshake."""
+    with app.app_context():
+        for engine in db.engines.values():
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+
+
+def warm_up():
+    """Prepare a freshly started worker before it accepts requests."""
+    started = time.perf_counter()
+    compiled = precompile_templates()
+    rendered = render_key_templates()
+    open_db_connections()
+    app.logger.info(f"Worker warm-up: {compiled} templates loaded, {rendered} renders, "
+                    f"DB connected in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+def measure(warm):
+    """Time the first renders and first query of the current (fresh) process."""
+    if warm:
+        warm_up()
+    started = time.perf_counter()
+    render_key_templates()
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompile templates or measure cold starts')
+    parser.add_argument('--measure', action='store_true',
+                        help='Compare first-request work in fresh processes with and without warm-up')
+    parser.add_argument('--child', choices=['cold', 'warm'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(f"{measure(args.child == 'warm'):.1f}")
+        return
+
+    if args.measure:
+        def run(mode):
+            output = subprocess.run([sys.executable, __file__, '--child', mode],
+                                    capture_output=True, text=True, check=True).stdout
+            return float(output.strip().splitlines()[-1])
+
+        shutil.rmtree(app.config['TEMPLATE_CACHE_DIR'], ignore_errors=True)
+        print(f"no bytecode cache, no warm-up:  {run('cold'):7.1f} ms")
+        precompile_templates()
+        print(f"bytecode cache, no warm-up:     {run('cold'):7.1f} ms")
+        print(f"bytecode cache and warm-up:     {run('warm'):7.1f} ms")
+        return
+
+    print(f"Precompiled {precompile_templates()} templates into {app.config['TEMPLATE_CACHE_DIR']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Check every analytics.py metric against the notebook's SQL.
+
+Runs each query from python+sql_ecomerce.ipynb (written for MySQL, with
+the date functions swapped on SQLite) and compares its rows with the
+pandas result, printing both timings. Exits non-zero on any mismatch.
+
+    python load_csv.py --url sqlite:///ecomerce.db
+    python check_analytics.py --url sqlite:///ecomerce.db
+"""
+import argparse
+import calendar
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import analytics
+from dataset import Dataset
+from db import DEFAULT_URL, connect, dialect
+from load_csv import DATA_DIR
+from notebook_queries import queries
+
+
+def _normalize(frame, keys):
+    frame = frame.copy()
+    for column in frame.columns:
+        if frame[column].dtype == object or isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(object).where(frame[column].notna(), '')
+    return frame.sort_values(keys, kind='stable').reset_index(drop=True)
+
+
+def compare(expected, actual, keys):
+    """Return None if the SQL rows (actual) match the pandas frame, else a reason."""
+    if keys is None:
+        value = float(actual[0][0]) if actual and actual[0][0] is not None else np.nan
+        if not np.isclose(expected, value, rtol=1e-6, atol=1e-6, equal_nan=True):
+            return f"pandas {expected!r} != SQL {value!r}"
+        return None
+
+    actual = pd.DataFrame(actual, columns=expected.columns)
+    if len(actual) != len(expected):
+        return f"{len(expected)} pandas rows != {len(actual)} SQL rows"
+    for column in expected.columns:
+        if pd.api.types.is_datetime64_any_dtype(expected[column]):
+            actual[column] = pd.to_datetime(actual[column])
+        elif pd.api.types.is_numeric_dtype(expected[column]):
+            actual[column] = pd.to_numeric(actual[column].astype(float))
+        else:
+            actual[column] = actual[column].astype(object)
+    expected, actual = _normalize(expected, keys), _normalize(actual, keys)
+    for column in expected.columns:
+        left, right = expected[column], actual[column]
+        if pd.api.types.is_numeric_dtype(left) and not pd.api.types.is_datetime64_any_dtype(left):
+            # Rounded sums may land either side of a half cent
+            matches = np.isclose(left.astype(float), right.astype(float), rtol=1e-6, atol=0.0101, equal_nan=True)
+        else:
+            matches = (left.astype(str) == right.astype(str)).to_numpy()
+        if not matches.all():
+            row = int(np.argmin(matches))
+            return f"{column} differs at row {row}: pandas {left.iloc[row]!r}, SQL {right.iloc[row]!r}"
+    return None
+
+
+def prepare(name, expected, rows, keys):
+    """Bring a pandas result and its SQL rows to comparable shapes."""
+    if name == 'orders_by_month':
+        months = {month: number for number, month in enumerate(calendar.month_name)}
+        expected = expected.assign(months=expected['months'].map(months))
+    if name == 'moving_average_order_value':
+        # Payments at the same instant have no defined order in SQL either, so
+        # only rows with a unique (customer, time) are compared
+        expected = expected[~expected.duplicated(keys, keep=False)]
+        unique = set(zip(expected['customer_id'].astype(str),
+                         expected['order_purchase_timestamp'].astype(str)))
+        rows = [row for row in rows if (str(row[0]), str(row[1])) in unique]
+    if name == 'price_purchase_correlation':
+        counts, prices = np.array(rows, dtype='float64').T
+        rows = [(np.corrcoef(counts, prices)[0][-1],)]
+    return expected, rows
+
+
+def check(url, data_dir):
+    conn = connect(url)
+    cursor = conn.cursor()
+    ds = Dataset(data_dir)
+    started = time.perf_counter()
+    for table in ('customers', 'orders', 'order_items', 'payments', 'products'):
+        ds[table]
+    print(f"Loaded dataset in {time.perf_counter() - started:.2f}s")
+
+    failures = 0
+    for name, (sql, keys) in queries(dialect(url)).items():
+        started = time.perf_counter()
+        expected = analytics.METRICS[name](ds)
+        pandas_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+        sql_seconds = time.perf_counter() - started
+
+        expected, rows = prepare(name, expected, rows, keys)
+        problem = compare(expected, rows, keys)
+        failures += problem is not None
+        print(f"{'FAIL' if problem else 'ok  '} {name:<36} pandas {pandas_seconds * 1000:7.1f} ms   "
+              f"SQL {sql_seconds * 1000:8.1f} ms" + (f"   {problem}" if problem else ''))
+    conn.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare analytics.py with the notebook SQL')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Database loaded by load_csv.py')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Folder containing the CSV files')
+    args = parser.parse_args()
+    failures = check(args.url, args.data_dir)
+    if failures:
+        print(f"{failures} metrics differ from SQL")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
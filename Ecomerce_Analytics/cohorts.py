@@ -0,0 +1,205 @@
+"""Repeat-purchase retention and monthly cohorts in one sorted pass.
+
+The notebook's 6-month retention query finds each customer's first order and
+then self-joins orders on a date range with COUNT(DISTINCT ...), which grows
+with orders per customer squared. Here orders are sorted once by customer
+and time; each customer's first purchase and the first strictly later one
+fall out of that pass, and a window W retains the customer if
+next_order < first_order + W. Any number of windows is then a vectorized
+comparison, in pandas or in a single window-function query.
+
+Windows are written '30d', '90d', '180d' or '6m' (calendar months, as the
+notebook uses):
+
+    from dataset import Dataset
+    import cohorts
+    repeats = cohorts.first_repeat(Dataset())
+    cohorts.retention(repeats, ['30d', '90d', '180d'])
+    cohorts.cohort_matrix(Dataset())
+
+    python cohorts.py --windows 30d 90d 180d --matrix
+    python cohorts.py --url sqlite:///ecomerce.db --benchmark
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import Dataset
+from db import DEFAULT_URL, connect, dialect, sql_functions
+from load_csv import DATA_DIR
+
+WINDOWS = ['30d', '90d', '180d']
+
+TS = 'order_purchase_timestamp'
+
+
+def parse_window(window):
+    """'30d' -> (30, 'day'), '6m' -> (6, 'month')."""
+    match = re.fullmatch(r'(\d+)\s*([dm])', str(window).strip().lower())
+    if not match:
+        raise ValueError(f"Window {window!r} should look like '30d' or '6m'")
+    return int(match.group(1)), 'day' if match.group(2) == 'd' else 'month'
+
+
+def _offset(window):
+    amount, unit = parse_window(window)
+    return pd.DateOffset(days=amount) if unit == 'day' else pd.DateOffset(months=amount)
+
+
+def _customer_orders(ds, customer_key):
+    """Purchase times with their customer key, like the notebook's customers JOIN orders."""
+    columns = ['customer_id'] + ([customer_key] if customer_key != 'customer_id' else [])
+    orders = ds.orders[['customer_id', TS]].merge(ds.customers[columns], on='customer_id')
+    return orders.sort_values([customer_key, TS], kind='stable', na_position='last')
+
+
+def first_repeat(ds, customer_key='customer_id'):
+    """One row per customer: first purchase time and the next later one (NaT if none)."""
+    orders = _customer_orders(ds, customer_key)
+    keys = orders[customer_key].to_numpy()
+    times = orders[TS].to_numpy()
+    starts = np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.zeros(0, bool)
+    group = np.cumsum(starts) - 1
+    first = times[starts]
+    # Sorted, so a customer's first row after their first purchase time is the next purchase
+    later = np.flatnonzero(times > first[group])
+    customers, position = np.unique(group[later], return_index=True)
+    next_order = np.full(len(first), np.datetime64('NaT', 'ns'), dtype=times.dtype)
+    next_order[customers] = times[later[position]]
+    return pd.DataFrame({customer_key: keys[starts], 'first_order': first, 'next_order': next_order})
+
+
+def retention(repeats, windows=WINDOWS):
+    """Percent of customers whose next purchase falls within each window of their first."""
+    if not len(repeats):
+        return pd.Series(0.0, index=list(windows), name='retention')
+    return pd.Series({
+        window: float((repeats['next_order'] < repeats['first_order'] + _offset(window)).mean() * 100)
+        for window in windows
+    }, name='retention')
+
+
+def cohort_matrix(ds, customer_key='customer_id'):
+    """Percent of each first-purchase month's customers who buy again k months later.
+
+    Rows are cohorts ('2017-01', ...), columns are months since the first
+    purchase (0 is always 100).
+    """
+    orders = _customer_orders(ds, customer_key).dropna(subset=[TS])
+    month = orders[TS].dt.year.to_numpy() * 12 + orders[TS].dt.month.to_numpy() - 1
+    keys = orders[customer_key].to_numpy()
+    starts = np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.zeros(0, bool)
+    group = np.cumsum(starts) - 1
+    cohort = month[starts][group]
+    active = pd.DataFrame({'group': group, 'cohort': cohort, 'offset': month - cohort}).drop_duplicates()
+    counts = active.groupby(['cohort', 'offset']).size().unstack(fill_value=0)
+    matrix = counts.div(counts[0], axis=0).mul(100).round(2)
+    matrix.index = [f"{index // 12}-{index % 12 + 1:02d}" for index in matrix.index]
+    matrix.index.name = 'cohort'
+    matrix.columns.name = 'months_since_first'
+    return matrix
+
+
+def _add_window(db_dialect, column, window):
+    amount, unit = parse_window(window)
+    if unit == 'month':
+        return sql_functions(db_dialect)[2](column, amount)
+    if db_dialect == 'mysql':
+        return f"DATE_ADD({column}, INTERVAL {amount} DAY)"
+    return f"datetime({column}, '+{amount} days')"
+
+
+def self_join_sql(db_dialect, window='6m', customer_key='customer_id'):
+    """The notebook's retention query (rate the right way up), for any customer key."""
+    ts = f"orders.{TS}"
+    return f"""
+        WITH a AS (
+            SELECT customers.{customer_key} AS customer, MIN({ts}) first_order
+            FROM customers JOIN orders ON customers.customer_id = orders.customer_id
+            GROUP BY customers.{customer_key}),
+        b AS (
+            SELECT a.customer, COUNT(DISTINCT {ts}) next_order
+            FROM a JOIN customers ON customers.{customer_key} = a.customer
+            JOIN orders ON orders.customer_id = customers.customer_id
+            AND {ts} > first_order AND {ts} < {_add_window(db_dialect, 'first_order', window)}
+            GROUP BY a.customer)
+        SELECT 100.0 * COUNT(DISTINCT b.customer) / COUNT(DISTINCT a.customer)
+        FROM a LEFT JOIN b ON a.customer = b.customer"""
+
+
+def retention_sql(db_dialect, windows=WINDOWS, customer_key='customer_id'):
+    """The same retention as one query: a MIN() window, one GROUP BY, no self-join."""
+    rates = ', '.join(
+        f"100.0 * SUM(CASE WHEN next_order < {_add_window(db_dialect, 'first_order', window)} THEN 1 ELSE 0 END) / COUNT(*)"
+        for window in windows
+    )
+    return f"""
+        SELECT {rates} FROM (
+            SELECT customer, MIN(first_order) AS first_order,
+            MIN(CASE WHEN ts > first_order THEN ts END) AS next_order
+            FROM (
+                SELECT customers.{customer_key} AS customer, orders.{TS} AS ts,
+                MIN(orders.{TS}) OVER (PARTITION BY customers.{customer_key}) AS first_order
+                FROM customers JOIN orders ON customers.customer_id = orders.customer_id) AS a
+            GROUP BY customer) AS b"""
+
+
+def benchmark(url, data_dir=DATA_DIR, windows=WINDOWS, customer_key='customer_id'):
+    """Time the notebook's self-join (one window) against the single-pass SQL and pandas."""
+    conn = connect(url)
+    cursor = conn.cursor()
+    db_dialect = dialect(url)
+    windows = list(windows) + ([] if '6m' in windows else ['6m'])
+
+    started = time.perf_counter()
+    cursor.execute(self_join_sql(db_dialect, '6m', customer_key))
+    notebook = float(cursor.fetchone()[0])
+    print(f"notebook self-join, 6m        {(time.perf_counter() - started) * 1000:9.1f} ms   {notebook:.4f}%")
+
+    started = time.perf_counter()
+    cursor.execute(retention_sql(db_dialect, windows, customer_key))
+    single = [float(value) for value in cursor.fetchone()]
+    print(f"single-pass SQL, {len(windows)} windows    {(time.perf_counter() - started) * 1000:9.1f} ms   "
+          + '  '.join(f"{window} {value:.4f}%" for window, value in zip(windows, single)))
+    conn.close()
+
+    ds = Dataset(data_dir)
+    for table in ('orders', 'customers'):
+        ds[table]
+    started = time.perf_counter()
+    rates = retention(first_repeat(ds, customer_key), windows)
+    print(f"pandas sorted pass, {len(windows)} windows {(time.perf_counter() - started) * 1000:9.1f} ms   "
+          + '  '.join(f"{window} {value:.4f}%" for window, value in rates.items()))
+
+    if not np.allclose([notebook, single[-1]], rates['6m'], atol=1e-6) or \
+            not np.allclose(single, rates.to_numpy(), atol=1e-6):
+        raise SystemExit('Retention rates disagree')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repeat-purchase retention and monthly cohorts')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Folder containing the CSV files')
+    parser.add_argument('--windows', nargs='+', default=WINDOWS, help="Retention windows, e.g. 30d 90d 6m")
+    parser.add_argument('--customer-key', default='customer_id', choices=['customer_id', 'customer_unique_id'],
+                        help='customer_unique_id counts people rather than per-order customer ids')
+    parser.add_argument('--matrix', action='store_true', help='Print the monthly cohort matrix')
+    parser.add_argument('--benchmark', action='store_true', help='Compare with the notebook query on --url')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Database loaded by load_csv.py (for --benchmark)')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.url, args.data_dir, args.windows, args.customer_key)
+        return
+    ds = Dataset(args.data_dir)
+    for window, rate in retention(first_repeat(ds, args.customer_key), args.windows).items():
+        print(f"{window:>6} retention {rate:.2f}%")
+    if args.matrix:
+        with pd.option_context('display.width', 200, 'display.max_columns', 40):
+            print(cohort_matrix(ds, args.customer_key))
+
+
+if __name__ == '__main__':
+    main()
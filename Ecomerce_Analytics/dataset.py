@@ -0,0 +1,106 @@
+"""Typed, in-memory access to the e-commerce CSV tables.
+
+Every column has an explicit dtype (no pandas guessing on each run): ids are
+Arrow strings, low-cardinality text is categorical, counts use the smallest
+integer type and timestamps are parsed once. Needs pyarrow.
+
+    ds = Dataset()              # or Dataset('/path/to/DataSet')
+    ds.orders.head()            # read on first use (from the Parquet cache), then kept
+"""
+import os
+
+import pandas as pd
+
+from load_csv import CSV_FILES, DATA_DIR, clean_column
+
+TABLES = {table: csv_file for csv_file, table in CSV_FILES}
+
+ID = 'string[pyarrow]'
+
+# Column dtypes by (cleaned) column name; datetime columns are in DATES
+DTYPES = {
+    'customers': {
+        'customer_id': ID, 'customer_unique_id': ID, 'customer_zip_code_prefix': 'category',
+        'customer_city': 'category', 'customer_state': 'category',
+    },
+    'geolocation': {
+        'geolocation_zip_code_prefix': 'category', 'geolocation_lat': 'float64',
+        'geolocation_lng': 'float64', 'geolocation_city': 'category', 'geolocation_state': 'category',
+    },
+    'order_items': {
+        'order_id': ID, 'order_item_id': 'uint8', 'product_id': ID, 'seller_id': ID,
+        'price': 'float64', 'freight_value': 'float64',
+    },
+    'orders': {
+        'order_id': ID, 'customer_id': ID, 'order_status': 'category',
+    },
+    'payments': {
+        'order_id': ID, 'payment_sequential': 'uint8', 'payment_type': 'category',
+        'payment_installments': 'uint8', 'payment_value': 'float64',
+    },
+    'products': {
+        'product_id': ID, 'product_category': 'category', 'product_name_length': 'UInt8',
+        'product_description_length': 'UInt16', 'product_photos_qty': 'UInt8',
+        'product_weight_g': 'UInt32', 'product_length_cm': 'UInt8', 'product_height_cm': 'UInt8',
+        'product_width_cm': 'UInt8',
+    },
+    'sellers': {
+        'seller_id': ID, 'seller_zip_code_prefix': 'category', 'seller_city': 'category',
+        'seller_state': 'category',
+    },
+}
+
+DATES = {
+    'order_items': ['shipping_limit_date'],
+    'orders': ['order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date',
+               'order_delivered_customer_date', 'order_estimated_delivery_date'],
+}
+
+
+def csv_path(table, data_dir=DATA_DIR):
+    return os.path.join(data_dir, TABLES[table])
+
+
+def read_csv(table, data_dir=DATA_DIR, columns=None):
+    """Parse one CSV with its declared dtypes; columns limits what is read."""
+    path = csv_path(table, data_dir)
+    raw_names = {clean_column(name): name for name in pd.read_csv(path, nrows=0).columns}
+    wanted = [name for name in raw_names if columns is None or name in columns]
+    dtypes = DTYPES[table]
+    frame = pd.read_csv(
+        path,
+        usecols=[raw_names[name] for name in wanted],
+        dtype={raw_names[name]: dtypes[name] for name in wanted if name in dtypes},
+        parse_dates=[raw_names[name] for name in DATES.get(table, []) if name in wanted],
+    )
+    frame.columns = [clean_column(name) for name in frame.columns]
+    return frame
+
+
+class Dataset:
+    """The e-commerce tables, each read once on first use and then kept.
+
+    Tables come from the Parquet cache (see parquet_cache.py), which is
+    rebuilt whenever a CSV changes; cache=False parses the CSVs instead.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, cache=True):
+        self.data_dir = data_dir
+        self.cache = cache
+        self._tables = {}
+
+    def __getitem__(self, table):
+        if table not in self._tables:
+            self._tables[table] = self.read(table)
+        return self._tables[table]
+
+    def __getattr__(self, name):
+        if name in TABLES:
+            return self[name]
+        raise AttributeError(name)
+
+    def read(self, table):
+        if self.cache:
+            from parquet_cache import load
+            return load(table, self.data_dir)
+        return read_csv(table, self.data_dir)
@@ -0,0 +1,68 @@
+"""Database connections shared by the analytics scripts.
+
+A database is named by a URL:
+
+    mysql://root:@localhost/ecomerce_analytics   (what the notebooks use)
+    sqlite:///ecomerce.db                          (local runs and tests)
+
+ECOMERCE_DB_URL overrides the default.
+"""
+import os
+import sqlite3
+from urllib.parse import urlparse, unquote
+
+DEFAULT_URL = os.environ.get('ECOMERCE_DB_URL', 'mysql://root:@localhost/ecomerce_analytics')
+
+
+def dialect(url):
+    scheme = urlparse(url).scheme.split('+')[0]
+    if scheme not in ('sqlite', 'mysql'):
+        raise ValueError(f"Unsupported database URL {url!r}; use sqlite:/// or mysql://")
+    return scheme
+
+
+def connect(url=DEFAULT_URL, **kwargs):
+    """Open a DB-API connection for url; extra kwargs go to the driver."""
+    parts = urlparse(url)
+    if dialect(url) == 'sqlite':
+        # sqlite:///relative.db or sqlite:////absolute.db
+        path = parts.path[1:] if parts.path.startswith('/') else parts.path
+        conn = sqlite3.connect(path or ':memory:', timeout=kwargs.pop('timeout', 60), **kwargs)
+        # WAL lets readers and one writer work at once; loads are re-runnable, so
+        # losing the last transaction on power loss is acceptable
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    import mysql.connector
+    return mysql.connector.connect(
+        host=parts.hostname or 'localhost',
+        port=parts.port or 3306,
+        user=unquote(parts.username or 'root'),
+        password=unquote(parts.password or ''),
+        database=parts.path.lstrip('/') or None,
+        **kwargs
+    )
+
+
+def placeholder(url):
+    """Parameter marker for the driver behind url."""
+    return '?' if dialect(url) == 'sqlite' else '%s'
+
+
+def quote(name):
+    # Backticks work in both MySQL and SQLite
+    return f"`{name}`"
+
+
+def sql_functions(db_dialect):
+    """year(), month() and add_months() SQL builders for the given dialect."""
+    if db_dialect == 'mysql':
+        return (lambda col: f"YEAR({col})", lambda col: f"MONTH({col})",
+                lambda col, months: f"DATE_ADD({col}, INTERVAL {months} MONTH)")
+    # Like MySQL, clamp Aug 31 + 6 months to Feb 28 instead of rolling into March
+    # ('floor' needs SQLite 3.46)
+    clamp = ", 'floor'" if sqlite3.sqlite_version_info >= (3, 46) else ''
+    return (lambda col: f"CAST(strftime('%Y', {col}) AS INTEGER)",
+            lambda col: f"CAST(strftime('%m', {col}) AS INTEGER)",
+            lambda col, months: f"datetime({col}, '+{months} months'{clamp})")
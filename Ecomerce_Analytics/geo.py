@@ -0,0 +1,276 @@
+"""Zip-prefix centroids and distance queries for seller/customer locations.
+
+geolocation has many rows per zip prefix, so joining locations against it
+multiplies rows. This module collapses it once to one centroid per prefix,
+kept as sorted numpy arrays (looked up with searchsorted, no join) and
+cached next to the Parquet copies. On top of that:
+
+- haversine() is vectorized over numpy arrays
+- GridIndex buckets points into lat/lng cells, for nearest-point and
+  within-radius queries without comparing every pair
+- customers and sellers are located by zip prefix, so queries run once per
+  distinct prefix and the answers are mapped back to every row
+
+    from dataset import Dataset
+    import geo
+    ds = Dataset()
+    distances = geo.item_distances(ds)          # seller -> customer km per order item
+    nearest = geo.nearest_sellers(ds)           # closest seller per customer
+
+    python geo.py --bands 50 200 1000
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import Dataset
+from load_csv import DATA_DIR
+from parquet_cache import cache_dir, source_fingerprint
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# Olist has a few geolocation rows far outside Brazil; they would drag centroids
+LAT_RANGE = (-34.0, 6.0)
+LNG_RANGE = (-74.0, -34.0)
+
+CELL_DEGREES = 0.5
+
+# Largest query x point distance matrix computed at once (float64 cells)
+MATRIX_CELLS = 2 ** 21
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km; arguments broadcast like numpy arrays."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype='float64')) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def zip_numbers(values):
+    """Zip prefixes as integers ('01001' and 1001 match); -1 where missing."""
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        numbers = pd.to_numeric(values.cat.categories.astype(str), errors='coerce').fillna(-1).astype('int64')
+        return np.where(codes >= 0, numbers.to_numpy()[codes], -1)
+    return pd.to_numeric(values.astype(str), errors='coerce').fillna(-1).astype('int64').to_numpy()
+
+
+class ZipCentroids:
+    """One (lat, lng) per zip prefix, in arrays sorted by prefix."""
+
+    def __init__(self, zips, lat, lng, rows):
+        self.zips, self.lat, self.lng, self.rows = zips, lat, lng, rows
+
+    @classmethod
+    def build(cls, geolocation):
+        lat = geolocation['geolocation_lat'].to_numpy('float64')
+        lng = geolocation['geolocation_lng'].to_numpy('float64')
+        zips = zip_numbers(geolocation['geolocation_zip_code_prefix'])
+        keep = (zips >= 0) & (lat >= LAT_RANGE[0]) & (lat <= LAT_RANGE[1]) & \
+               (lng >= LNG_RANGE[0]) & (lng <= LNG_RANGE[1])
+        grouped = pd.DataFrame({'zip': zips[keep], 'lat': lat[keep], 'lng': lng[keep]}).groupby('zip', sort=True)
+        means, counts = grouped.mean(), grouped.size()
+        return cls(means.index.to_numpy('int32'), means['lat'].to_numpy(), means['lng'].to_numpy(),
+                   counts.to_numpy('uint32'))
+
+    @classmethod
+    def cached(cls, data_dir=DATA_DIR):
+        """Centroids from <data dir>/.parquet/zip_centroids.npz, rebuilt if geolocation changed."""
+        path = os.path.join(cache_dir(data_dir), 'zip_centroids.npz')
+        fingerprint = json.dumps(source_fingerprint('geolocation', data_dir), sort_keys=True)
+        try:
+            with np.load(path) as arrays:
+                if str(arrays['source']) == fingerprint:
+                    return cls(arrays['zips'], arrays['lat'], arrays['lng'], arrays['rows'])
+        except (OSError, KeyError, ValueError):
+            pass
+        centroids = cls.build(Dataset(data_dir).geolocation)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(f"{path}.tmp.npz", zips=centroids.zips, lat=centroids.lat, lng=centroids.lng,
+                 rows=centroids.rows, source=np.array(fingerprint))
+        os.replace(f"{path}.tmp.npz", path)
+        return centroids
+
+    def __len__(self):
+        return len(self.zips)
+
+    def locate(self, zips):
+        """(lat, lng) arrays for the given prefixes, NaN where a prefix is unknown."""
+        zips = zip_numbers(zips)
+        position = np.minimum(np.searchsorted(self.zips, zips), max(len(self.zips) - 1, 0))
+        found = (self.zips[position] == zips) if len(self.zips) else np.zeros(len(zips), bool)
+        return np.where(found, self.lat[position], np.nan), np.where(found, self.lng[position], np.nan)
+
+
+class GridIndex:
+    """Points bucketed into cell_degrees x cell_degrees cells.
+
+    Points are sorted by cell, so each row of cells in a search block is one
+    contiguous slice. Queries are grouped by cell and answered with
+    vectorized distance matrices, at most MATRIX_CELLS cells each. A point
+    may stand for several (weights), e.g. all sellers in one zip prefix.
+    """
+
+    def __init__(self, lat, lng, weights=None, cell_degrees=CELL_DEGREES):
+        lat, lng = np.asarray(lat, dtype='float64'), np.asarray(lng, dtype='float64')
+        weights = np.ones(len(lat), 'int64') if weights is None else np.asarray(weights, dtype='int64')
+        self.cell = cell_degrees
+        self.columns = int(np.ceil(360 / cell_degrees)) + 1
+        self.indices = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng)))
+        keys = self._keys(lat[self.indices], lng[self.indices])
+        order = np.argsort(keys, kind='stable')
+        self.indices, self.keys = self.indices[order], keys[order]
+        self.lat, self.lng, self.weights = lat[self.indices], lng[self.indices], weights[self.indices]
+        self.rows = int(np.ceil(180 / cell_degrees)) + 1
+
+    def _cells(self, lat, lng):
+        return ((lat + 90) // self.cell).astype('int64'), ((lng + 180) // self.cell).astype('int64')
+
+    def _keys(self, lat, lng):
+        row, column = self._cells(lat, lng)
+        return row * self.columns + column
+
+    def _block(self, row, column, k):
+        """Positions (into the sorted points) of every point within k cells of (row, column)."""
+        rows = np.arange(max(row - k, 0), min(row + k, self.rows - 1) + 1)
+        low = np.searchsorted(self.keys, rows * self.columns + max(column - k, 0))
+        high = np.searchsorted(self.keys, rows * self.columns + min(column + k, self.columns - 1), side='right')
+        return np.concatenate([np.arange(start, stop) for start, stop in zip(low, high)]) if len(rows) else \
+            np.zeros(0, 'int64')
+
+    def _outside_km(self, row, k):
+        """Least distance from a point in cell `row` to any point outside its k-cell block."""
+        edge = max(abs(row * self.cell - 90), abs((row + 1) * self.cell - 90)) + k * self.cell
+        return k * self.cell * KM_PER_DEGREE * np.cos(np.radians(min(edge, 90.0)))
+
+    def _groups(self, lat, lng):
+        lat, lng = np.asarray(lat, dtype='float64'), np.asarray(lng, dtype='float64')
+        valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lng)))
+        row, column = self._cells(lat[valid], lng[valid])
+        keys = row * self.columns + column
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1], True])
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            members = valid[order[start:stop]]
+            yield members, row[order[start]], column[order[start]], lat[members], lng[members]
+
+    def _distances(self, lat, lng, block):
+        """Yield (slice of the queries, km matrix to the block's points), bounded in size."""
+        step = max(MATRIX_CELLS // max(len(block), 1), 1)
+        for start in range(0, len(lat), step):
+            rows = slice(start, start + step)
+            yield rows, haversine(lat[rows, None], lng[rows, None], self.lat[block], self.lng[block])
+
+    def nearest(self, lat, lng):
+        """Index (into the points given to the constructor) and km of each query's nearest point."""
+        found = np.full(len(lat), -1, dtype='int64')
+        distance = np.full(len(lat), np.nan)
+        if not len(self.keys):
+            return found, distance
+        for members, row, column, query_lat, query_lng in self._groups(lat, lng):
+            k = 1
+            while True:
+                block = self._block(row, column, k)
+                if len(block):
+                    best = np.empty(len(members), 'int64')
+                    best_km = np.empty(len(members))
+                    for rows, km in self._distances(query_lat, query_lng, block):
+                        best[rows] = km.argmin(axis=1)
+                        best_km[rows] = km[np.arange(len(km)), best[rows]]
+                    # Nothing outside the block can beat what is inside it
+                    if best_km.max() <= self._outside_km(row, k) or k > max(self.rows, self.columns):
+                        break
+                k += 1
+            found[members], distance[members] = self.indices[block[best]], best_km
+        return found, distance
+
+    def count_within(self, lat, lng, radius_km):
+        """Number of points (summed weights) within radius_km of each query."""
+        counts = np.zeros(len(lat), dtype='int64')
+        for members, row, column, query_lat, query_lng in self._groups(lat, lng):
+            k = 1
+            while self._outside_km(row, k) < radius_km and k <= max(self.rows, self.columns):
+                k += 1
+            block = self._block(row, column, k)
+            if len(block):
+                for rows, km in self._distances(query_lat, query_lng, block):
+                    counts[members[rows]] = (km <= radius_km) @ self.weights[block]
+        return counts
+
+
+def item_distances(ds, centroids=None):
+    """Seller-to-customer km for every order item (NaN where a zip has no centroid)."""
+    if centroids is None:
+        centroids = ZipCentroids.cached(ds.data_dir)
+    items = ds.order_items[['order_id', 'order_item_id', 'seller_id']]
+    items = items.merge(ds.orders[['order_id', 'customer_id']], on='order_id')
+    items = items.merge(ds.sellers[['seller_id', 'seller_zip_code_prefix']], on='seller_id')
+    items = items.merge(ds.customers[['customer_id', 'customer_zip_code_prefix']], on='customer_id')
+    seller_lat, seller_lng = centroids.locate(items['seller_zip_code_prefix'])
+    customer_lat, customer_lng = centroids.locate(items['customer_zip_code_prefix'])
+    return items[['order_id', 'order_item_id', 'seller_id', 'customer_id']].assign(
+        distance_km=haversine(seller_lat, seller_lng, customer_lat, customer_lng))
+
+
+def nearest_sellers(ds, centroids=None, bands=()):
+    """Each customer's nearest seller and its distance, plus seller counts within each band (km)."""
+    if centroids is None:
+        centroids = ZipCentroids.cached(ds.data_dir)
+    sellers, customers = ds.sellers, ds.customers
+    # Sellers in one prefix share a centroid: index each prefix once, standing
+    # for its first seller (nearest) and all of them (counts)
+    seller_zips, first_seller, seller_counts = np.unique(zip_numbers(sellers['seller_zip_code_prefix']),
+                                                         return_index=True, return_counts=True)
+    index = GridIndex(*centroids.locate(seller_zips), weights=seller_counts)
+    # ...and customers are answered once per prefix, then mapped back
+    customer_zips, customer_zip = np.unique(zip_numbers(customers['customer_zip_code_prefix']),
+                                            return_inverse=True)
+    lat, lng = centroids.locate(customer_zips)
+    found, distance = index.nearest(lat, lng)
+    seller = pd.Series(sellers['seller_id'].to_numpy()[first_seller]).reindex(found).to_numpy()
+    frame = pd.DataFrame({
+        'customer_id': customers['customer_id'].to_numpy(),
+        'seller_id': seller[customer_zip],
+        'distance_km': distance[customer_zip],
+    })
+    for radius in bands:
+        frame[f"sellers_within_{radius:g}km"] = index.count_within(lat, lng, radius)[customer_zip]
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seller-to-customer distances from zip-prefix centroids')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Folder containing the CSV files')
+    parser.add_argument('--bands', nargs='*', type=float, default=[50, 200, 1000],
+                        help='Radii (km) for counting nearby sellers')
+    args = parser.parse_args()
+
+    ds = Dataset(args.data_dir)
+    started = time.perf_counter()
+    centroids = ZipCentroids.cached(args.data_dir)
+    print(f"{len(centroids)} zip centroids from {int(centroids.rows.sum())} geolocation rows "
+          f"in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    distances = item_distances(ds, centroids)
+    print(f"Distances for {len(distances)} order items in {time.perf_counter() - started:.2f}s; "
+          f"median {distances['distance_km'].median():.0f} km, "
+          f"{distances['distance_km'].isna().mean() * 100:.1f}% without a centroid")
+
+    started = time.perf_counter()
+    nearest = nearest_sellers(ds, centroids, args.bands)
+    print(f"Nearest seller for {len(nearest)} customers in {time.perf_counter() - started:.2f}s; "
+          f"median {nearest['distance_km'].median():.0f} km")
+    for radius in args.bands:
+        column = f"sellers_within_{radius:g}km"
+        print(f"  customers with a seller within {radius:g} km: {(nearest[column] > 0).mean() * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""The SQL of python+sql_ecomerce.ipynb, one query per analytics.py metric.
+
+Written for MySQL as in the notebook, with the date functions swapped on
+SQLite. check_analytics.py compares these with analytics.py; summaries.py
+and report.py run them without importing pandas-based analytics code.
+"""
+from db import sql_functions
+
+
+def queries(db_dialect):
+    """metric name: (SQL, key columns to sort both sides by)."""
+    year, month, add_months = sql_functions(db_dialect)
+    ts = 'orders.order_purchase_timestamp'
+    return {
+        'customer_cities': ("SELECT DISTINCT customer_city FROM customers", ['customer_city']),
+        'orders_in_year': (f"SELECT COUNT(order_id) FROM orders WHERE {year(ts)} = 2017", None),
+        'sales_by_category': ("""
+            SELECT UPPER(products.product_category) category, ROUND(SUM(payments.payment_value), 2) sales
+            FROM products JOIN order_items ON products.product_id = order_items.product_id
+            JOIN payments ON payments.order_id = order_items.order_id
+            GROUP BY category""", ['category']),
+        'installment_percentage': ("""
+            SELECT 100.0 * SUM(CASE WHEN payment_installments >= 1 THEN 1 ELSE 0 END) / COUNT(*)
+            FROM payments""", None),
+        'customers_by_state': ("""
+            SELECT customer_state, COUNT(customer_id) FROM customers GROUP BY customer_state""", ['state']),
+        'orders_by_month': (f"""
+            SELECT {month(ts)} months, COUNT(order_id) order_count FROM orders
+            WHERE {year(ts)} = 2018 GROUP BY months""", ['months']),
+        'average_products_per_order_by_city': ("""
+            WITH count_per_order AS (
+                SELECT orders.order_id, orders.customer_id, COUNT(order_items.order_id) AS oc
+                FROM orders JOIN order_items ON orders.order_id = order_items.order_id
+                GROUP BY orders.order_id, orders.customer_id)
+            SELECT customers.customer_city, ROUND(AVG(count_per_order.oc), 2) average_orders
+            FROM customers JOIN count_per_order ON customers.customer_id = count_per_order.customer_id
+            GROUP BY customers.customer_city""", ['customer_city']),
+        'category_revenue_share': ("""
+            SELECT UPPER(products.product_category) category,
+            ROUND((SUM(payments.payment_value) / (SELECT SUM(payment_value) FROM payments)) * 100, 2)
+            FROM products JOIN order_items ON products.product_id = order_items.product_id
+            JOIN payments ON payments.order_id = order_items.order_id
+            GROUP BY category""", ['category']),
+        'purchases_and_price_by_category': ("""
+            SELECT products.product_category, COUNT(order_items.product_id), ROUND(AVG(order_items.price), 2)
+            FROM products JOIN order_items ON products.product_id = order_items.product_id
+            GROUP BY products.product_category""", ['category']),
+        # The notebook correlates the rows above with np.corrcoef (see prepare)
+        'price_purchase_correlation': ("""
+            SELECT COUNT(order_items.product_id), ROUND(AVG(order_items.price), 2)
+            FROM products JOIN order_items ON products.product_id = order_items.product_id
+            GROUP BY products.product_category""", None),
+        'seller_revenue_rank': ("""
+            SELECT *, DENSE_RANK() OVER (ORDER BY revenue DESC) AS rn FROM (
+                SELECT order_items.seller_id, ROUND(SUM(payments.payment_value), 2) revenue
+                FROM order_items JOIN payments ON order_items.order_id = payments.order_id
+                GROUP BY order_items.seller_id) AS a""", ['seller_id']),
+        'moving_average_order_value': (f"""
+            SELECT customer_id, order_purchase_timestamp, payment,
+            AVG(payment) OVER (PARTITION BY customer_id ORDER BY order_purchase_timestamp
+                               ROWS BETWEEN 2 PRECEDING AND CURRENT ROW) AS mov_avg
+            FROM (SELECT orders.customer_id, orders.order_purchase_timestamp, payments.payment_value AS payment
+                  FROM payments JOIN orders ON payments.order_id = orders.order_id) AS a""",
+                                       ['customer_id', 'order_purchase_timestamp']),
+        'cumulative_sales': (f"""
+            SELECT years, months, payment, SUM(payment) OVER (ORDER BY years, months) cumulative_sales FROM (
+                SELECT {year(ts)} AS years, {month(ts)} AS months, ROUND(SUM(payments.payment_value), 2) AS payment
+                FROM orders JOIN payments ON orders.order_id = payments.order_id
+                GROUP BY years, months) AS a""", ['years', 'months']),
+        'yoy_growth': (f"""
+            WITH a AS (
+                SELECT {year(ts)} AS years, ROUND(SUM(payments.payment_value), 2) AS payment
+                FROM orders JOIN payments ON orders.order_id = payments.order_id GROUP BY years)
+            SELECT years, ((payment - LAG(payment, 1) OVER (ORDER BY years)) /
+                           LAG(payment, 1) OVER (ORDER BY years)) * 100 FROM a""", ['years']),
+        # The notebook divides count(a) by count(b); this is the rate it describes
+        'retention_rate': (f"""
+            WITH a AS (
+                SELECT customers.customer_id, MIN({ts}) first_order
+                FROM customers JOIN orders ON customers.customer_id = orders.customer_id
+                GROUP BY customers.customer_id),
+            b AS (
+                SELECT a.customer_id, COUNT(DISTINCT {ts}) next_order
+                FROM a JOIN orders ON orders.customer_id = a.customer_id
+                AND {ts} > first_order AND {ts} < {add_months('first_order', 6)}
+                GROUP BY a.customer_id)
+            SELECT 100.0 * COUNT(DISTINCT b.customer_id) / COUNT(DISTINCT a.customer_id)
+            FROM a LEFT JOIN b ON a.customer_id = b.customer_id""", None),
+        'top_customers_by_year': (f"""
+            SELECT years, customer_id, payment, d_rank FROM (
+                SELECT {year(ts)} years, orders.customer_id, SUM(payments.payment_value) payment,
+                DENSE_RANK() OVER (PARTITION BY {year(ts)} ORDER BY SUM(payments.payment_value) DESC) d_rank
+                FROM orders JOIN payments ON payments.order_id = orders.order_id
+                GROUP BY {year(ts)}, orders.customer_id) AS a
+            WHERE d_rank <= 3""", ['years', 'customer_id']),
+    }
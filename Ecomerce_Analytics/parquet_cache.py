@@ -0,0 +1,170 @@
+"""Parquet copies of the CSV tables, so notebooks stop re-parsing text.
+
+Each table is converted once with the explicit dtypes from dataset.py and
+written under <data dir>/.parquet/<table>/:
+
+- categorical columns are dictionary-encoded, ids and numbers are stored
+  plainly in their compact types
+- tables with a natural filter column are hive-partitioned on it
+  (customers and geolocation by state)
+- a manifest records the source CSV's size and mtime and a hash of the
+  declared dtypes; if either changes the table is converted again
+
+Loads are memory-mapped and read only the requested columns:
+
+    from parquet_cache import load
+    products = load('products', columns=['product_id', 'product_category'])
+    sp_customers = load('customers', filters=[('customer_state', '=', 'SP')])
+
+    python parquet_cache.py            # convert whatever is stale
+    python parquet_cache.py --force    # convert everything
+    python parquet_cache.py --benchmark
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
+
+from dataset import DATES, DTYPES, TABLES, csv_path, read_csv
+from load_csv import DATA_DIR
+
+# Bump when the file layout changes
+FORMAT_VERSION = 1
+
+# Small tables (sellers) load faster as one file than split by state
+PARTITION_BY = {
+    'customers': ['customer_state'],
+    'geolocation': ['geolocation_state'],
+}
+
+# Large row groups keep per-group overhead low; filters still skip whole files
+ROW_GROUP_ROWS = 1000000
+
+MANIFEST = '_source.json'
+
+
+def cache_dir(data_dir=DATA_DIR):
+    return os.path.join(data_dir, '.parquet')
+
+
+def table_dir(table, data_dir=DATA_DIR):
+    return os.path.join(cache_dir(data_dir), table)
+
+
+def source_fingerprint(table, data_dir=DATA_DIR):
+    """What the cached copy was built from: CSV size/mtime plus the declared types."""
+    stat = os.stat(csv_path(table, data_dir))
+    declared = json.dumps([FORMAT_VERSION, DTYPES[table], DATES.get(table, []), PARTITION_BY.get(table)],
+                          sort_keys=True)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'schema': hashlib.sha1(declared.encode()).hexdigest()}
+
+
+def is_fresh(table, data_dir=DATA_DIR):
+    try:
+        with open(os.path.join(table_dir(table, data_dir), MANIFEST)) as f:
+            return json.load(f) == source_fingerprint(table, data_dir)
+    except (OSError, ValueError):
+        return False
+
+
+def convert(table, data_dir=DATA_DIR):
+    """Write table's Parquet copy; returns its directory.
+
+    Written to a temporary directory and swapped in, so readers never see a
+    half-written table.
+    """
+    fingerprint = source_fingerprint(table, data_dir)
+    frame = read_csv(table, data_dir)
+    if table in PARTITION_BY:
+        # One row group per partition file; scattered rows make many tiny ones
+        frame = frame.sort_values(PARTITION_BY[table], kind='stable')
+    arrow_table = pa.Table.from_pandas(frame, preserve_index=False)
+    categorical = [name for name, dtype in DTYPES[table].items() if dtype == 'category']
+
+    target = table_dir(table, data_dir)
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    options = {'use_dictionary': categorical, 'compression': 'snappy'}
+    if table in PARTITION_BY:
+        pq.write_to_dataset(arrow_table, staging, partition_cols=PARTITION_BY[table],
+                            min_rows_per_group=ROW_GROUP_ROWS, max_rows_per_group=ROW_GROUP_ROWS, **options)
+    else:
+        pq.write_table(arrow_table, os.path.join(staging, 'part-0.parquet'), row_group_size=ROW_GROUP_ROWS,
+                       **options)
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(fingerprint, f)
+
+    old = f"{target}.old-{os.getpid()}"
+    if os.path.exists(target):
+        os.rename(target, old)
+    os.rename(staging, target)
+    shutil.rmtree(old, ignore_errors=True)
+    return target
+
+
+def load(table, data_dir=DATA_DIR, columns=None, filters=None):
+    """Read table from its Parquet copy (converting it first if stale).
+
+    columns projects, filters prunes partitions and row groups; both are
+    passed to pyarrow.parquet.read_table.
+    """
+    if not is_fresh(table, data_dir):
+        convert(table, data_dir)
+    # Partition values come back categorical, like the rest of the categoricals
+    partitioning = pads.HivePartitioning.discover(infer_dictionary=True)
+    arrow_table = pq.read_table(table_dir(table, data_dir), columns=columns, filters=filters,
+                                memory_map=True, partitioning=partitioning)
+    return arrow_table.to_pandas()
+
+
+def convert_stale(tables=None, data_dir=DATA_DIR, force=False):
+    for table in tables or TABLES:
+        if not os.path.exists(csv_path(table, data_dir)):
+            print(f"Skipping {table}: CSV not found")
+            continue
+        if force or not is_fresh(table, data_dir):
+            started = time.perf_counter()
+            convert(table, data_dir)
+            print(f"Converted {table} in {time.perf_counter() - started:.2f}s")
+
+
+def benchmark(tables=None, data_dir=DATA_DIR):
+    """Compare a plain pd.read_csv (what the notebooks do) with a Parquet load."""
+    import pandas as pd
+
+    for table in tables or TABLES:
+        if not os.path.exists(csv_path(table, data_dir)):
+            continue
+        started = time.perf_counter()
+        raw = pd.read_csv(csv_path(table, data_dir))
+        csv_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        cached = load(table, data_dir)
+        parquet_seconds = time.perf_counter() - started
+        print(f"{table:<12} CSV {csv_seconds * 1000:7.1f} ms {raw.memory_usage(deep=True).sum() / 1e6:7.1f} MB   "
+              f"Parquet {parquet_seconds * 1000:6.1f} ms {cached.memory_usage(deep=True).sum() / 1e6:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the e-commerce CSVs to cached Parquet')
+    parser.add_argument('tables', nargs='*', help='Tables to convert (default: all)')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Folder containing the CSV files')
+    parser.add_argument('--force', action='store_true', help='Convert even if the cache is fresh')
+    parser.add_argument('--benchmark', action='store_true', help='Time CSV parsing against cached loads')
+    args = parser.parse_args()
+
+    convert_stale(args.tables, args.data_dir, args.force)
+    if args.benchmark:
+        benchmark(args.tables, args.data_dir)
+
+
+if __name__ == '__main__':
+    main()
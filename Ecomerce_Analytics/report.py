@@ -0,0 +1,257 @@
+"""Regenerate the python+sql_ecomerce.ipynb analysis as one HTML report.
+
+Each notebook query is a named job. Queries run concurrently over a small
+pool of connections (one per worker thread), charts are drawn in a process
+pool, and everything lands in <out>/report.html with a PNG per chart.
+
+Results are cached under <out>/.cache, keyed by the query text and the
+versions of the tables it reads: the load generation load_csv.py records
+each time it loads a table. A section whose key is unchanged is neither
+queried nor redrawn, so re-running after a load only redoes the sections
+that read the reloaded tables.
+
+    python report.py --url sqlite:///ecomerce.db
+    python report.py --url sqlite:///ecomerce.db --jobs sales_by_category cumulative_sales --force
+"""
+import argparse
+import glob
+import hashlib
+import html
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+from dataset import TABLES
+from db import DEFAULT_URL, connect, dialect, quote
+from load_csv import load_generations
+from notebook_queries import queries
+
+OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report')
+
+# Rows shown under each section; the cached result keeps them all
+TABLE_ROWS = 10
+
+# chart: (kind, x, y, extra) drawn from the first `top` rows, or None
+Job = namedtuple('Job', 'name title columns sort chart top')
+
+JOBS = [
+    Job('customer_cities', 'Distinct customer cities', ['customer_city'], None, None, None),
+    Job('orders_in_year', 'Orders placed in 2017', ['orders'], None, None, None),
+    Job('sales_by_category', 'Sales by category', ['category', 'sales'], ('sales', False),
+        ('barh', 'category', 'sales', None), 15),
+    Job('installment_percentage', 'Payments made in installments (%)', ['percentage'], None, None, None),
+    Job('customers_by_state', 'Count of customers by state', ['state', 'customer_count'],
+        ('customer_count', False), ('bar', 'state', 'customer_count', None), None),
+    Job('orders_by_month', 'Count of orders by month in 2018', ['months', 'order_count'], ('months', True),
+        ('bar', 'months', 'order_count', None), None),
+    Job('average_products_per_order_by_city', 'Average products per order by city',
+        ['customer_city', 'average_products'], ('average_products', False), None, None),
+    Job('category_revenue_share', 'Sales share by category (%)', ['category', 'sales_percentage'],
+        ('sales_percentage', False), ('barh', 'category', 'sales_percentage', None), 15),
+    Job('purchases_and_price_by_category', 'Items sold and average price by category',
+        ['category', 'order_count', 'price'], ('order_count', False), ('scatter', 'order_count', 'price', None),
+        None),
+    Job('seller_revenue_rank', 'Top sellers by revenue', ['seller_id', 'revenue', 'rank'], ('rank', True),
+        ('bar', 'seller_id', 'revenue', None), 5),
+    Job('moving_average_order_value', 'Moving average order value per customer',
+        ['customer_id', 'order_purchase_timestamp', 'payment', 'mov_avg'], None, None, None),
+    Job('cumulative_sales', 'Cumulative sales by month', ['years', 'months', 'payment', 'cumulative_sales'],
+        (['years', 'months'], True), ('line', 'months', 'cumulative_sales', None), None),
+    Job('yoy_growth', 'Year-over-year sales growth (%)', ['years', 'yoy_growth'], ('years', True), None, None),
+    Job('retention_rate', 'Customers ordering again within 6 months (%)', ['retention_rate'], None, None, None),
+    Job('top_customers_by_year', 'Top 3 customers by year', ['years', 'customer_id', 'payment', 'rank'],
+        (['years', 'rank'], True), ('bar', 'customer_id', 'payment', 'years'), None),
+]
+
+
+def tables_read(sql):
+    return sorted(table for table in TABLES if re.search(rf"\b{table}\b", sql))
+
+
+def table_versions(conn, url, tables):
+    """A value per table that changes when rows are loaded into it.
+
+    Tables load_csv.py has not recorded (a database loaded by older code)
+    fall back to row count plus the last rowid or update time, which misses
+    a reload of the same size. Rows changed outside load_csv.py are not
+    seen either; run with --force after editing tables by hand.
+    """
+    generations = load_generations(conn, url)
+    cursor = conn.cursor()
+    versions = {}
+    for table in tables:
+        if table in generations:
+            versions[table] = [generations[table]]
+            continue
+        if dialect(url) == 'sqlite':
+            cursor.execute(f"SELECT COUNT(*), MAX(rowid) FROM {quote(table)}")
+        else:
+            cursor.execute(f"SELECT (SELECT COUNT(*) FROM {quote(table)}), UPDATE_TIME FROM information_schema.TABLES "
+                           f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+        versions[table] = [str(value) for value in cursor.fetchone()]
+    return versions
+
+
+def cache_key(sql, versions):
+    text = '\n'.join([sql] + [f"{table}={versions[table]}" for table in tables_read(sql)])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class ConnectionPool:
+    """One connection per worker thread, opened on first use."""
+
+    def __init__(self, url):
+        self.url = url
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def cursor(self):
+        if not hasattr(self.local, 'conn'):
+            # Each connection is used by one thread; close() runs on the main one
+            options = {'check_same_thread': False} if dialect(self.url) == 'sqlite' else {}
+            self.local.conn = connect(self.url, **options)
+            with self.lock:
+                self.connections.append(self.local.conn)
+        return self.local.conn.cursor()
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+
+
+def run_query(pool, job, sql):
+    started = time.perf_counter()
+    cursor = pool.cursor()
+    cursor.execute(sql)
+    frame = pd.DataFrame(cursor.fetchall(), columns=job.columns)
+    if job.sort:
+        frame = frame.sort_values(job.sort[0], ascending=job.sort[1], kind='stable').reset_index(drop=True)
+    return frame, time.perf_counter() - started
+
+
+def render(job, frame, path):
+    """Draw job's chart to path (runs in a worker process)."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    kind, x, y, hue = job.chart
+    frame = frame.head(job.top) if job.top else frame
+    fig, ax = plt.subplots(figsize=(9, 4))
+    if kind == 'line':
+        labels = frame['years'].astype(str) + '-' + frame['months'].astype(str).str.zfill(2)
+        ax.plot(labels, frame[y].astype(float), marker='o')
+        ax.tick_params(axis='x', rotation=90)
+    elif kind == 'scatter':
+        ax.scatter(frame[x].astype(float), frame[y].astype(float))
+        ax.set_xlabel(x)
+    elif kind == 'barh':
+        ax.barh(frame[x].astype(str)[::-1], frame[y].astype(float)[::-1])
+    elif hue:
+        for value, group in frame.groupby(hue):
+            ax.bar(group[x].astype(str), group[y].astype(float), label=str(value))
+        ax.legend(title=hue)
+        ax.tick_params(axis='x', rotation=90)
+    else:
+        bars = ax.bar(frame[x].astype(str), frame[y].astype(float))
+        if len(frame) <= 12:
+            ax.bar_label(bars)
+        ax.tick_params(axis='x', rotation=90)
+    ax.set_ylabel(y)
+    ax.set_title(job.title)
+    fig.tight_layout()
+    fig.savefig(path, dpi=90)
+    plt.close(fig)
+    return path
+
+
+def write_html(sections, path):
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>E-commerce analytics</title>',
+             '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}'
+             'td,th{border:1px solid #ccc;padding:2px 8px}</style></head><body>',
+             '<h1>E-commerce analytics</h1>']
+    for job, frame, chart in sections:
+        parts.append(f"<h2>{html.escape(job.title)}</h2>")
+        if chart:
+            parts.append(f'<img src="{os.path.basename(chart)}" alt="{html.escape(job.title)}">')
+        parts.append(frame.head(TABLE_ROWS).to_html(index=False))
+        if len(frame) > TABLE_ROWS:
+            parts.append(f"<p>{len(frame)} rows</p>")
+    parts.append('</body></html>')
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        f.write('\n'.join(parts))
+    os.replace(f"{path}.tmp", path)
+
+
+def build(url, out_dir=OUT_DIR, names=None, workers=4, processes=None, force=False):
+    """Refresh the stale sections and rewrite the report; returns its path."""
+    started = time.perf_counter()
+    jobs = [job for job in JOBS if not names or job.name in names]
+    cache = os.path.join(out_dir, '.cache')
+    os.makedirs(cache, exist_ok=True)
+
+    sql = queries(dialect(url))
+    # Only the tables the selected queries read; the others need not exist
+    conn = connect(url)
+    versions = table_versions(conn, url, sorted({table for job in jobs for table in tables_read(sql[job.name][0])}))
+    conn.close()
+    keys = {job.name: cache_key(sql[job.name][0], versions) for job in jobs}
+
+    frames, stale = {}, []
+    for job in jobs:
+        cached = os.path.join(cache, f"{job.name}-{keys[job.name]}.pkl")
+        if not force and os.path.exists(cached):
+            frames[job.name] = pd.read_pickle(cached)
+        else:
+            stale.append(job)
+
+    pool = ConnectionPool(url)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {job.name: executor.submit(run_query, pool, job, sql[job.name][0]) for job in stale}
+            for job in stale:
+                frames[job.name], seconds = futures[job.name].result()
+                for old in glob.glob(os.path.join(cache, f"{job.name}-*.pkl")):
+                    os.remove(old)
+                frames[job.name].to_pickle(os.path.join(cache, f"{job.name}-{keys[job.name]}.pkl"))
+                print(f"ran    {job.name:<36} {seconds * 1000:8.1f} ms")
+    finally:
+        pool.close()
+
+    charts = {job.name: os.path.join(out_dir, f"{job.name}-{keys[job.name][:12]}.png") for job in jobs if job.chart}
+    redraw = [job for job in jobs if job.chart and (force or not os.path.exists(charts[job.name]))]
+    if redraw:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for job in redraw:
+                for old in glob.glob(os.path.join(out_dir, f"{job.name}-*.png")):
+                    os.remove(old)
+            list(executor.map(render, redraw, [frames[job.name] for job in redraw],
+                              [charts[job.name] for job in redraw]))
+
+    path = os.path.join(out_dir, 'report.html')
+    write_html([(job, frames[job.name], charts.get(job.name)) for job in jobs], path)
+    print(f"{len(stale)} of {len(jobs)} sections queried, {len(redraw)} charts drawn, "
+          f"report written to {path} in {time.perf_counter() - started:.2f}s")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regenerate the e-commerce analytics report')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Database loaded by load_csv.py')
+    parser.add_argument('--out', default=OUT_DIR, help='Folder for report.html and its charts')
+    parser.add_argument('--jobs', nargs='+', choices=[job.name for job in JOBS], help='Sections to include')
+    parser.add_argument('--workers', type=int, default=4, help='Database connections used at once')
+    parser.add_argument('--processes', type=int, default=None, help='Chart-drawing processes')
+    parser.add_argument('--force', action='store_true', help='Ignore the cache and redo every section')
+    args = parser.parse_args()
+    build(args.url, args.out, args.jobs, args.workers, args.processes, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""Infer compact column types for the e-commerce CSVs and declare their keys.
+
+Types come from a full pass over each file, read as text so nothing is lost
+to pandas' own guessing (zip prefixes keep their leading zeros):
+
+- 32-character hex ids become CHAR(32) (ASCII, binary collation on MySQL)
+- whole numbers become INT, or BIGINT if their range needs it
+- money-like decimals become DECIMAL, other numbers DOUBLE
+- 'YYYY-MM-DD HH:MM:SS' values become DATETIME
+- the closed domains in ENUM_COLUMNS become an ENUM on MySQL; other text
+  (cities, categories, zero-padded codes) becomes VARCHAR
+
+Later --append loads reuse these types, so they leave room to grow: VARCHAR
+and DECIMAL lengths get headroom over what the first load held, and only
+key columns are declared NOT NULL.
+
+Primary keys, foreign keys and the indexes python+sql_ecomerce.ipynb joins
+and groups on are declared below. Secondary indexes and MySQL foreign keys
+are added after the data is in (see finalize()), which is both faster and
+lets tables load in any order.
+"""
+from collections import namedtuple
+
+import pandas as pd
+
+from db import dialect, quote
+
+# Text columns whose values come from a fixed set (states, statuses, payment
+# types); only these may become ENUMs
+ENUM_COLUMNS = {'customer_state', 'seller_state', 'geolocation_state', 'order_status', 'payment_type'}
+# Above this many distinct values even those stay VARCHAR
+ENUM_MAX = 255
+# Decimals with more places than this are stored as DOUBLE
+DECIMAL_MAX_SCALE = 4
+# Extra integer digits for DECIMAL columns, and the factor (and minimum)
+# for VARCHAR lengths, over what the first load held
+DECIMAL_HEADROOM = 3
+VARCHAR_HEADROOM = 2
+VARCHAR_MIN = 16
+
+PRIMARY_KEYS = {
+    'customers': ('customer_id',),
+    'orders': ('order_id',),
+    'order_items': ('order_id', 'order_item_id'),
+    'payments': ('order_id', 'payment_sequential'),
+    'products': ('product_id',),
+    'sellers': ('seller_id',),
+}
+
+# table: [(column, parent table, parent column)]
+FOREIGN_KEYS = {
+    'orders': [('customer_id', 'customers', 'customer_id')],
+    'order_items': [('order_id', 'orders', 'order_id'),
+                    ('product_id', 'products', 'product_id'),
+                    ('seller_id', 'sellers', 'seller_id')],
+    'payments': [('order_id', 'orders', 'order_id')],
+}
+
+# Join, filter and group-by columns of the notebook queries that no primary
+# key already leads with
+INDEXES = {
+    'orders': [('customer_id', 'order_purchase_timestamp'), ('order_purchase_timestamp',)],
+    'order_items': [('product_id',), ('seller_id',)],
+    'customers': [('customer_state',), ('customer_city',), ('customer_zip_code_prefix',)],
+    'products': [('product_category',)],
+    'sellers': [('seller_zip_code_prefix',)],
+    'geolocation': [('geolocation_zip_code_prefix',)],
+}
+
+TableSchema = namedtuple('TableSchema', 'table columns primary_key')
+Column = namedtuple('Column', 'name kind length nullable low high scale precision values')
+
+
+class ColumnStats:
+    """Running facts about one text column, updated chunk by chunk."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.max_length = 0
+        self.hex_id = True
+        self.integer = True
+        self.leading_zero = False
+        self.decimal = True
+        self.number = True
+        self.datetime = True
+        self.date = True
+        self.low = None
+        self.high = None
+        self.scale = 0
+        self.int_digits = 1
+        self.values = set() if name in ENUM_COLUMNS else None
+
+    def update(self, series):
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+        self.count += len(values)
+        lengths = values.str.len()
+        self.max_length = max(self.max_length, lengths.max())
+
+        if self.hex_id:
+            self.hex_id = bool(values.str.fullmatch(r'[0-9a-f]{32}').all())
+        if self.integer:
+            self.integer = bool(values.str.fullmatch(r'-?\d+(\.0+)?').all())
+            self.leading_zero = self.leading_zero or bool(values.str.match(r'-?0\d').any())
+        if self.decimal:
+            self.decimal = bool(values.str.fullmatch(r'-?\d+(\.\d+)?').all())
+            if self.decimal:
+                digits = lengths - values.str.startswith('-')
+                point = values.str.find('.')
+                has_point = point >= 0
+                self.int_digits = max(self.int_digits, digits.where(~has_point, digits - (lengths - point)).max())
+                self.scale = max(self.scale, (lengths - point - 1).where(has_point, 0).max())
+        if self.number:
+            # Cheap shape check first; to_numeric on id or text columns is slow
+            self.number = bool(values.str.fullmatch(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?').all())
+            if self.number:
+                numbers = pd.to_numeric(values)
+                self.low = numbers.min() if self.low is None else min(self.low, numbers.min())
+                self.high = numbers.max() if self.high is None else max(self.high, numbers.max())
+        if self.datetime:
+            self.datetime = bool(values.str.fullmatch(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}').all())
+        if self.date:
+            self.date = bool(values.str.fullmatch(r'\d{4}-\d{2}-\d{2}').all())
+        if self.values is not None:
+            distinct = values.unique()
+            if len(distinct) > ENUM_MAX:
+                self.values = None
+            else:
+                self.values.update(distinct)
+                if len(self.values) > ENUM_MAX:
+                    self.values = None
+
+    def column(self):
+        nullable = self.nulls > 0
+        if self.count == 0:
+            return Column(self.name, 'text', 255, True, None, None, 0, 0, None)
+        if self.hex_id:
+            return Column(self.name, 'id', 32, nullable, None, None, 0, 0, None)
+        if self.integer and not self.leading_zero:
+            return Column(self.name, 'int', None, nullable, int(self.low), int(self.high), 0, 0, None)
+        if self.integer:
+            # Codes such as zip prefixes: keep them as text so "01001" stays "01001"
+            return Column(self.name, 'varchar', int(self.max_length), nullable, None, None, 0, 0, None)
+        if self.decimal and self.scale <= DECIMAL_MAX_SCALE:
+            scale = int(self.scale)
+            return Column(self.name, 'decimal', None, nullable, None, None, scale,
+                          int(self.int_digits) + DECIMAL_HEADROOM + scale, None)
+        if self.number:
+            return Column(self.name, 'double', None, nullable, None, None, 0, 0, None)
+        if self.datetime:
+            return Column(self.name, 'datetime', None, nullable, None, None, 0, 0, None)
+        if self.date:
+            return Column(self.name, 'date', None, nullable, None, None, 0, 0, None)
+        if self.values is not None:
+            return Column(self.name, 'enum', int(self.max_length), nullable, None, None, 0, 0,
+                          sorted(self.values))
+        return Column(self.name, 'varchar', int(self.max_length), nullable, None, None, 0, 0, None)
+
+
+def int_type(low, high):
+    if low >= -2**31 and high < 2**31:
+        return 'INT'
+    if low >= -2**63 and high < 2**63:
+        return 'BIGINT'
+    raise ValueError(f"Integer range {low}..{high} does not fit BIGINT")
+
+
+def sql_type(column, db_dialect):
+    """Column type DDL; SQLite gets the same names where its affinities agree."""
+    mysql = db_dialect == 'mysql'
+    if column.kind == 'id':
+        return 'CHAR(32) CHARACTER SET ascii COLLATE ascii_bin' if mysql else 'CHAR(32)'
+    if column.kind == 'int':
+        return int_type(column.low, column.high) if mysql else 'INTEGER'
+    if column.kind == 'decimal':
+        return f"DECIMAL({column.precision},{column.scale})"
+    if column.kind == 'double':
+        return 'DOUBLE'
+    if column.kind in ('datetime', 'date'):
+        return column.kind.upper()
+    if column.kind == 'enum' and mysql:
+        labels = ', '.join("'" + value.replace("'", "''") + "'" for value in column.values)
+        return f"ENUM({labels})"
+    length = max(column.length * VARCHAR_HEADROOM, VARCHAR_MIN)
+    if length > 1000:
+        return 'TEXT'
+    return f"VARCHAR({length})"
+
+
+def infer_table(path, table, chunksize=50000, clean=lambda name: name):
+    """Scan the whole CSV and return its TableSchema.
+
+    The declared primary key is kept only if the data is actually unique on it.
+    Only key columns are NOT NULL; later appends may leave any other column empty.
+    """
+    stats = None
+    key = PRIMARY_KEYS.get(table)
+    seen, unique = set(), key is not None
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str):
+        chunk.columns = [clean(col) for col in chunk.columns]
+        if stats is None:
+            stats = [ColumnStats(col) for col in chunk.columns]
+            unique = unique and all(col in chunk.columns for col in key)
+        for column_stats in stats:
+            column_stats.update(chunk[column_stats.name])
+        if unique:
+            before = len(seen)
+            seen.update(chunk[list(key)].itertuples(index=False, name=None))
+            unique = len(seen) == before + len(chunk)
+    columns = [column_stats.column() for column_stats in stats or []]
+    if unique and any(column.nullable for column in columns if column.name in key):
+        unique = False
+    keys = set(key if unique else ()) | {column for column, _, _ in FOREIGN_KEYS.get(table, [])}
+    columns = [column if column.name in keys else column._replace(nullable=True) for column in columns]
+    if key and not unique:
+        print(f"{table}: data is not unique on {', '.join(key)}; creating it without a primary key")
+    return TableSchema(table, columns, key if unique else None)
+
+
+def create_table_sql(schema, url):
+    db_dialect = dialect(url)
+    lines = [f"{quote(column.name)} {sql_type(column, db_dialect)}"
+             f"{'' if column.nullable else ' NOT NULL'}" for column in schema.columns]
+    if schema.primary_key:
+        lines.append(f"PRIMARY KEY ({', '.join(quote(col) for col in schema.primary_key)})")
+    if db_dialect == 'sqlite':
+        # SQLite cannot add them later; it only enforces them with PRAGMA foreign_keys=ON
+        for column, parent, parent_column in FOREIGN_KEYS.get(schema.table, []):
+            lines.append(f"FOREIGN KEY ({quote(column)}) REFERENCES {quote(parent)} ({quote(parent_column)})")
+    suffix = ' ENGINE=InnoDB DEFAULT CHARSET=utf8mb4' if db_dialect == 'mysql' else ''
+    return f"CREATE TABLE IF NOT EXISTS {quote(schema.table)} (\n    " + ',\n    '.join(lines) + f"\n){suffix}"
+
+
+def _exists(cursor, url, kind, table, name=None):
+    """Whether a table, index or constraint (kind) exists."""
+    if dialect(url) == 'sqlite':
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?",
+                       ('table' if kind == 'table' else 'index', name or table))
+    elif kind == 'table':
+        cursor.execute("SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() "
+                       "AND table_name = %s", (table,))
+    elif kind == 'index':
+        cursor.execute("SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                       "AND table_name = %s AND index_name = %s", (table, name))
+    else:
+        cursor.execute("SELECT 1 FROM information_schema.table_constraints WHERE table_schema = DATABASE() "
+                       "AND table_name = %s AND constraint_name = %s", (table, name))
+    return cursor.fetchone() is not None
+
+
+def finalize(conn, url, tables):
+    """Create the join indexes (and on MySQL the foreign keys) for loaded tables.
+
+    Safe to re-run; foreign keys the data violates are reported and skipped.
+    """
+    cursor = conn.cursor()
+    for table in tables:
+        for columns in INDEXES.get(table, []):
+            name = f"ix_{table}_{'_'.join(columns)}"
+            if not _exists(cursor, url, 'index', table, name):
+                cursor.execute(f"CREATE INDEX {quote(name)} ON {quote(table)} "
+                               f"({', '.join(quote(col) for col in columns)})")
+        if dialect(url) != 'mysql':
+            continue
+        for column, parent, parent_column in FOREIGN_KEYS.get(table, []):
+            name = f"fk_{table}_{column}"
+            if _exists(cursor, url, 'constraint', table, name) or not _exists(cursor, url, 'table', parent):
+                continue
+            try:
+                cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} FOREIGN KEY "
+                               f"({quote(column)}) REFERENCES {quote(parent)} ({quote(parent_column)})")
+            except Exception as e:
+                print(f"Skipping foreign key {name}: {e}")
+    conn.commit()
+    cursor.close()
@@ -0,0 +1,243 @@
+"""Materialized summaries for the dashboard queries.
+
+The category-sales, sales-share, seller-rank, monthly-orders and
+cumulative-sales queries in python+sql_ecomerce.ipynb each join products,
+order_items, payments and orders from scratch. This module keeps their
+results in small tables, with views on top that return what the notebook
+queries return:
+
+    v_category_sales        category, sales
+    v_category_sales_share  category, sales_percentage
+    v_seller_revenue_rank   seller_id, revenue, rn
+    v_monthly_orders        years, months, order_count
+    v_cumulative_sales      years, months, payment, cumulative_sales
+
+summary_orders holds one row per order with the payment total and the
+payment and item counts already folded in. A refresh compares those counts
+with the base tables, and only the orders that are new or got new payments
+are joined to their items and added to the summaries as deltas. If folded-in
+orders lost rows or got new items, the summaries are rebuilt.
+
+    python load_csv.py --url sqlite:///ecomerce.db
+    python summaries.py --url sqlite:///ecomerce.db            # build, or catch up
+    python load_csv.py --url sqlite:///ecomerce.db --append    # new orders/payments
+    python summaries.py --url sqlite:///ecomerce.db --check    # refresh, compare with the notebook SQL
+"""
+import argparse
+import sys
+import time
+
+from db import DEFAULT_URL, connect, dialect, sql_functions
+from notebook_queries import queries
+
+TABLES = {
+    'summary_orders': """
+        order_id CHAR(32) NOT NULL PRIMARY KEY,
+        years SMALLINT NOT NULL,
+        months TINYINT NOT NULL,
+        payment_total DECIMAL(14,2) NOT NULL,
+        payment_count INT NOT NULL,
+        item_count INT NOT NULL""",
+    # '' stands for the NULL category, which cannot be a key
+    'summary_category_sales': """
+        category VARCHAR(100) NOT NULL PRIMARY KEY,
+        sales DECIMAL(16,2) NOT NULL""",
+    'summary_seller_revenue': """
+        seller_id CHAR(32) NOT NULL PRIMARY KEY,
+        revenue DECIMAL(16,2) NOT NULL""",
+    'summary_monthly_sales': """
+        years SMALLINT NOT NULL,
+        months TINYINT NOT NULL,
+        order_count INT NOT NULL,
+        payment DECIMAL(16,2) NOT NULL,
+        payment_count INT NOT NULL,
+        PRIMARY KEY (years, months)""",
+}
+
+# The share is taken of the payments folded into summary_orders, i.e.
+# payments that belong to an order; the notebook divides by every payment
+VIEWS = {
+    'v_category_sales': """
+        SELECT NULLIF(category, '') AS category, ROUND(sales, 2) AS sales FROM summary_category_sales""",
+    'v_category_sales_share': """
+        SELECT NULLIF(category, '') AS category,
+        ROUND(sales / (SELECT SUM(payment) FROM summary_monthly_sales) * 100, 2) AS sales_percentage
+        FROM summary_category_sales""",
+    'v_seller_revenue_rank': """
+        SELECT seller_id, ROUND(revenue, 2) AS revenue, DENSE_RANK() OVER (ORDER BY ROUND(revenue, 2) DESC) AS rn
+        FROM summary_seller_revenue""",
+    'v_monthly_orders': """
+        SELECT years, months, order_count FROM summary_monthly_sales""",
+    'v_cumulative_sales': """
+        SELECT years, months, ROUND(payment, 2) AS payment,
+        SUM(ROUND(payment, 2)) OVER (ORDER BY years, months) AS cumulative_sales
+        FROM summary_monthly_sales WHERE payment_count > 0""",
+}
+
+# View: (notebook query in notebook_queries.queries, key columns), for --check
+CHECKS = {
+    'v_category_sales': ('sales_by_category', 1),
+    'v_category_sales_share': ('category_revenue_share', 1),
+    'v_seller_revenue_rank': ('seller_revenue_rank', 1),
+    'v_cumulative_sales': ('cumulative_sales', 2),
+}
+
+# Orders whose payments or items differ from what summary_orders has folded in
+CHANGED_ORDERS = """
+    SELECT o.order_id, {year} AS years, {month} AS months,
+    COALESCE(p.total, 0) AS payment_total, COALESCE(p.n, 0) AS payment_count, COALESCE(i.n, 0) AS item_count,
+    COALESCE(p.total, 0) - COALESCE(s.payment_total, 0) AS delta_total,
+    COALESCE(p.n, 0) - COALESCE(s.payment_count, 0) AS delta_payments,
+    CASE WHEN s.order_id IS NULL THEN 1 ELSE 0 END AS is_new,
+    CASE WHEN s.order_id IS NOT NULL AND (s.item_count <> COALESCE(i.n, 0)
+                                          OR s.payment_count > COALESCE(p.n, 0)) THEN 1 ELSE 0 END AS is_stale
+    FROM orders o
+    LEFT JOIN (SELECT order_id, SUM(payment_value) AS total, COUNT(*) AS n FROM payments GROUP BY order_id) p
+        ON p.order_id = o.order_id
+    LEFT JOIN (SELECT order_id, COUNT(*) AS n FROM order_items GROUP BY order_id) i ON i.order_id = o.order_id
+    LEFT JOIN summary_orders s ON s.order_id = o.order_id
+    WHERE s.order_id IS NULL OR s.payment_count <> COALESCE(p.n, 0) OR s.item_count <> COALESCE(i.n, 0)"""
+
+SNAPSHOT_COLUMNS = 'order_id, years, months, payment_total, payment_count, item_count'
+DELTA_COLUMNS = f"{SNAPSHOT_COLUMNS}, delta_total, delta_payments, is_new, is_stale"
+
+
+def _add(db_dialect, table, keys, values, select):
+    """INSERT the select's rows into table, adding values onto existing keys."""
+    columns = ', '.join(keys + values)
+    if db_dialect == 'mysql':
+        updates = ', '.join(f"{value} = {table}.{value} + new.{value}" for value in values)
+        return f"INSERT INTO {table} ({columns}) SELECT * FROM ({select}) AS new ON DUPLICATE KEY UPDATE {updates}"
+    updates = ', '.join(f"{value} = {table}.{value} + excluded.{value}" for value in values)
+    # WHERE true keeps SQLite from reading ON CONFLICT as a join constraint
+    return f"INSERT INTO {table} ({columns}) SELECT * FROM ({select}) WHERE true " \
+           f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+
+
+def create(conn, url):
+    cursor = conn.cursor()
+    for table, columns in TABLES.items():
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+    for view, select in VIEWS.items():
+        cursor.execute(f"DROP VIEW IF EXISTS {view}")
+        cursor.execute(f"CREATE VIEW {view} AS {select}")
+    conn.commit()
+
+
+def clear(conn):
+    cursor = conn.cursor()
+    for table in TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+    conn.commit()
+
+
+def refresh(conn, url):
+    """Fold new orders and payments into the summaries; returns the orders touched."""
+    db_dialect = dialect(url)
+    year, month, _ = sql_functions(db_dialect)
+    # Plain DROP TABLE would commit the open transaction on MySQL
+    drop_delta = f"DROP {'TEMPORARY ' if db_dialect == 'mysql' else ''}TABLE IF EXISTS summary_delta"
+    cursor = conn.cursor()
+    cursor.execute(drop_delta)
+    cursor.execute("""CREATE TEMPORARY TABLE summary_delta (
+        order_id CHAR(32) NOT NULL PRIMARY KEY, years SMALLINT NOT NULL, months TINYINT NOT NULL,
+        payment_total DECIMAL(14,2) NOT NULL, payment_count INT NOT NULL, item_count INT NOT NULL,
+        delta_total DECIMAL(14,2) NOT NULL, delta_payments INT NOT NULL,
+        is_new TINYINT NOT NULL, is_stale TINYINT NOT NULL)""")
+    ts = 'o.order_purchase_timestamp'
+    cursor.execute(f"INSERT INTO summary_delta ({DELTA_COLUMNS}) "
+                   + CHANGED_ORDERS.format(year=year(ts), month=month(ts)))
+
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(is_stale), 0) FROM summary_delta")
+    changed, stale = (int(value) for value in cursor.fetchone())
+    cursor.execute("SELECT COUNT(*) FROM summary_orders s LEFT JOIN orders o ON o.order_id = s.order_id "
+                   "WHERE o.order_id IS NULL")
+    removed = int(cursor.fetchone()[0])
+    if stale or removed:
+        # A folded-in order's old items are gone, so its old contribution is unknown
+        print(f"{stale + removed} summarized orders changed underneath; rebuilding")
+        cursor.execute(drop_delta)
+        conn.commit()
+        clear(conn)
+        return refresh(conn, url)
+
+    if changed:
+        cursor.execute(_add(db_dialect, 'summary_category_sales', ['category'], ['sales'], """
+            SELECT COALESCE(UPPER(p.product_category), '') AS category, SUM(d.delta_total) AS sales
+            FROM summary_delta d JOIN order_items i ON i.order_id = d.order_id
+            JOIN products p ON p.product_id = i.product_id
+            WHERE d.payment_count > 0
+            GROUP BY COALESCE(UPPER(p.product_category), '')"""))
+        cursor.execute(_add(db_dialect, 'summary_seller_revenue', ['seller_id'], ['revenue'], """
+            SELECT i.seller_id, SUM(d.delta_total) AS revenue
+            FROM summary_delta d JOIN order_items i ON i.order_id = d.order_id
+            WHERE d.payment_count > 0
+            GROUP BY i.seller_id"""))
+        cursor.execute(_add(db_dialect, 'summary_monthly_sales', ['years', 'months'],
+                            ['order_count', 'payment', 'payment_count'], """
+            SELECT years, months, SUM(is_new) AS order_count, SUM(delta_total) AS payment,
+            SUM(delta_payments) AS payment_count
+            FROM summary_delta GROUP BY years, months"""))
+        cursor.execute(f"REPLACE INTO summary_orders ({SNAPSHOT_COLUMNS}) SELECT {SNAPSHOT_COLUMNS} FROM summary_delta")
+    cursor.execute(drop_delta)
+    conn.commit()
+    return changed
+
+
+def check(conn, url):
+    """Compare each view with the notebook query it replaces; returns the mismatches."""
+    notebook = queries(dialect(url))
+    cursor = conn.cursor()
+    failures = 0
+    for view, (name, keys) in CHECKS.items():
+        started = time.perf_counter()
+        cursor.execute(notebook[name][0])
+        expected = sorted(cursor.fetchall(), key=lambda row: [str(value) for value in row[:keys]])
+        query_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        cursor.execute(f"SELECT * FROM {view}")
+        actual = sorted(cursor.fetchall(), key=lambda row: [str(value) for value in row[:keys]])
+        view_seconds = time.perf_counter() - started
+
+        problem = None
+        if len(expected) != len(actual):
+            problem = f"{len(expected)} query rows != {len(actual)} view rows"
+        for left, right in zip(expected, actual):
+            if problem:
+                break
+            for a, b in zip(left, right):
+                # Sums rounded to cents may land either side of a half cent
+                differs = abs(float(a) - float(b)) > 0.0101 if isinstance(a, (int, float)) or \
+                    type(a).__name__ == 'Decimal' else str(a) != str(b)
+                if differs:
+                    problem = f"query row {left!r} != view row {right!r}"
+                    break
+        failures += problem is not None
+        print(f"{'FAIL' if problem else 'ok  '} {view:<24} query {query_seconds * 1000:8.1f} ms   "
+              f"view {view_seconds * 1000:6.1f} ms" + (f"   {problem}" if problem else ''))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or refresh the dashboard summary tables')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Database loaded by load_csv.py')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute the summaries from scratch')
+    parser.add_argument('--check', action='store_true', help='Compare the views with the notebook SQL')
+    args = parser.parse_args()
+
+    conn = connect(args.url)
+    create(conn, args.url)
+    if args.rebuild:
+        clear(conn)
+    started = time.perf_counter()
+    changed = refresh(conn, args.url)
+    print(f"Folded {changed} changed orders into the summaries in {time.perf_counter() - started:.2f}s")
+    failures = check(conn, args.url) if args.check else 0
+    conn.close()
+    if failures:
+        print(f"{failures} views differ from the notebook SQL")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Khmer word segmentation as a cached, parallel preprocessing stage.
+
+The notebook segments every row twice (LSTM and CRF), one text at a time in
+a single process, on every run. Here each text is segmented once per model:
+results live in an SQLite cache keyed by the text's SHA-1 and the model
+name, so a re-run only segments rows that are new or whose text changed.
+Misses are sent in batches to a process pool, where each worker loads
+KhmerWordSegmentor (from the KhmerNLP checkout the notebook clones) once.
+
+    from segment import segment_frame
+    data = segment_frame(pd.read_csv('kh_sentiment_data.csv'))
+
+    python segment.py kh_sentiment_data.csv -o kh_sentiment_data_segmented.csv
+    python segment.py kh_sentiment_data.csv --seed "kh_sentiment_data_segmented .csv"
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kh_segmentation_cache.sqlite')
+
+MODELS = ('lstm', 'crf')
+
+# Texts per task sent to a worker; large enough to hide the pickling overhead
+BATCH_SIZE = 64
+
+# SQLite caps the number of ? placeholders in one statement
+LOOKUP_CHUNK = 900
+
+_segmentor = None
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def open_cache(path=CACHE_PATH):
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("""CREATE TABLE IF NOT EXISTS segments (
+        text_sha1 CHAR(40) NOT NULL, model VARCHAR(16) NOT NULL, segmented TEXT NOT NULL,
+        PRIMARY KEY (text_sha1, model))""")
+    return conn
+
+
+def cached(conn, keys, model):
+    """{text key: segmented text} for the keys already in the cache."""
+    found = {}
+    keys = list(keys)
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[start:start + LOOKUP_CHUNK]
+        found.update(conn.execute(
+            f"SELECT text_sha1, segmented FROM segments WHERE model = ? AND text_sha1 IN "
+            f"({', '.join('?' * len(chunk))})", [model] + chunk))
+    return found
+
+
+def store(conn, model, results):
+    conn.executemany("INSERT OR REPLACE INTO segments (text_sha1, model, segmented) VALUES (?, ?, ?)",
+                     [(key, model, segmented) for key, segmented in results])
+    conn.commit()
+
+
+def _init_worker():
+    global _segmentor
+    from khmerwordsegmentor import KhmerWordSegmentor
+    _segmentor = KhmerWordSegmentor()
+
+
+def _segment_batch(model, batch):
+    """[(key, text)] -> [(key, segmented)]; texts that fail are left out, so they are retried."""
+    results = []
+    for key, text in batch:
+        try:
+            results.append((key, _segmentor.segment(text, model=model)))
+        except Exception as e:
+            print(f"Error during segmentation: {e}")
+    return results
+
+
+def segment_texts(texts, model='lstm', cache_path=CACHE_PATH, workers=None, batch_size=BATCH_SIZE):
+    """Segmented text for each of texts ('' for missing or failed ones), in order."""
+    texts = ['' if pd.isna(text) else str(text) for text in texts]
+    keys = [text_key(text) for text in texts]
+    conn = open_cache(cache_path)
+    try:
+        segmented = cached(conn, set(keys), model)
+        pending = list({key: text for key, text in zip(keys, texts) if text and key not in segmented}.items())
+        if pending:
+            batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                futures = [executor.submit(_segment_batch, model, batch) for batch in batches]
+                for future in as_completed(futures):
+                    results = future.result()
+                    # Commit as batches finish, so an interrupted run keeps its progress
+                    store(conn, model, results)
+                    segmented.update(results)
+    finally:
+        conn.close()
+    return [segmented.get(key, '') for key in keys]
+
+
+def segment_frame(data, models=MODELS, column='Text', cache_path=CACHE_PATH, workers=None,
+                  batch_size=BATCH_SIZE):
+    """Copy of data with a seg_text_<model> column per model, as the notebook builds."""
+    data = data.copy()
+    for model in models:
+        data[f"seg_text_{model}"] = segment_texts(data[column], model, cache_path, workers, batch_size)
+    return data
+
+
+def seed(path, models=MODELS, column='Text', cache_path=CACHE_PATH):
+    """Load an already segmented CSV (seg_text_<model> columns) into the cache."""
+    data = pd.read_csv(path)
+    conn = open_cache(cache_path)
+    try:
+        for model in models:
+            if f"seg_text_{model}" not in data:
+                continue
+            rows = data[[column, f"seg_text_{model}"]].dropna()
+            store(conn, model, zip(map(text_key, rows[column].astype(str)), rows[f"seg_text_{model}"]))
+            print(f"Seeded {len(rows)} {model} segmentations from {path}")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Segment Khmer text with a persistent cache')
+    parser.add_argument('input', help='CSV with a Text column')
+    parser.add_argument('-o', '--output', help='Where to write the segmented CSV')
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=MODELS)
+    parser.add_argument('--column', default='Text', help='Column holding the raw text')
+    parser.add_argument('--cache', default=CACHE_PATH, help='SQLite cache of segmented texts')
+    parser.add_argument('--workers', type=int, default=None, help='Segmentation processes')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Texts per worker task')
+    parser.add_argument('--seed', help='Segmented CSV to load into the cache first')
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed, args.models, args.column, args.cache)
+    started = time.perf_counter()
+    data = segment_frame(pd.read_csv(args.input), args.models, args.column, args.cache, args.workers,
+                         args.batch_size)
+    print(f"Segmented {len(data)} rows with {', '.join(args.models)} in {time.perf_counter() - started:.2f}s")
+    if args.output:
+        data.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Pre-tokenized XLM-R inputs with per-batch padding and length bucketing.
+
+The notebook's CustomDataset calls the tokenizer in __getitem__, so every
+text is tokenized again every epoch, and pads every example to 128 tokens
+although most reviews are a fraction of that. Here:
+
+- the corpus is tokenized once, in one batch call to the fast (Rust)
+  tokenizer, and the ids are stored flat in a memory-mapped int32 array
+  with an offsets array (XLM-R's vocabulary does not fit in 16 bits)
+- PadCollator pads each batch only to its longest member
+- LengthBucketSampler batches texts of similar length together, so that
+  longest member is close to the rest
+
+The arrays are cached in the given directory with a manifest of the tokenizer,
+max_length and a hash of the texts and labels; a change to any rebuilds them.
+
+    tokenizer = AutoTokenizer.from_pretrained('xlm-roberta-base')   # fast tokenizer
+    train_dataset = PreTokenizedDataset.build(train_data['seg_text_lstm'], train_data['Sentiment_label'],
+                                              tokenizer, 'tokenized/train', max_length=128)
+    train_data_loader = DataLoader(train_dataset, collate_fn=PadCollator(tokenizer.pad_token_id),
+                                   batch_sampler=LengthBucketSampler(train_dataset.lengths, 16, shuffle=True))
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset, Sampler
+
+MANIFEST = 'manifest.json'
+
+# Tokenizer call size; bounds memory while keeping the Rust tokenizer busy
+TOKENIZE_BATCH = 4096
+
+
+def _fingerprint(texts, labels, tokenizer, max_length):
+    digest = hashlib.sha1()
+    for text, label in zip(texts, labels):
+        digest.update(f"{text}\x00{label}\x01".encode('utf-8'))
+    return {'tokenizer': tokenizer.name_or_path, 'vocab_size': len(tokenizer), 'max_length': max_length,
+            'rows': len(texts), 'data': digest.hexdigest()}
+
+
+class PreTokenizedDataset(Dataset):
+    """Token ids and labels read from memory-mapped arrays in path."""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.labels = np.load(os.path.join(path, 'labels.npy'))
+        self.lengths = np.diff(self.offsets)
+
+    @classmethod
+    def build(cls, texts, labels, tokenizer, path, max_length=128):
+        """Tokenize texts into path (unless it already holds them) and open the result."""
+        if not tokenizer.is_fast:
+            raise ValueError('Use a fast tokenizer, e.g. AutoTokenizer.from_pretrained(name)')
+        texts = ['' if text is None or text != text else str(text) for text in texts]
+        labels = [int(label) for label in labels]
+        fingerprint = _fingerprint(texts, labels, tokenizer, max_length)
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                if json.load(f) == fingerprint:
+                    return cls(path)
+        except (OSError, ValueError):
+            pass
+
+        os.makedirs(path, exist_ok=True)
+        chunks, lengths = [], []
+        for start in range(0, len(texts), TOKENIZE_BATCH):
+            encoded = tokenizer(texts[start:start + TOKENIZE_BATCH], truncation=True, max_length=max_length,
+                                padding=False, return_attention_mask=False)['input_ids']
+            chunks.extend(np.asarray(ids, dtype='int32') for ids in encoded)
+            lengths.extend(len(ids) for ids in encoded)
+        offsets = np.zeros(len(texts) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.lib.format.open_memmap(os.path.join(path, 'ids.npy'), mode='w+', dtype='int32',
+                                        shape=(int(offsets[-1]),))
+        if len(ids):
+            ids[:] = np.concatenate(chunks)
+        ids.flush()
+        del ids
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'labels.npy'), np.asarray(labels, dtype='int64'))
+        with open(os.path.join(path, MANIFEST), 'w') as f:
+            json.dump(fingerprint, f)
+        return cls(path)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        input_ids = torch.from_numpy(np.array(self.ids[self.offsets[idx]:self.offsets[idx + 1]], dtype='int64'))
+        return {
+            'input_ids': input_ids,
+            'attention_mask': torch.ones_like(input_ids),
+            'label': torch.tensor(self.labels[idx], dtype=torch.long),
+        }
+
+
+class PadCollator:
+    """Stack items into a batch padded to its longest member (same keys as the items)."""
+
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, items):
+        longest = max(len(item['input_ids']) for item in items)
+        input_ids = torch.full((len(items), longest), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(items), longest), dtype=torch.long)
+        for row, item in enumerate(items):
+            input_ids[row, :len(item['input_ids'])] = item['input_ids']
+            attention_mask[row, :len(item['input_ids'])] = 1
+        return {'input_ids': input_ids, 'attention_mask': attention_mask,
+                'label': torch.stack([item['label'] for item in items])}
+
+
+class LengthBucketSampler(Sampler):
+    """Batches of indices with similar lengths (pass as DataLoader's batch_sampler).
+
+    With shuffle, indices are shuffled, cut into pools of bucket_batches
+    batches, each pool sorted by length and cut into batches, and the
+    batches shuffled again, so batches stay random but tightly padded; each
+    pass uses a new seed. Without shuffle, batches simply follow length order.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=False, bucket_batches=50, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_batches
+        self.seed = seed
+        self.epoch = 0
+
+    def _batches(self):
+        if not self.shuffle:
+            order = np.argsort(self.lengths, kind='stable')
+            return [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+        order = rng.permutation(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            pool = order[start:start + self.bucket_size]
+            pool = pool[np.argsort(self.lengths[pool], kind='stable')]
+            batches.extend(pool[offset:offset + self.batch_size] for offset in range(0, len(pool), self.batch_size))
+        rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        for batch in self._batches():
+            yield batch.tolist()
+
+    def __len__(self):
+        if not self.shuffle:
+            return -(-len(self.lengths) // self.batch_size)
+        full, rest = divmod(len(self.lengths), self.bucket_size)
+        return full * -(-self.bucket_size // self.batch_size) + -(-rest // self.batch_size)